@@ -0,0 +1,287 @@
+"""Admission control: shed excess load before it queues on the event loop.
+
+A pod limited to a fraction of a CPU serves a few hundred requests a second.
+Past that, requests pile up inside the process, every one of them waits
+behind all the others, and latency grows until probes time out. This
+middleware turns the excess away at the door with a small 429/503
+carrying Retry-After, so what is admitted stays fast:
+
+  1. event loop lag over a bound -> 503  (ADMISSION_MAX_LAG)
+  2. per-client token bucket     -> 429  (ADMISSION_CLIENT_RATE / _BURST)
+  3. global token bucket         -> 503  (ADMISSION_RATE / _BURST)
+  4. cap on requests in flight   -> 503  (ADMISSION_MAX_INFLIGHT)
+  5. concurrency limit for expensive routes (collections, per-school lists,
+     bulk writes, /export and /import), with a short bounded wait -> 503
+     (ADMISSION_EXPENSIVE_CONCURRENCY, _QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
+The lag check matters most for the memory backend. Its handlers run inline and
+finish one at a time, so the backlog is never in flight inside the app; it
+waits unread in socket buffers. A loop that wakes up late is how that backlog
+shows. While it lasts, requests are answered with a 503 costing a fraction of
+a real one, so the backlog drains at many times the normal rate.
+
+/health, /metrics and /replication/* bypass all of it: probes and scrapes are
+answered ahead of real traffic and never rejected. Clients are told apart by
+their address, or by ADMISSION_CLIENT_HEADER (first value, e.g.
+x-forwarded-for behind a proxy). Every limit is off when 0 (the default);
+k8s/deployment.yaml sets values sized for the 200m CPU limit.
+
+Everything runs on the event loop thread, so no locking is needed.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import time
+
+# Served whatever the load
+EXEMPT_PATHS = ('/health', '/metrics', '/replication/')
+# Long-lived streams hold no in-flight slot: they would use up the cap while idle
+STREAM_PATHS = ('/changes',)
+
+# Idle clients are forgotten once this many buckets are tracked
+MAX_CLIENTS = 10000
+
+# How often the event loop lag is sampled, seconds, and how many samples must all be over the bound
+LAG_INTERVAL = 0.05
+LAG_WINDOW = 4
+
+OVERLOAD = 'overload'
+CLIENT_RATE = 'client_rate'
+GLOBAL_RATE = 'global_rate'
+INFLIGHT = 'inflight'
+EXPENSIVE = 'expensive'
+
+rejected: Dict[str, int] = {OVERLOAD: 0, CLIENT_RATE: 0, GLOBAL_RATE: 0, INFLIGHT: 0, EXPENSIVE: 0}
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> float:
+        return min(self.burst, self.tokens + (now - self.updated) * self.rate)
+
+    def take(self, now: float) -> float:
+        """0 when a token was taken, otherwise the seconds until one is available"""
+        tokens = self._refill(now)
+        self.updated = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return 0.0
+        self.tokens = tokens
+        return (1 - tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        return self._refill(now) >= self.burst
+
+
+class ClientBuckets:
+    """One bucket per client; a full bucket carries no state, so idle ones can be dropped"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def take(self, client: str, now: float) -> float:
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self._prune(now)
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst, now)
+        return bucket.take(now)
+
+    def _prune(self, now: float) -> None:
+        self.buckets = {client: bucket for client, bucket in self.buckets.items() if not bucket.full(now)}
+        if len(self.buckets) >= self.max_clients:
+            # Every client is active: forget the oldest half rather than grow without bound
+            self.buckets = dict(list(self.buckets.items())[len(self.buckets) // 2:])
+
+
+class ConcurrencyLimit:
+    """At most `limit` at once; up to `queue` more wait up to `timeout` seconds for a slot"""
+
+    def __init__(self, limit: int, queue: int, timeout: float):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        if self._semaphore is None:
+            # Created on first use, inside the server's event loop
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return True
+        if self.waiting >= self.queue or self.timeout <= 0:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+class LagMonitor:
+    """Samples how late the event loop runs a LAG_INTERVAL sleep.
+
+    lag is the smallest of the last LAG_WINDOW samples: one slow request (a bulk insert) or a
+    CPU quota pause delays a single sample, a backlog delays all of them.
+    """
+
+    def __init__(self):
+        self.lag = 0.0
+        self._samples: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        # Started by the first request, inside the server's event loop
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self._samples.append(loop.time() - started - LAG_INTERVAL)
+            self.lag = min(self._samples)
+
+
+def expensive(method: str, path: str) -> bool:
+    """Whole collections, a school's student list, bulk writes, export and import"""
+    parts = path.strip('/').split('/')
+    if (len(parts) >= 2 and parts[1] == 'bulk') or (len(parts) == 1 and parts[0] in ('export', 'import')):
+        return True
+    if method not in ('GET', 'HEAD'):
+        return False
+    return (len(parts) == 1 and parts[0] in ('schools', 'students')) or (
+        len(parts) == 3 and parts[0] == 'schools' and parts[2] == 'students')
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> Tuple[dict, dict]:
+    body = json.dumps({'detail': detail}).encode()
+    start = {'type': 'http.response.start', 'status': status_code, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+        (b'retry-after', str(max(1, math.ceil(retry_after))).encode()),
+    ]}
+    return start, {'type': 'http.response.body', 'body': body}
+
+
+class AdmissionMiddleware:
+    """Plain ASGI middleware: token buckets, in-flight cap and expensive-route concurrency limit"""
+
+    def __init__(self, app):
+        self.app = app
+        self.max_lag = config['max_lag']
+        self.lag_monitor = lag_monitor
+        self.client_buckets = (ClientBuckets(config['client_rate'], config['client_burst'])
+                               if config['client_rate'] else None)
+        self.bucket = (TokenBucket(config['rate'], config['burst'], time.monotonic())
+                       if config['rate'] else None)
+        self.max_inflight = config['max_inflight']
+        self.expensive_limit = (ConcurrencyLimit(config['expensive_concurrency'], config['expensive_queue'],
+                                                 config['queue_timeout'])
+                                if config['expensive_concurrency'] else None)
+        self.client_header = config['client_header']
+        self.inflight = 0
+
+    def _client(self, scope) -> str:
+        if self.client_header:
+            for name, value in scope['headers']:
+                if name == self.client_header:
+                    return value.split(b',', 1)[0].strip().decode('latin-1')
+        client = scope.get('client')
+        return client[0] if client else ''
+
+    async def _reject(self, send, reason: str, status_code: int, detail: str, retry_after: float) -> None:
+        rejected[reason] += 1
+        for message in _rejection(status_code, detail, retry_after):
+            await send(message)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+        if self.lag_monitor is not None:
+            self.lag_monitor.start()
+            if self.lag_monitor.lag > self.max_lag:
+                await self._reject(send, OVERLOAD, 503, "Server is overloaded", 1)
+                return
+        now = time.monotonic()
+        if self.client_buckets is not None:
+            wait = self.client_buckets.take(self._client(scope), now)
+            if wait:
+                await self._reject(send, CLIENT_RATE, 429, "Too many requests from this client", wait)
+                return
+        if self.bucket is not None:
+            wait = self.bucket.take(now)
+            if wait:
+                await self._reject(send, GLOBAL_RATE, 503, "Server is over its request rate", wait)
+                return
+        if scope['path'].startswith(STREAM_PATHS):
+            await self.app(scope, receive, send)
+            return
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            await self._reject(send, INFLIGHT, 503, "Server is busy", 1)
+            return
+        limit = self.expensive_limit if self.expensive_limit and expensive(scope['method'], scope['path']) else None
+        self.inflight += 1
+        try:
+            if limit is not None and not await limit.acquire():
+                await self._reject(send, EXPENSIVE, 503, "Too many expensive requests in progress", 1)
+                return
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                if limit is not None:
+                    limit.release()
+        finally:
+            self.inflight -= 1
+
+
+def _number(name: str, default: str = '0') -> float:
+    value = float(os.getenv(name) or default)
+    if value < 0:
+        raise ValueError(f"{name} must not be negative, got {value}")
+    return value
+
+
+def from_env() -> dict:
+    rate = _number('ADMISSION_RATE')
+    client_rate = _number('ADMISSION_CLIENT_RATE')
+    return {
+        'max_lag': _number('ADMISSION_MAX_LAG'),
+        'rate': rate,
+        # A burst of at least one request, or the bucket could never admit anything
+        'burst': max(1.0, _number('ADMISSION_BURST', str(rate))),
+        'client_rate': client_rate,
+        'client_burst': max(1.0, _number('ADMISSION_CLIENT_BURST', str(client_rate))),
+        'client_header': os.getenv('ADMISSION_CLIENT_HEADER', '').lower().encode('latin-1'),
+        'max_inflight': int(_number('ADMISSION_MAX_INFLIGHT')),
+        'expensive_concurrency': int(_number('ADMISSION_EXPENSIVE_CONCURRENCY')),
+        'expensive_queue': int(_number('ADMISSION_EXPENSIVE_QUEUE', '16')),
+        'queue_timeout': _number('ADMISSION_QUEUE_TIMEOUT', '0.5'),
+    }
+
+
+config = from_env()
+lag_monitor: Optional[LagMonitor] = LagMonitor() if config['max_lag'] else None
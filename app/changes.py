@@ -0,0 +1,189 @@
+"""Change feed behind GET /changes (Server-Sent Events).
+
+Every repository write is turned into one SSE frame as it happens, encoded
+once and kept in a bounded ring buffer (the frames of a bulk write keep the
+record and are encoded when read, so an import larger than the ring never
+encodes the frames that fall out of it):
+
+  id: <boot id>.<seq>
+  event: student.put            (school.put, school.delete, student.delete)
+  data: <entity JSON>           ({"id": ...} for deletes)
+
+Subscribers do not get queues of their own: each one holds a cursor into the
+ring and copies frames out of it when woken, so a write costs the same with
+one subscriber or a thousand, and memory stays bounded. A subscriber that is
+slow enough to fall out of the ring (or resumes from an id the ring no
+longer holds, or one from before a restart) gets a single `reset` event and
+the stream ends: it has to re-fetch the collections and reconnect.
+
+Writers may run on executor threads (SQLite backend), so the ring is guarded
+by a lock and wake-ups are handed to the event loop, coalesced into one per
+loop iteration however many writes happened.
+"""
+
+from collections import deque
+from itertools import islice, repeat
+from typing import AsyncIterator, List, Optional
+import asyncio
+import os
+import threading
+
+from app import models
+from app.versions import BOOT_ID
+
+DEFAULT_BUFFER_SIZE = 10000
+HEARTBEAT_INTERVAL = 15.0
+MAX_FRAMES_PER_WRITE = 500
+
+_KEEPALIVE = b": keepalive\n\n"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _frame(seq: int, event: str, data: bytes) -> bytes:
+    return b"id: %s.%d\nevent: %s\ndata: %s\n\n" % (BOOT_ID.encode(), seq, event.encode(), data)
+
+
+def _encode(seq: int, event: str, entity) -> bytes:
+    # Frames of a bulk write are kept as (seq, event, entity); stored records never change, so
+    # encoding one later gives what it would have given at the write
+    return _frame(seq, event, entity.to_json())
+
+
+class ChangeFeed:
+    def __init__(self, size: int = DEFAULT_BUFFER_SIZE):
+        self._frames: deque = deque(maxlen=size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._wake_pending = False
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(self, event: str, data: bytes) -> None:
+        with self._lock:
+            self._seq += 1
+            self._frames.append(_frame(self._seq, event, data))
+            loop = self._take_wake()
+        if loop is not None:
+            self._send_wake(loop)
+
+    def publish_many(self, event: str, entities: List) -> None:
+        """One frame per entity, under one lock; each is encoded only if a subscriber reads it"""
+        with self._lock:
+            first = self._seq + 1
+            self._seq += len(entities)
+            # A bulk write can be larger than the ring: only its tail stays
+            self._frames.extend(zip(range(first, self._seq + 1), repeat(event), entities))
+            loop = self._take_wake()
+        if loop is not None:
+            self._send_wake(loop)
+
+    def reset(self) -> None:
+        """Forget the buffered frames: every current subscriber gets a reset event"""
+        with self._lock:
+            self._frames.clear()
+            # Step past every cursor handed out so far, so none of them is still current
+            self._seq += 1
+            loop = self._take_wake()
+        if loop is not None:
+            self._send_wake(loop)
+
+    def _take_wake(self) -> Optional[asyncio.AbstractEventLoop]:
+        # Called with the lock held: the loop to wake, unless a wake-up is already on its way
+        if self._loop is None or self._wake_pending:
+            return None
+        self._wake_pending = True
+        return self._loop
+
+    def _send_wake(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The loop the subscribers ran on is gone; nobody is left to wake
+            with self._lock:
+                self._loop = None
+                self._wake_pending = False
+
+    def _wake(self) -> None:
+        with self._lock:
+            self._wake_pending = False
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def cursor(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Sequence to resume after; None when the id belongs to another boot or is ahead of the feed"""
+        if not last_event_id:
+            return self._seq
+        boot, _, seq = last_event_id.partition('.')
+        try:
+            seq = int(seq)
+        except ValueError:
+            raise InvalidCursor(last_event_id)
+        if boot != BOOT_ID or seq > self._seq:
+            return None
+        return seq
+
+    def _since(self, cursor: int) -> Optional[List[bytes]]:
+        # None: the frames after cursor have already left the ring
+        with self._lock:
+            first = self._seq - len(self._frames) + 1
+            if cursor + 1 < first:
+                return None
+            start = cursor + 1 - first
+            return [frame if isinstance(frame, bytes) else _encode(*frame)
+                    for frame in islice(self._frames, start, start + MAX_FRAMES_PER_WRITE)]
+
+    def _reset_frame(self) -> bytes:
+        return b"event: reset\ndata: {\"id\":\"%s.%d\"}\n\n" % (BOOT_ID.encode(), self._seq)
+
+    async def stream(self, cursor: Optional[int]) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            with self._lock:
+                self._loop = loop
+                self._wake_pending = False
+            self._changed = asyncio.Event()
+        if cursor is None:
+            yield self._reset_frame()
+            return
+        while True:
+            # Take the event before reading the ring, so a write in between still wakes us
+            changed = self._changed
+            frames = self._since(cursor)
+            if frames is None:
+                yield self._reset_frame()
+                return
+            if frames:
+                cursor += len(frames)
+                # Awaiting the send is the backpressure: a slow client only falls behind in the ring
+                yield b"".join(frames)
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield _KEEPALIVE
+
+
+feed = ChangeFeed(int(os.getenv('CHANGES_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)))
+
+
+def _on_mutation(kind: str, op: str, entity, before=None) -> None:
+    data = entity.to_json() if op == models.PUT else b'{"id":"%s"}' % entity.id.encode()
+    feed.publish(f"{kind}.{op}", data)
+
+
+def _on_mutations(kind: str, op: str, entities: List, befores: List) -> None:
+    if op == models.PUT:
+        feed.publish_many(f"{kind}.{op}", entities)
+    else:
+        for entity in entities:
+            _on_mutation(kind, op, entity)
+
+
+models.add_listener(_on_mutation, _on_mutations)
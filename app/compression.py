@@ -0,0 +1,368 @@
+"""Response compression negotiated from Accept-Encoding.
+
+Full collections are large and repetitive JSON (the same keys, grades and
+school ids over and over), so they shrink several times over. The encoding
+is the client's most preferred one (q-values) among those enabled, ties
+going to the order of COMPRESSION_ENCODINGS (default zstd,br,gzip; zstd and
+br only when the zstandard/brotli packages are installed). zstd comes first:
+on a collection it is as small as gzip for a sixth of the CPU (bench.compression):
+
+  - bodies under COMPRESSION_MIN_SIZE bytes (default 1024) go out as they are;
+  - bodies of COMPRESSION_THREAD_SIZE bytes and more (default 256 KiB) are
+    compressed in the default thread pool, so the event loop keeps serving
+    (zlib, brotli and zstd release the GIL while they work);
+  - streamed bodies (NDJSON) are compressed chunk by chunk, each chunk
+    flushed, so a client sees every chunk as soon as it is sent;
+  - text/event-stream (/changes), gzip files (/export), /replication/*
+    streams and responses that already carry a Content-Encoding (a follower
+    forwarding the leader's bytes) are left alone.
+
+A compressed variant gets its own ETag, the original with the encoding
+appended ("7.42-gzip"). Conditional requests come back with that tag, so
+the suffix is taken off If-None-Match/If-Match on the way in and put back
+on a 304. Compressed bodies of responses with an ETag are cached by path,
+query, ETag and encoding (COMPRESSION_CACHE_SIZE bytes, default 64 MiB, LRU):
+a collection that has not changed since is not compressed again, and a
+mutation changes the ETag, so a stale entry is never served and ages out.
+
+Everything but the compression itself runs on the event loop thread.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+ZSTD = 'zstd'
+
+# Streams sent as they happen, and files that are compressed already (/export)
+SKIP_CONTENT_TYPES = (b'text/event-stream', b'application/gzip')
+SKIP_PATHS = ('/replication/',)
+
+stats: Dict[str, int] = {'bytes_in': 0, 'bytes_out': 0, 'cache_hits': 0}
+responses: Dict[str, int] = {}
+
+
+class GzipCodec:
+    name = GZIP
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level, wbits=31)
+
+    def stream(self) -> 'GzipStream':
+        return GzipStream(zlib.compressobj(self.level, zlib.DEFLATED, 31))
+
+
+class GzipStream:
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliCodec:
+    name = BROTLI
+
+    def __init__(self, quality: int):
+        self.quality = quality
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.quality)
+
+    def stream(self) -> 'BrotliStream':
+        return BrotliStream(brotli.Compressor(quality=self.quality))
+
+
+class BrotliStream:
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.process(chunk) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCodec:
+    name = ZSTD
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # A ZstdCompressor is not safe to share between threads: one per call
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self) -> 'ZstdStream':
+        return ZstdStream(zstandard.ZstdCompressor(level=self.level).compressobj())
+
+
+class ZstdStream:
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self.compressor.compress(chunk) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {coding: q}; codings with q=0 are refused"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: str, codecs: List) -> Optional[object]:
+    """The enabled codec the client prefers most; earlier in codecs wins a tie"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for codec in codecs:
+        q = accepted.get(codec.name, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+
+def _header(headers, name: bytes) -> Optional[bytes]:
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+def _tagged(etag: bytes, codec) -> bytes:
+    # "7.42" -> "7.42-gzip"; a weak tag keeps its W/ prefix
+    return etag[:-1] + b'-' + codec.name.encode() + b'"' if etag.endswith(b'"') else etag
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (path, query, etag, encoding), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Plain ASGI middleware: compresses response bodies in the encoding negotiated per request"""
+
+    def __init__(self, app):
+        self.app = app
+        self.codecs = config['codecs']
+        self.min_size = config['min_size']
+        self.thread_size = config['thread_size']
+        self.cache = CompressedCache(config['cache_size']) if config['cache_size'] else None
+        self._suffixes = [b'-' + codec.name.encode() + b'"' for codec in self.codecs]
+
+    def _strip_tags(self, value: bytes) -> bytes:
+        for suffix in self._suffixes:
+            value = value.replace(suffix, b'"')
+        return value
+
+    async def _compress(self, function, data: bytes) -> bytes:
+        if len(data) >= self.thread_size:
+            return await asyncio.get_running_loop().run_in_executor(None, function, data)
+        return function(data)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.codecs or scope['path'].startswith(SKIP_PATHS):
+            await self.app(scope, receive, send)
+            return
+        # Validators the client got with a compressed variant name the uncompressed one underneath,
+        # whether or not this request asks for compression
+        conditional = False
+        headers = []
+        for name, value in scope['headers']:
+            if name in (b'if-none-match', b'if-match'):
+                stripped = self._strip_tags(value)
+                conditional = conditional or stripped != value
+                value = stripped
+            headers.append((name, value))
+        if conditional:
+            # In place: the router writes endpoint and path_params into this scope, and the
+            # metrics and access log outside read them back from it
+            scope['headers'] = headers
+        accept = _header(scope['headers'], b'accept-encoding')
+        codec = negotiate(accept.decode('latin-1'), self.codecs) if accept else None
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, scope, send, codec, conditional)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    """Per-response state between http.response.start and the last body message"""
+
+    def __init__(self, middleware: CompressionMiddleware, scope, send, codec, conditional: bool):
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.codec = codec
+        self.conditional = conditional
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+
+    def _cache_key(self, etag: Optional[bytes]) -> Optional[Tuple]:
+        if etag is None or self.middleware.cache is None or self.start['status'] != 200:
+            return None
+        return self.scope['path'], self.scope.get('query_string', b''), etag, self.codec.name
+
+    def _compressed_headers(self, length: Optional[int]) -> List:
+        headers = []
+        vary = None
+        for name, value in self.start.get('headers', []):
+            lowered = name.lower()
+            if lowered == b'content-length':
+                continue
+            if lowered == b'etag':
+                value = _tagged(value, self.codec)
+            if lowered == b'vary':
+                vary = value
+                continue
+            headers.append((name, value))
+        headers.append((b'content-encoding', self.codec.name.encode()))
+        headers.append((b'vary', vary + b', Accept-Encoding' if vary else b'Accept-Encoding'))
+        if length is not None:
+            headers.append((b'content-length', str(length).encode()))
+        return headers
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            headers = message.get('headers', [])
+            content_type = _header(headers, b'content-type') or b''
+            if (_header(headers, b'content-encoding') is not None or self.scope['method'] == 'HEAD'
+                    or content_type.startswith(SKIP_CONTENT_TYPES)):
+                self.passthrough = True
+                await self.downstream(message)
+            elif message['status'] == 304:
+                # The 304 stands for the variant the client holds
+                self.passthrough = True
+                if self.conditional:
+                    message = dict(message, headers=[
+                        (name, _tagged(value, self.codec) if name.lower() == b'etag' else value)
+                        for name, value in headers])
+                await self.downstream(message)
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.downstream(message)
+            return
+        body = message.get('body', b'')
+        more = message.get('more_body', False)
+        if self.stream is None and not more:
+            await self._send_whole(body)
+            return
+        if self.stream is None:
+            self.stream = self.codec.stream()
+            await self.downstream(dict(self.start, headers=self._compressed_headers(None)))
+        compressed = await self.middleware._compress(self.stream.compress, body) if body else b''
+        if not more:
+            compressed += self.stream.finish()
+        stats['bytes_in'] += len(body)
+        stats['bytes_out'] += len(compressed)
+        await self.downstream({'type': 'http.response.body', 'body': compressed, 'more_body': more})
+        if not more:
+            responses[self.codec.name] = responses.get(self.codec.name, 0) + 1
+
+    async def _send_whole(self, body: bytes) -> None:
+        if len(body) < self.middleware.min_size:
+            await self.downstream(self.start)
+            await self.downstream({'type': 'http.response.body', 'body': body})
+            return
+        key = self._cache_key(_header(self.start.get('headers', []), b'etag'))
+        compressed = self.middleware.cache.get(key) if key else None
+        if compressed is not None:
+            stats['cache_hits'] += 1
+        else:
+            compressed = await self.middleware._compress(self.codec.compress, body)
+            if key:
+                self.middleware.cache.put(key, compressed)
+        stats['bytes_in'] += len(body)
+        stats['bytes_out'] += len(compressed)
+        responses[self.codec.name] = responses.get(self.codec.name, 0) + 1
+        await self.downstream(dict(self.start, headers=self._compressed_headers(len(compressed))))
+        await self.downstream({'type': 'http.response.body', 'body': compressed})
+
+
+def _codecs(names: str, gzip_level: int, brotli_quality: int, zstd_level: int) -> List:
+    available = {GZIP: lambda: GzipCodec(gzip_level)}
+    if brotli is not None:
+        available[BROTLI] = lambda: BrotliCodec(brotli_quality)
+    if zstandard is not None:
+        available[ZSTD] = lambda: ZstdCodec(zstd_level)
+    codecs = []
+    for name in (part.strip().lower() for part in names.split(',')):
+        if name and name not in (GZIP, BROTLI, ZSTD):
+            raise ValueError(f"Unknown encoding in COMPRESSION_ENCODINGS: {name}")
+        # An encoding whose package is missing is skipped: gzip is always there
+        if name in available:
+            codecs.append(available[name]())
+    return codecs
+
+
+def from_env() -> dict:
+    return {
+        # Empty turns compression off
+        'codecs': _codecs(os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip'),
+                          int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+                          int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4')),
+                          int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))),
+        'min_size': int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+        'thread_size': int(os.getenv('COMPRESSION_THREAD_SIZE', str(256 * 1024))),
+        'cache_size': int(os.getenv('COMPRESSION_CACHE_SIZE', str(64 * 1024 * 1024))),
+    }
+
+
+config = from_env()
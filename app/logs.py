@@ -0,0 +1,241 @@
+"""Structured, non-blocking logging.
+
+A log call on the request path only builds the record and enqueues it. A
+background writer thread formats whatever has accumulated as JSON lines and
+writes the batch to stdout with one write and one flush, so a slow terminal
+or log collector never stalls the event loop:
+
+  {"ts": "2024-01-01T12:00:00.000+00:00", "level": "INFO", "logger": "app.access",
+   "message": "GET /students/{student_id} 200", "method": "GET",
+   "route": "/students/{student_id}", "status": 200, "latency_ms": 0.412,
+   "student_id": "..."}
+
+Fields passed with extra={...} become top-level keys. Configuration:
+
+  LOG_LEVEL          root level (default INFO)
+  LOG_SAMPLE_RATES   per-level sampling of success logs, e.g. "INFO=0.1,DEBUG=0";
+                     WARNING and above are never sampled. Kept records carry
+                     their sample_rate so counts can be scaled back up.
+  LOG_QUEUE_SIZE     bound on queued records (default 10000). When the writer
+                     falls behind, new records are dropped and counted
+                     (log_records_dropped_total in /metrics) instead of blocking.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, TextIO
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+
+DEFAULT_QUEUE_SIZE = 10000
+MAX_BATCH = 1000
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__)
+# color_message: uvicorn's ANSI-coloured copy of the message
+_RECORD_ATTRIBUTES |= {'message', 'asctime', 'color_message'}
+
+access_logger = logging.getLogger('app.access')
+
+
+def parse_sample_rates(spec: str) -> Dict[int, float]:
+    """'INFO=0.1,DEBUG=0' -> {logging.INFO: 0.1, logging.DEBUG: 0.0}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, rate = item.partition('=')
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level in LOG_SAMPLE_RATES: {name}")
+        rates[level] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def sample(self, levelno: int) -> Optional[float]:
+        """Rate the record is kept at, or None to drop it; errors are always kept"""
+        if levelno >= logging.WARNING:
+            return 1.0
+        rate = self.rates.get(levelno, 1.0)
+        if rate >= 1.0:
+            return 1.0
+        return rate if random.random() < rate else None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if hasattr(record, 'sample_rate'):
+            # Already sampled by the caller (access log)
+            return True
+        rate = self.sample(record.levelno)
+        if rate is None:
+            return False
+        if rate < 1.0:
+            record.sample_rate = rate
+        return True
+
+
+class QueueHandler(logging.Handler):
+    """Enqueues records for the writer thread; drops and counts them when the queue is full"""
+
+    def __init__(self, records: queue.SimpleQueue, max_size: int = DEFAULT_QUEUE_SIZE):
+        super().__init__()
+        self.records = records
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Skips Handler.handle's lock: the queue is thread-safe on its own
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # SimpleQueue plus a size check instead of a bounded Queue: several times cheaper per put,
+        # and the bound only needs to be approximate
+        if self.records.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        # Merge the arguments now: they may change before the writer gets to the record
+        record.msg = record.getMessage()
+        record.args = None
+        self.records.put(record)
+
+
+class LogWriter:
+    def __init__(self, records: queue.SimpleQueue, stream: TextIO, formatter: logging.Formatter):
+        self.records = records
+        self.stream = stream
+        self.formatter = formatter
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return json.dumps({'level': 'ERROR', 'logger': __name__, 'message': f"Unformattable log record: {e}"})
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[logging.LogRecord] = [self.records.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                stopping = True
+            if batch:
+                try:
+                    self.stream.write("".join(self._format(record) + "\n" for record in batch))
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    # Closed or broken stdout: nothing sensible left to report it to
+                    pass
+
+    def close(self) -> None:
+        self.records.put(None)
+        self._thread.join()
+
+
+handler: Optional[QueueHandler] = None
+_writer: Optional[LogWriter] = None
+_filter = SamplingFilter({})
+
+
+def setup() -> None:
+    """Routes the root logger (and uvicorn's) through the queue; safe to call more than once"""
+    global handler, _writer, _filter
+    if handler is not None:
+        return
+    _filter = SamplingFilter(parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    formatter = JsonFormatter()
+    handler = QueueHandler(records, int(os.getenv('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+    handler.addFilter(_filter)
+    _writer = LogWriter(records, sys.stdout, formatter)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # Caller file/line, thread and multiprocessing names are not in the output; skip collecting them
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    # uvicorn installs its own synchronous handlers; send its messages through ours instead.
+    # Its access log is replaced by app.access, which also has the route template and latency.
+    for name in ('uvicorn', 'uvicorn.error'):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    logging.getLogger('uvicorn.access').disabled = True
+    atexit.register(stop)
+
+
+def stop() -> None:
+    """Flushes the queue and switches to writing synchronously for whatever is logged after shutdown"""
+    global _writer
+    if _writer is None:
+        return
+    root = logging.getLogger()
+    fallback = logging.StreamHandler(_writer.stream)
+    fallback.setFormatter(_writer.formatter)
+    fallback.addFilter(_filter)
+    root.addHandler(fallback)
+    root.removeHandler(handler)
+    _writer.close()
+    _writer = None
+
+
+def dropped() -> int:
+    return handler.dropped if handler else 0
+
+
+def access(scope, route: str, status_code: int, seconds: float) -> None:
+    """One access log record per request; 5xx responses are logged as errors and never sampled"""
+    level = logging.ERROR if status_code >= 500 else logging.INFO
+    if not access_logger.isEnabledFor(level):
+        return
+    # Sample before building the record, so a dropped access log costs next to nothing
+    rate = _filter.sample(level)
+    if rate is None:
+        return
+    fields = {
+        'method': scope['method'],
+        'route': route,
+        'path': scope['path'],
+        'status': status_code,
+        'latency_ms': round(seconds * 1000, 3),
+        'sample_rate': rate,
+    }
+    # Path parameters are the ids the request addressed (school_id, student_id)
+    fields.update(scope.get('path_params') or {})
+    access_logger.log(level, f"{scope['method']} {route} {status_code}", extra=fields)
@@ -1,20 +1,21 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from bisect import bisect_right
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Literal, Optional, Tuple
 import logging
-import sys
+import re
+import zlib
 
-from app.models import SchoolRepository, StudentRepository, School, Student
+from app import (admission, changes, compression, logs, metrics, persistence, replication, repository, search, stats,
+                 transfer, versions)
+from app.models import VersionConflict, datetime_us
+from app.repository import schools_repo, students_repo
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Configure logging: JSON lines written by a background thread (see app.logs)
+logs.setup()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -23,6 +24,40 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Collection endpoints: keyset pagination and NDJSON streaming
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Bulk endpoints
+MAX_BULK_SIZE = 10000
+
+# Search (?q=)
+MAX_QUERY_LENGTH = 100
+
+# Batch lookups (?ids=) and relationship expansion (?expand=school)
+MAX_IDS = MAX_PAGE_SIZE
+EXPAND_SCHOOL = "school"
+
+# Student filters (?school_id=&grade=&age_min=&age_max=) and ordering (?sort=, "-" for descending)
+StudentSort = Literal["age", "-age", "grade", "-grade", "last_name", "-last_name",
+                      "created_at", "-created_at", "updated_at", "-updated_at"]
+GRADE_PATTERN = re.compile(r"(\d*)(.*)", re.DOTALL)
+
+def grade_key(grade: str) -> Tuple[int, str]:
+    # "9А" before "10А": the leading number compares as a number
+    number, rest = GRADE_PATTERN.match(grade).groups()
+    return (int(number) if number else -1, rest)
+
+STUDENT_SORT_KEYS: Dict[str, Callable] = {
+    "age": lambda student: student.age,
+    "grade": lambda student: grade_key(student.grade),
+    "last_name": lambda student: student.last_name,
+    "created_at": lambda student: student.created_us,
+    "updated_at": lambda student: student.updated_us,
+}
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +67,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Replication (REPLICATION_ROLE): tokens on responses; a follower gates reads and forwards writes to the leader
+app.add_middleware(replication.ReplicationMiddleware)
+
+# Compression negotiated from Accept-Encoding (COMPRESSION_*); above replication, so forwarded
+# leader responses pass through as they came
+app.add_middleware(compression.CompressionMiddleware)
+
+# Request metrics; times the whole stack below admission control
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Admission control (ADMISSION_*): sheds excess load with 429/503 before it queues; /health always passes.
+# Outermost, so a rejection costs no access log line: admission_rejected_total counts them instead
+app.add_middleware(admission.AdmissionMiddleware)
+
 # Pydantic models for request/response
 class SchoolCreate(BaseModel):
     name: str = Field(..., min_length=1, description="Название школы")
@@ -74,11 +123,358 @@ class StudentResponse(BaseModel):
     grade: str
     created_at: str
     updated_at: str
+    school: Optional[SchoolResponse] = Field(None, description="Школа студента, только с ?expand=school")
+
+class SchoolStatsResponse(BaseModel):
+    students: int
+    grades: Dict[str, int]
+    ages: Dict[str, int]
+
+class StatsResponse(SchoolStatsResponse):
+    schools: int
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+# Encoders turn a page of entities into their JSON documents
+Encoder = Callable[[List], Awaitable[List[bytes]]]
+
+async def plain_json(entities) -> List[bytes]:
+    return [entity.to_json() for entity in entities]
+
+def embed(document: bytes, field: bytes, value: bytes) -> bytes:
+    # Cached entity JSON is an object: splice the field in before its closing brace
+    return document[:-1] + b',"' + field + b'":' + value + b"}"
+
+async def with_schools(students) -> List[bytes]:
+    """JSON студентов со вложенной школой: одна выборка и один поиск на каждую школу страницы"""
+    school_ids = list(dict.fromkeys(student.school_id for student in students))
+    schools = {school.id: school.to_json() for school in await schools_repo.get_schools_by_ids(school_ids)}
+    return [embed(student.to_json(), b"school", schools.get(student.school_id, b"null")) for student in students]
+
+def student_encoder(expand: Optional[str]) -> Encoder:
+    return with_schools if expand == EXPAND_SCHOOL else plain_json
+
+async def ndjson_stream(fetch_page: Callable, after: Optional[str], limit: Optional[int],
+                        encode: Encoder = plain_json):
+    """Отдать коллекцию в формате NDJSON порциями по STREAM_CHUNK_SIZE записей"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk_size = STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining)
+        page = await fetch_page(after=after, limit=chunk_size)
+        if not page:
+            break
+        yield b"\n".join(await encode(page)) + b"\n"
+        if len(page) < chunk_size:
+            break
+        after = page[-1].id
+        if remaining is not None:
+            remaining -= len(page)
+
+# Repository output is trusted: responses are assembled from each entity's cached JSON bytes
+# instead of going through to_dict(), response_model validation and the generic encoder.
+def entity_response(entity, status_code: int = status.HTTP_200_OK) -> Response:
+    return Response(content=entity.to_json(), status_code=status_code, media_type="application/json",
+                    headers=versions.validators(versions.entity_etag(entity), entity.updated_us))
+
+def list_response(documents: List[bytes], headers: Optional[Dict[str, str]] = None) -> Response:
+    content = b"[" + b",".join(documents) + b"]"
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Conditional GET: the validators are known before anything is fetched, so a client whose copy
+# is current gets 304 without the collection being read or serialized.
+def not_modified_response(request: Request, etag: str, modified_us: int,
+                          headers: Dict[str, str]) -> Optional[Response]:
+    if versions.not_modified(request, etag, modified_us):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+def entity_get_response(request: Request, entity, school=None) -> Response:
+    """GET одной записи; со school — представление со вложенной школой (?expand=school)"""
+    if school is None:
+        etag, modified_us = versions.entity_etag(entity), entity.updated_us
+    else:
+        # A different representation with its own tag, which changes with either record
+        etag = versions.entity_etag(entity, f"-school{versions.entity_tag(school)}")
+        modified_us = max(entity.updated_us, school.updated_us)
+    headers = versions.validators(etag, modified_us)
+    cached = not_modified_response(request, etag, modified_us, headers)
+    if cached:
+        return cached
+    content = entity.to_json() if school is None else embed(entity.to_json(), b"school", school.to_json())
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def collection_response(request: Request, version: versions.CollectionVersion,
+                        expanded: Optional[versions.CollectionVersion] = None
+                        ) -> Tuple[Dict[str, str], Optional[Response]]:
+    """Заголовки коллекции и готовый ответ 304, если у клиента актуальная копия"""
+    # Read the counter before fetching: a concurrent change then yields a stale tag, never a wrong 304.
+    # The NDJSON and JSON array representations share a URL, so they get distinct tags.
+    variant = "-ndjson" if wants_ndjson(request) else ""
+    modified_us = version.modified_us
+    if expanded is not None:
+        # Embedded records come from another collection: its changes must change the tag too
+        variant += f"-expand{expanded.version}"
+        modified_us = max(modified_us, expanded.modified_us)
+    etag = versions.collection_etag(version, variant)
+    headers = dict(versions.validators(etag, modified_us), Vary="Accept")
+    return headers, not_modified_response(request, etag, modified_us, headers)
+
+async def paginate(fetch_page: Callable, fetch_all: Callable, request: Request,
+                   after: Optional[str], limit: Optional[int], version: versions.CollectionVersion,
+                   encode: Encoder = plain_json, expanded: Optional[versions.CollectionVersion] = None) -> Response:
+    headers, cached = collection_response(request, version, expanded)
+    if cached:
+        return cached
+    if wants_ndjson(request):
+        return StreamingResponse(ndjson_stream(fetch_page, after, limit, encode), media_type=NDJSON_MEDIA_TYPE,
+                                 headers=headers)
+    if limit is None and after is None:
+        return list_response(await encode(await fetch_all()), headers)
+    page_size = limit or MAX_PAGE_SIZE
+    page = await fetch_page(after=after, limit=page_size)
+    if len(page) == page_size:
+        headers[NEXT_CURSOR_HEADER] = page[-1].id
+    return list_response(await encode(page), headers)
+
+def parse_ids(ids: str) -> List[str]:
+    """?ids=a,b,c -> отсортированные ID без повторов"""
+    parsed = sorted({part.strip() for part in ids.split(",") if part.strip()})
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must list at least one id")
+    if len(parsed) > MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_IDS} ids per request")
+    return parsed
+
+# Selectors produce a sorted list of ids: an explicit ?ids= list, search results, a time range
+Selector = Callable[[], Awaitable[List[str]]]
+
+def listed(ids: List[str]) -> Selector:
+    async def select() -> List[str]:
+        return ids
+    return select
+
+def searched(index: search.SearchIndex, query: str) -> Selector:
+    async def select() -> List[str]:
+        return index.search(query)
+    return select
+
+def student_time_range(bounds: Dict[str, int]) -> Selector:
+    async def select() -> List[str]:
+        return await students_repo.get_student_ids_in_range(**bounds)
+    return select
+
+def student_filter(filters: Dict) -> Selector:
+    async def select() -> List[str]:
+        return await students_repo.get_student_ids_filtered(**filters)
+    return select
+
+# An order rearranges the selected ids; without one they stay sorted by id
+Order = Callable[[List[str]], Awaitable[List[str]]]
+
+def sorted_by(sort: str, fetch_by_ids: Callable) -> Order:
+    """Порядок ?sort=: по полю записи, "-поле" — по убыванию; при равенстве — по ID"""
+    key = STUDENT_SORT_KEYS[sort.lstrip("-")]
+
+    async def order(ids: List[str]) -> List[str]:
+        entities = await fetch_by_ids(ids)
+        # The sort is stable in both directions, so ties keep the id order they came in
+        entities.sort(key=key, reverse=sort.startswith("-"))
+        return [entity.id for entity in entities]
+    return order
+
+def id_pages(selectors: List[Selector], fetch_by_ids: Callable,
+             order: Optional[Order] = None) -> Tuple[Callable, Callable]:
+    """fetch_page/fetch_all для paginate поверх пересечения отсортированных списков ID"""
+    selected: Optional[List[str]] = None
+    # Where the last page ended, so NDJSON chunks in a custom order find their cursor without a search
+    resume: Tuple[Optional[str], int] = (None, 0)
+
+    async def selected_ids() -> List[str]:
+        # Selected on first use, so a 304 never touches the indexes and NDJSON chunks share one selection
+        nonlocal selected
+        if selected is None:
+            found = [await select() for select in selectors]
+            narrowest = min(found, key=len)
+            others = [set(ids) for ids in found if ids is not narrowest]
+            selected = [entity_id for entity_id in narrowest if all(entity_id in ids for ids in others)]
+            if order is not None:
+                selected = await order(selected)
+        return selected
+
+    async def fetch_page(after: Optional[str] = None, limit: int = MAX_PAGE_SIZE):
+        nonlocal resume
+        ids = await selected_ids()
+        if not after:
+            start = 0
+        elif order is None:
+            start = bisect_right(ids, after)
+        elif resume[0] == after:
+            start = resume[1]
+        else:
+            # A cursor no longer in the selection (deleted, or moved out of the filter) ends the listing
+            try:
+                start = ids.index(after) + 1
+            except ValueError:
+                start = len(ids)
+        # Ids deleted since the selection are skipped by the lookup: read on until the page is full or
+        # the selection runs out, so a short page always means the end
+        page = []
+        while len(page) < limit and start < len(ids):
+            end = min(start + limit - len(page), len(ids))
+            page.extend(await fetch_by_ids(ids[start:end]))
+            start = end
+        resume = (page[-1].id if page else None, start)
+        return page
+
+    async def fetch_all():
+        return await fetch_by_ids(await selected_ids())
+
+    return fetch_page, fetch_all
+
+def time_bounds(**bounds: Optional[datetime]) -> Dict[str, int]:
+    """?created_after=&created_before=&updated_after=&updated_before= в микросекундах; пустые опущены"""
+    return {name: datetime_us(value) for name, value in bounds.items() if value is not None}
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Precondition failed")
+
+async def expected_version(request: Request, fetch: Callable, entity_id: str) -> Optional[int]:
+    """Версия из If-Match для оптимистичной блокировки (None, если заголовка нет)"""
+    if "if-match" not in request.headers:
+        return None
+    entity = await fetch(entity_id)
+    if versions.if_match_failed(request, entity):
+        raise precondition_failed()
+    return entity.version
+
+class SchoolBulkCreate(BaseModel):
+    items: List[SchoolCreate] = Field(..., min_length=1, max_length=MAX_BULK_SIZE)
+    atomic: bool = Field(False, description="Всё или ничего: при любой ошибке пакет не применяется")
+
+class SchoolBulkUpdateItem(SchoolUpdate):
+    id: str = Field(..., description="ID школы")
+
+class SchoolBulkUpdate(BaseModel):
+    items: List[SchoolBulkUpdateItem] = Field(..., min_length=1, max_length=MAX_BULK_SIZE)
+    atomic: bool = Field(False, description="Всё или ничего: при любой ошибке пакет не применяется")
+
+class StudentBulkCreate(BaseModel):
+    items: List[StudentCreate] = Field(..., min_length=1, max_length=MAX_BULK_SIZE)
+    atomic: bool = Field(False, description="Всё или ничего: при любой ошибке пакет не применяется")
+
+class StudentBulkUpdateItem(StudentUpdate):
+    id: str = Field(..., description="ID студента")
+
+class StudentBulkUpdate(BaseModel):
+    items: List[StudentBulkUpdateItem] = Field(..., min_length=1, max_length=MAX_BULK_SIZE)
+    atomic: bool = Field(False, description="Всё или ничего: при любой ошибке пакет не применяется")
+
+class BulkDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_SIZE)
+    atomic: bool = Field(False, description="Всё или ничего: при любой ошибке пакет не применяется")
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResponse(BaseModel):
+    schools: int
+    students: int
+    failed: int
+    errors: List[ImportRowError] = Field(..., description=f"Первые {transfer.MAX_ERRORS} ошибок")
+    seconds: float
+    rows_per_sec: float
+
+def bulk_result(ids: List[Optional[str]], errors: Dict[int, Tuple[int, str]],
+                success_status: int, applied: bool = True) -> Dict:
+    results = []
+    for index, entity_id in enumerate(ids):
+        if index in errors:
+            code, message = errors[index]
+        elif applied:
+            code, message = success_status, None
+        else:
+            code, message = status.HTTP_424_FAILED_DEPENDENCY, "Not applied: batch rejected"
+        results.append({"index": index, "status": code, "id": entity_id, "error": message})
+    failed = len(errors) if applied else len(ids)
+    return {"succeeded": len(ids) - failed, "failed": failed, "results": results}
+
+async def apply_batch(ids: List[Optional[str]], errors: Dict[int, Tuple[int, str]], atomic: bool,
+                success_status: int, apply: Callable[[List[int]], Awaitable[None]]):
+    """Применить валидные элементы пакета одним вызовом репозитория"""
+    if errors and atomic:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content=bulk_result(ids, errors, success_status, applied=False))
+    await apply([index for index in range(len(ids)) if index not in errors])
+    return bulk_result(ids, errors, success_status)
+
+async def missing_schools(school_ids) -> set:
+    # One lookup per distinct school, however many rows reference it
+    return {school_id for school_id in set(school_ids) if not await schools_repo.get_school(school_id)}
+
+async def not_found_errors(ids: List[str], exists: Callable, message: str) -> Dict[int, Tuple[int, str]]:
+    errors = {}
+    seen = set()
+    for index, entity_id in enumerate(ids):
+        if entity_id in seen or not await exists(entity_id):
+            errors[index] = (status.HTTP_404_NOT_FOUND, message)
+        seen.add(entity_id)
+    return errors
+
+# Persistence for the memory backend (enabled with PERSISTENCE_DIR): warm restart before serving, flush on shutdown
+@app.on_event("startup")
+async def start_persistence():
+    if replication.role is not None and repository.backend != repository.MEMORY:
+        raise ValueError("Replication works with the memory backend; several workers share SQLite instead")
+    # The SQLite backend is durable on its own; a replication follower gets its data from the leader
+    if repository.backend == repository.MEMORY and replication.role != replication.FOLLOWER:
+        persistence.start_from_env()
+
+def rebuild_indexes(all_schools, all_students):
+    search.rebuild(all_schools, all_students)
+    stats.rebuild(all_schools, all_students)
+    # Whatever was derived from the previous state is stale too
+    versions.invalidate()
+    changes.feed.reset()
+
+@app.on_event("startup")
+async def build_indexes():
+    # Records restored by recovery or already in the SQLite file never passed through the listeners
+    if replication.role == replication.FOLLOWER:
+        # Loads the leader's snapshot in the background; reads get 503 until it is in
+        replication.follower.start(rebuild_indexes)
+        return
+    if repository.shared:
+        # Other worker processes write to the same SQLite file: follow their changes from here on
+        repository.start_following(rebuild_indexes)
+        return
+    all_schools = await schools_repo.get_all_schools()
+    all_students = await students_repo.get_all_students()
+    rebuild_indexes(all_schools, all_students)
+
+@app.on_event("shutdown")
+async def stop_persistence():
+    persistence.stop()
+    repository.stop_following()
+    if replication.follower:
+        await replication.follower.stop()
 
 # Error handling middleware
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    logger.error(f"Unhandled exception: {exc}")
+    logger.error("Unhandled exception", extra={'error': str(exc)})
     return {"error": "Internal server error", "detail": str(exc)}
 
 # Health check endpoint
@@ -86,78 +482,249 @@ async def global_exception_handler(request, exc):
 async def health_check():
     return {"status": "healthy", "message": "School Management API is running"}
 
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Bulk endpoints
+@app.post("/schools/bulk", response_model=BulkResponse)
+async def create_schools_bulk(batch: SchoolBulkCreate):
+    """Создать школы пакетом"""
+    try:
+        ids: List[Optional[str]] = [None] * len(batch.items)
+
+        async def apply(valid: List[int]):
+            schools = await schools_repo.create_schools([batch.items[i].model_dump() for i in valid])
+            for index, school in zip(valid, schools):
+                ids[index] = school.id
+
+        result = await apply_batch(ids, {}, batch.atomic, status.HTTP_201_CREATED, apply)
+        logger.info("Bulk created schools", extra={'count': len(batch.items)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk creating schools", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to create schools")
+
+@app.put("/schools/bulk", response_model=BulkResponse)
+async def update_schools_bulk(batch: SchoolBulkUpdate):
+    """Обновить школы пакетом"""
+    try:
+        ids = [item.id for item in batch.items]
+        errors = {index: (status.HTTP_404_NOT_FOUND, "School not found")
+                  for index, school_id in enumerate(ids) if not await schools_repo.get_school(school_id)}
+
+        async def apply(valid: List[int]):
+            await schools_repo.update_schools([
+                dict(batch.items[i].model_dump(exclude={"id"}), school_id=ids[i]) for i in valid
+            ])
+
+        result = await apply_batch(ids, errors, batch.atomic, status.HTTP_200_OK, apply)
+        logger.info("Bulk updated schools", extra={'ok': len(ids) - len(errors), 'failed': len(errors)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk updating schools", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to update schools")
+
+@app.post("/schools/bulk/delete", response_model=BulkResponse)
+async def delete_schools_bulk(batch: BulkDelete):
+    """Удалить школы пакетом (вместе с их студентами)"""
+    try:
+        errors = await not_found_errors(batch.ids, schools_repo.get_school, "School not found")
+
+        async def apply(valid: List[int]):
+            await schools_repo.delete_schools([batch.ids[i] for i in valid])
+
+        result = await apply_batch(batch.ids, errors, batch.atomic, status.HTTP_204_NO_CONTENT, apply)
+        logger.info("Bulk deleted schools", extra={'ok': len(batch.ids) - len(errors), 'failed': len(errors)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk deleting schools", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to delete schools")
+
+@app.post("/students/bulk", response_model=BulkResponse)
+async def create_students_bulk(batch: StudentBulkCreate):
+    """Создать студентов пакетом"""
+    try:
+        missing = await missing_schools(item.school_id for item in batch.items)
+        errors = {index: (status.HTTP_400_BAD_REQUEST, "School not found")
+                  for index, item in enumerate(batch.items) if item.school_id in missing}
+        ids: List[Optional[str]] = [None] * len(batch.items)
+
+        async def apply(valid: List[int]):
+            students = await students_repo.create_students([batch.items[i].model_dump() for i in valid])
+            for index, student in zip(valid, students):
+                ids[index] = student.id
+
+        result = await apply_batch(ids, errors, batch.atomic, status.HTTP_201_CREATED, apply)
+        logger.info("Bulk created students", extra={'ok': len(ids) - len(errors), 'failed': len(errors)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk creating students", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to create students")
+
+@app.put("/students/bulk", response_model=BulkResponse)
+async def update_students_bulk(batch: StudentBulkUpdate):
+    """Обновить студентов пакетом"""
+    try:
+        ids = [item.id for item in batch.items]
+        missing = await missing_schools(item.school_id for item in batch.items if item.school_id)
+        errors = {}
+        for index, item in enumerate(batch.items):
+            if not await students_repo.get_student(item.id):
+                errors[index] = (status.HTTP_404_NOT_FOUND, "Student not found")
+            elif item.school_id in missing:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, "School not found")
+
+        async def apply(valid: List[int]):
+            await students_repo.update_students([
+                dict(batch.items[i].model_dump(exclude={"id"}), student_id=ids[i]) for i in valid
+            ])
+
+        result = await apply_batch(ids, errors, batch.atomic, status.HTTP_200_OK, apply)
+        logger.info("Bulk updated students", extra={'ok': len(ids) - len(errors), 'failed': len(errors)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk updating students", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to update students")
+
+@app.post("/students/bulk/delete", response_model=BulkResponse)
+async def delete_students_bulk(batch: BulkDelete):
+    """Удалить студентов пакетом"""
+    try:
+        errors = await not_found_errors(batch.ids, students_repo.get_student, "Student not found")
+
+        async def apply(valid: List[int]):
+            await students_repo.delete_students([batch.ids[i] for i in valid])
+
+        result = await apply_batch(batch.ids, errors, batch.atomic, status.HTTP_204_NO_CONTENT, apply)
+        logger.info("Bulk deleted students", extra={'ok': len(batch.ids) - len(errors), 'failed': len(errors)})
+        return result
+    except Exception as e:
+        logger.error("Error bulk deleting students", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to delete students")
+
+# Export and import of the whole dataset (see app.transfer)
+@app.get("/export")
+async def export_data(format: Literal["ndjson", "csv"] = Query("ndjson", description="Формат файла")):
+    """Выгрузить все школы и студентов на один момент времени: NDJSON или CSV, сжатые gzip"""
+    try:
+        filename = f"export-{datetime.now():%Y%m%d-%H%M%S}.{format}.gz"
+        return StreamingResponse(
+            transfer.export_stream(repository.export_batches(transfer.BATCH_ROWS), format, students_repo.executor),
+            media_type=transfer.MEDIA_TYPE, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    except Exception as e:
+        logger.error("Error exporting data", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to export data")
+
+@app.post("/import", response_model=ImportResponse)
+async def import_data(request: Request, format: Literal["ndjson", "csv"] = Query("ndjson", description="Формат файла")):
+    """Загрузить школы и студентов из файла /export (gzip или без сжатия) с их ID и датами;
+    записи с существующими ID заменяются"""
+    try:
+        return await transfer.import_stream(request.stream(), format, students_repo.executor)
+    except (ValueError, zlib.error) as e:
+        # Unreadable upload: bad gzip data, invalid UTF-8 or a truncated file
+        logger.warning("Rejected import", extra={'error': str(e)})
+        raise HTTPException(status_code=400, detail=f"Unreadable upload: {e}")
+    except Exception as e:
+        logger.error("Error importing data", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to import data")
+
 # School endpoints
 @app.post("/schools", response_model=SchoolResponse, status_code=status.HTTP_201_CREATED)
 async def create_school(school_data: SchoolCreate):
     """Создать новую школу"""
     try:
-        school = SchoolRepository.create_school(
+        school = await schools_repo.create_school(
             name=school_data.name,
             address=school_data.address,
             phone=school_data.phone
         )
-        logger.info(f"Created school: {school.id}")
-        return school.to_dict()
+        logger.info("Created school", extra={'school_id': school.id})
+        return entity_response(school, status.HTTP_201_CREATED)
     except Exception as e:
-        logger.error(f"Error creating school: {e}")
+        logger.error("Error creating school", extra={'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to create school")
 
 @app.get("/schools", response_model=List[SchoolResponse])
-async def get_all_schools():
-    """Получить все школы"""
+async def get_all_schools(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы"),
+    after: Optional[str] = Query(None, description="Курсор: ID последней школы предыдущей страницы"),
+    q: Optional[str] = Query(None, min_length=1, max_length=MAX_QUERY_LENGTH,
+                             description="Поиск по названию и адресу (подстрока, без учёта регистра)"),
+    ids: Optional[str] = Query(None, description=f"ID школ через запятую (до {MAX_IDS})"),
+):
+    """Получить все школы (постранично с ?limit=&after=, потоком NDJSON, с поиском ?q=, по списку ?ids=)"""
     try:
-        schools = SchoolRepository.get_all_schools()
-        return [school.to_dict() for school in schools]
+        if q and ids:
+            raise HTTPException(status_code=400, detail="Use either q or ids")
+        if ids:
+            fetch_page, fetch_all = id_pages([listed(parse_ids(ids))], schools_repo.get_schools_by_ids)
+        elif q:
+            fetch_page, fetch_all = id_pages([searched(search.schools, q)], schools_repo.get_schools_by_ids)
+        else:
+            fetch_page, fetch_all = schools_repo.get_schools_page, schools_repo.get_all_schools
+        return await paginate(fetch_page, fetch_all, request, after, limit, versions.schools)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting schools: {e}")
+        logger.error("Error getting schools", extra={'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to get schools")
 
 @app.get("/schools/{school_id}", response_model=SchoolResponse)
-async def get_school(school_id: str):
+async def get_school(school_id: str, request: Request):
     """Получить школу по ID"""
     try:
-        school = SchoolRepository.get_school(school_id)
+        school = await schools_repo.get_school(school_id)
         if not school:
             raise HTTPException(status_code=404, detail="School not found")
-        return school.to_dict()
+        return entity_get_response(request, school)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting school {school_id}: {e}")
+        logger.error("Error getting school", extra={'school_id': school_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to get school")
 
 @app.put("/schools/{school_id}", response_model=SchoolResponse)
-async def update_school(school_id: str, school_data: SchoolUpdate):
-    """Обновить школу"""
+async def update_school(school_id: str, school_data: SchoolUpdate, request: Request):
+    """Обновить школу (с If-Match — только если версия не изменилась)"""
     try:
-        school = SchoolRepository.update_school(
+        school = await schools_repo.update_school(
             school_id=school_id,
             name=school_data.name,
             address=school_data.address,
-            phone=school_data.phone
+            phone=school_data.phone,
+            expected_version=await expected_version(request, schools_repo.get_school, school_id)
         )
         if not school:
             raise HTTPException(status_code=404, detail="School not found")
-        logger.info(f"Updated school: {school_id}")
-        return school.to_dict()
+        logger.info("Updated school", extra={'school_id': school_id})
+        return entity_response(school)
     except HTTPException:
         raise
+    except VersionConflict:
+        raise precondition_failed()
     except Exception as e:
-        logger.error(f"Error updating school {school_id}: {e}")
+        logger.error("Error updating school", extra={'school_id': school_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to update school")
 
 @app.delete("/schools/{school_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_school(school_id: str):
-    """Удалить школу"""
+async def delete_school(school_id: str, request: Request):
+    """Удалить школу (с If-Match — только если версия не изменилась)"""
     try:
-        success = SchoolRepository.delete_school(school_id)
+        success = await schools_repo.delete_school(
+            school_id, expected_version=await expected_version(request, schools_repo.get_school, school_id))
         if not success:
             raise HTTPException(status_code=404, detail="School not found")
-        logger.info(f"Deleted school: {school_id}")
+        logger.info("Deleted school", extra={'school_id': school_id})
     except HTTPException:
         raise
+    except VersionConflict:
+        raise precondition_failed()
     except Exception as e:
-        logger.error(f"Error deleting school {school_id}: {e}")
+        logger.error("Error deleting school", extra={'school_id': school_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to delete school")
 
 # Student endpoints
@@ -166,108 +733,235 @@ async def create_student(student_data: StudentCreate):
     """Создать нового студента"""
     try:
         # Verify school exists
-        school = SchoolRepository.get_school(student_data.school_id)
+        school = await schools_repo.get_school(student_data.school_id)
         if not school:
             raise HTTPException(status_code=400, detail="School not found")
         
-        student = StudentRepository.create_student(
+        student = await students_repo.create_student(
             first_name=student_data.first_name,
             last_name=student_data.last_name,
             age=student_data.age,
             school_id=student_data.school_id,
             grade=student_data.grade
         )
-        logger.info(f"Created student: {student.id}")
-        return student.to_dict()
+        logger.info("Created student", extra={'student_id': student.id})
+        return entity_response(student, status.HTTP_201_CREATED)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating student: {e}")
+        logger.error("Error creating student", extra={'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to create student")
 
 @app.get("/students", response_model=List[StudentResponse])
-async def get_all_students():
-    """Получить всех студентов"""
+async def get_all_students(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы"),
+    after: Optional[str] = Query(None, description="Курсор: ID последнего студента предыдущей страницы"),
+    q: Optional[str] = Query(None, min_length=1, max_length=MAX_QUERY_LENGTH,
+                             description="Поиск по имени и фамилии (подстрока, без учёта регистра)"),
+    ids: Optional[str] = Query(None, description=f"ID студентов через запятую (до {MAX_IDS})"),
+    expand: Optional[Literal["school"]] = Query(None, description="Вложить школу в каждого студента"),
+    created_after: Optional[datetime] = Query(None, description="Созданные позже этого момента"),
+    created_before: Optional[datetime] = Query(None, description="Созданные раньше этого момента"),
+    updated_after: Optional[datetime] = Query(None, description="Изменённые позже этого момента"),
+    updated_before: Optional[datetime] = Query(None, description="Изменённые раньше этого момента"),
+    school_id: Optional[str] = Query(None, min_length=1, description="Только студенты этой школы"),
+    grade: Optional[str] = Query(None, min_length=1, description="Только студенты этого класса"),
+    age_min: Optional[int] = Query(None, ge=0, description="Возраст не меньше"),
+    age_max: Optional[int] = Query(None, ge=0, description="Возраст не больше"),
+    sort: Optional[StudentSort] = Query(None, description="Порядок по полю, с минусом — по убыванию (по умолчанию по ID)"),
+):
+    """Получить всех студентов (постранично с ?limit=&after=, потоком NDJSON, с поиском ?q=, по списку ?ids=,
+    по времени создания и изменения ?created_after=&updated_after=..., по школе, классу и возрасту
+    ?school_id=&grade=&age_min=&age_max=, в порядке ?sort=)"""
     try:
-        students = StudentRepository.get_all_students()
-        return [student.to_dict() for student in students]
+        bounds = time_bounds(created_after=created_after, created_before=created_before,
+                             updated_after=updated_after, updated_before=updated_before)
+        filters = {name: value for name, value in (("school_id", school_id), ("grade", grade), ("age_min", age_min),
+                                                   ("age_max", age_max)) if value is not None}
+        if age_min is not None and age_max is not None and age_min > age_max:
+            raise HTTPException(status_code=400, detail="age_min cannot exceed age_max")
+        if ids and (q or bounds or filters):
+            raise HTTPException(status_code=400, detail="ids cannot be combined with q or other filters")
+        if ids:
+            selectors = [listed(parse_ids(ids))]
+        else:
+            # Search, time range and field filters together: the students matching all of them
+            selectors = [searched(search.students, q)] if q else []
+            if bounds:
+                selectors.append(student_time_range(bounds))
+            if filters or (sort and not selectors):
+                selectors.append(student_filter(filters))
+        if selectors:
+            order = sorted_by(sort, students_repo.get_students_by_ids) if sort else None
+            fetch_page, fetch_all = id_pages(selectors, students_repo.get_students_by_ids, order)
+        else:
+            fetch_page, fetch_all = students_repo.get_students_page, students_repo.get_all_students
+        return await paginate(fetch_page, fetch_all, request, after, limit, versions.students,
+                              student_encoder(expand), versions.schools if expand else None)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting students: {e}")
+        logger.error("Error getting students", extra={'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to get students")
 
 @app.get("/students/{student_id}", response_model=StudentResponse)
-async def get_student(student_id: str):
-    """Получить студента по ID"""
+async def get_student(
+    student_id: str,
+    request: Request,
+    expand: Optional[Literal["school"]] = Query(None, description="Вложить школу студента"),
+):
+    """Получить студента по ID (со школой при ?expand=school)"""
     try:
-        student = StudentRepository.get_student(student_id)
+        student = await students_repo.get_student(student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
-        return student.to_dict()
+        if expand == EXPAND_SCHOOL:
+            school = await schools_repo.get_school(student.school_id)
+            if school:
+                return entity_get_response(request, student, school)
+        return entity_get_response(request, student)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting student {student_id}: {e}")
+        logger.error("Error getting student", extra={'student_id': student_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to get student")
 
 @app.get("/schools/{school_id}/students", response_model=List[StudentResponse])
-async def get_students_by_school(school_id: str):
-    """Получить всех студентов школы"""
+async def get_students_by_school(
+    school_id: str,
+    request: Request,
+    expand: Optional[Literal["school"]] = Query(None, description="Вложить школу в каждого студента"),
+):
+    """Получить всех студентов школы (со школой при ?expand=school)"""
     try:
         # Verify school exists
-        school = SchoolRepository.get_school(school_id)
+        school = await schools_repo.get_school(school_id)
         if not school:
             raise HTTPException(status_code=404, detail="School not found")
         
-        students = StudentRepository.get_students_by_school(school_id)
-        return [student.to_dict() for student in students]
+        headers, cached = collection_response(request, versions.for_school(school_id),
+                                              versions.schools if expand else None)
+        if cached:
+            return cached
+        students = await students_repo.get_students_by_school(school_id)
+        if expand == EXPAND_SCHOOL:
+            # Every student here has the same school, already fetched
+            school_json = school.to_json()
+            return list_response([embed(student.to_json(), b"school", school_json) for student in students], headers)
+        return list_response([student.to_json() for student in students], headers)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting students for school {school_id}: {e}")
+        logger.error("Error getting students for school", extra={'school_id': school_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to get students")
 
 @app.put("/students/{student_id}", response_model=StudentResponse)
-async def update_student(student_id: str, student_data: StudentUpdate):
-    """Обновить студента"""
+async def update_student(student_id: str, student_data: StudentUpdate, request: Request):
+    """Обновить студента (с If-Match — только если версия не изменилась)"""
     try:
         # Verify school exists if school_id is being updated
         if student_data.school_id:
-            school = SchoolRepository.get_school(student_data.school_id)
+            school = await schools_repo.get_school(student_data.school_id)
             if not school:
                 raise HTTPException(status_code=400, detail="School not found")
         
-        student = StudentRepository.update_student(
+        student = await students_repo.update_student(
             student_id=student_id,
             first_name=student_data.first_name,
             last_name=student_data.last_name,
             age=student_data.age,
             school_id=student_data.school_id,
-            grade=student_data.grade
+            grade=student_data.grade,
+            expected_version=await expected_version(request, students_repo.get_student, student_id)
         )
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
-        logger.info(f"Updated student: {student_id}")
-        return student.to_dict()
+        logger.info("Updated student", extra={'student_id': student_id})
+        return entity_response(student)
     except HTTPException:
         raise
+    except VersionConflict:
+        raise precondition_failed()
     except Exception as e:
-        logger.error(f"Error updating student {student_id}: {e}")
+        logger.error("Error updating student", extra={'student_id': student_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to update student")
 
 @app.delete("/students/{student_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_student(student_id: str):
-    """Удалить студента"""
+async def delete_student(student_id: str, request: Request):
+    """Удалить студента (с If-Match — только если версия не изменилась)"""
     try:
-        success = StudentRepository.delete_student(student_id)
+        success = await students_repo.delete_student(
+            student_id, expected_version=await expected_version(request, students_repo.get_student, student_id))
         if not success:
             raise HTTPException(status_code=404, detail="Student not found")
-        logger.info(f"Deleted student: {student_id}")
+        logger.info("Deleted student", extra={'student_id': student_id})
     except HTTPException:
         raise
+    except VersionConflict:
+        raise precondition_failed()
     except Exception as e:
-        logger.error(f"Error deleting student {student_id}: {e}")
+        logger.error("Error deleting student", extra={'student_id': student_id, 'error': str(e)})
         raise HTTPException(status_code=500, detail="Failed to delete student")
 
+# Change feed
+@app.get("/changes")
+async def get_changes(
+    request: Request,
+    since: Optional[str] = Query(None, description="ID последнего полученного события (как Last-Event-ID)"),
+):
+    """Поток изменений школ и студентов (Server-Sent Events)"""
+    try:
+        cursor = changes.feed.cursor(since or request.headers.get("last-event-id"))
+    except changes.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid event id")
+    return StreamingResponse(changes.feed.stream(cursor), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Replication: internal endpoints served by the leader to followers, status for readiness probes
+@app.get("/replication/snapshot", include_in_schema=False)
+async def get_replication_snapshot():
+    if replication.log is None:
+        raise HTTPException(status_code=404, detail="Not a replication leader")
+    return StreamingResponse(replication.log.snapshot(), media_type=replication.MEDIA_TYPE)
+
+@app.get("/replication/stream", include_in_schema=False)
+async def get_replication_stream(boot: str, after: int = Query(..., ge=0)):
+    if replication.log is None:
+        raise HTTPException(status_code=404, detail="Not a replication leader")
+    if not replication.log.can_resume(boot, after):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Position is no longer in the log")
+    return StreamingResponse(replication.log.stream(after), media_type=replication.MEDIA_TYPE)
+
+@app.get("/replication/status", include_in_schema=False)
+async def get_replication_status():
+    status_code, body = replication.status()
+    return JSONResponse(body, status_code=status_code)
+
+# Stats endpoints
+@app.get("/stats", response_model=StatsResponse)
+async def get_stats():
+    """Сводная статистика: число школ и студентов, распределение по классам и возрастам"""
+    try:
+        return stats.overall()
+    except Exception as e:
+        logger.error("Error getting stats", extra={'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to get stats")
+
+@app.get("/schools/{school_id}/stats", response_model=SchoolStatsResponse)
+async def get_school_stats(school_id: str):
+    """Статистика школы: число студентов, распределение по классам и возрастам"""
+    try:
+        school = await schools_repo.get_school(school_id)
+        if not school:
+            raise HTTPException(status_code=404, detail="School not found")
+        return stats.for_school(school_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting stats for school", extra={'school_id': school_id, 'error': str(e)})
+        raise HTTPException(status_code=500, detail="Failed to get stats")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""Prometheus metrics behind GET /metrics.
+
+Collected in process, rendered in the Prometheus text format on scrape:
+
+  http_requests_total{method,route,status}          counter
+  http_request_duration_seconds{method,route}       histogram
+  repository_call_duration_seconds{repository,method}  histogram
+  schools, students                                 gauges (record counts)
+  process_resident_memory_bytes                     gauge
+  log_records_dropped_total                         counter (see app.logs)
+  replication_seq, replication_staleness_seconds   gauges (see app.replication)
+  admission_rejected_total{reason}                  counter (see app.admission)
+  event_loop_lag_seconds                            gauge (with ADMISSION_MAX_LAG)
+  compressed_responses_total{encoding}              counter (see app.compression)
+  compression_bytes_in_total, _out_total            counters
+  compression_cache_hits_total                      counter
+
+`route` is the path template (/students/{student_id}), never the raw path,
+so label cardinality stays bounded. Recording is kept to a couple of dict
+lookups and a bisect per observation: everything runs on the event loop
+thread, so no locking is needed.
+"""
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, List, Tuple
+import os
+
+from app import admission, compression, logs, replication, stats
+
+# Starlette appends "; charset=utf-8" to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Upper bounds (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+requests_total: Dict[Tuple[str, str, int], int] = {}
+request_duration: Dict[Tuple[str, str], Histogram] = {}
+repository_duration: Dict[Tuple[str, str], Histogram] = {}
+
+# endpoint function -> route path template, filled in on first sight of each endpoint
+_route_paths: Dict[object, str] = {}
+
+
+def _route(scope) -> str:
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    path = _route_paths.get(endpoint)
+    if path is None:
+        path = UNMATCHED_ROUTE
+        for route in scope['app'].routes:
+            if getattr(route, 'endpoint', None) is endpoint:
+                path = route.path
+                break
+        _route_paths[endpoint] = path
+    return path
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: per-route request counts, status codes and latency, and the access log"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            # The router has written the matched endpoint into scope by now
+            route = _route(scope)
+            key = (scope['method'], route, status_code)
+            requests_total[key] = requests_total.get(key, 0) + 1
+            histogram = request_duration.get(key[:2])
+            if histogram is None:
+                histogram = request_duration[key[:2]] = Histogram()
+            histogram.observe(elapsed)
+            logs.access(scope, route, status_code, elapsed)
+
+
+def repository_histogram(repository: str, method: str) -> Histogram:
+    histogram = repository_duration.get((repository, method))
+    if histogram is None:
+        histogram = repository_duration[(repository, method)] = Histogram()
+    return histogram
+
+
+def _rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux; the best available without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def _render_histograms(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                       histograms: Dict[Tuple, Histogram]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for values, histogram in sorted(histograms.items()):
+        labels = _labels(label_names, values)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += histogram.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+
+def _render_gauge(lines: List[str], name: str, help_text: str, value) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {value}")
+
+
+def render() -> bytes:
+    lines = [
+        "# HELP http_requests_total HTTP requests by method, route and status",
+        "# TYPE http_requests_total counter",
+    ]
+    for values, count in sorted(requests_total.items()):
+        lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), values)}}} {count}")
+    _render_histograms(lines, "http_request_duration_seconds", "HTTP request latency",
+                       ("method", "route"), request_duration)
+    _render_histograms(lines, "repository_call_duration_seconds", "Repository call latency",
+                       ("repository", "method"), repository_duration)
+    totals = stats.overall()
+    _render_gauge(lines, "schools", "Stored schools", totals['schools'])
+    _render_gauge(lines, "students", "Stored students", totals['students'])
+    _render_gauge(lines, "process_resident_memory_bytes", "Resident memory size", _rss_bytes())
+    lines.append("# HELP log_records_dropped_total Log records dropped because the log queue was full")
+    lines.append("# TYPE log_records_dropped_total counter")
+    lines.append(f"log_records_dropped_total {logs.dropped()}")
+    lines.append("# HELP admission_rejected_total Requests turned away by admission control")
+    lines.append("# TYPE admission_rejected_total counter")
+    for reason, count in sorted(admission.rejected.items()):
+        lines.append(f'admission_rejected_total{{reason="{reason}"}} {count}')
+    if admission.lag_monitor is not None:
+        _render_gauge(lines, "event_loop_lag_seconds", "Event loop lag seen by admission control",
+                      round(admission.lag_monitor.lag, 4))
+    lines.append("# HELP compressed_responses_total Responses sent compressed, by encoding")
+    lines.append("# TYPE compressed_responses_total counter")
+    for encoding, count in sorted(compression.responses.items()):
+        lines.append(f'compressed_responses_total{{encoding="{encoding}"}} {count}')
+    for name, key, help_text in (
+        ("compression_bytes_in_total", "bytes_in", "Response bytes before compression"),
+        ("compression_bytes_out_total", "bytes_out", "Response bytes after compression"),
+        ("compression_cache_hits_total", "cache_hits", "Compressed bodies served from the cache"),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {compression.stats[key]}")
+    if replication.log is not None:
+        _render_gauge(lines, "replication_seq", "Last replication log position", replication.log.seq)
+    elif replication.follower is not None and replication.follower.ready:
+        _render_gauge(lines, "replication_seq", "Last applied replication log position", replication.follower.seq)
+        _render_gauge(lines, "replication_staleness_seconds", "Seconds since the last message from the leader",
+                      round(replication.follower.staleness, 3))
+    return ("\n".join(lines) + "\n").encode()
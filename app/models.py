@@ -1,15 +1,120 @@
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
-import uuid
+from functools import lru_cache
+from bisect import bisect_left, bisect_right, insort
+import base64
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+# Timestamps are kept as integer microseconds since the epoch and only
+# formatted to ISO strings (local time, as before) when serialized.
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+# Records made together share their second, and the local time conversion is most of the cost
+@lru_cache(maxsize=4096)
+def _format_seconds(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds).isoformat()
+
+def _format_us(us: int) -> str:
+    seconds, micros = divmod(us, 1_000_000)
+    return f'{_format_seconds(seconds)}.{micros:06d}' if micros else _format_seconds(seconds)
+
+def datetime_us(dt: datetime) -> int:
+    # A naive datetime is local time, like the serialized created_at/updated_at. The float
+    # timestamp is exact to well under a microsecond, so its floor is the whole second.
+    return math.floor(dt.timestamp()) * 1_000_000 + dt.microsecond
+
+def _parse_iso(value: str) -> int:
+    return datetime_us(datetime.fromisoformat(value))
+
+# Same output as FastAPI's JSONResponse, so cached bytes can be sent as they are
+def encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+# Ids are time-ordered (ULID layout): a 48-bit millisecond timestamp and 80 random bits in
+# Crockford base32, 26 characters against 36 for a UUID string. Within one millisecond the random
+# part is incremented, so ids from one process sort in creation order and a new id lands at the
+# end of the sorted key lists. Ids made earlier (UUIDs) stay valid; they only sort apart.
+_TO_CROCKFORD = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', b'0123456789ABCDEFGHJKMNPQRSTVWXYZ')
+# The last two characters are the low 10 bits; the 24 before them change once per 1024 ids at most
+_ID_TAILS = [a + b for a in '0123456789ABCDEFGHJKMNPQRSTVWXYZ' for b in '0123456789ABCDEFGHJKMNPQRSTVWXYZ']
+_id_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+_id_prefix = ''
+
+def _encode_id(value: int) -> str:
+    # 160 bits in base32 are 32 characters; the first 6 cover the zero padding above the 128-bit value
+    return base64.b32encode(value.to_bytes(20, 'big'))[6:].translate(_TO_CROCKFORD).decode()
+
+def new_id() -> str:
+    global _last_ms, _last_random, _id_prefix
+    with _id_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms, _last_random = ms, int.from_bytes(os.urandom(10), 'big')
+            _id_prefix = ''
+        else:
+            # Same millisecond, or the clock stepped back: keep counting from the last id
+            _last_random += 1
+            if _last_random >> 80:
+                _last_ms, _last_random = _last_ms + 1, 0
+            if not _last_random & 1023:
+                _id_prefix = ''
+        if not _id_prefix:
+            _id_prefix = _encode_id(_last_ms << 80 | _last_random)[:24]
+        return _id_prefix + _ID_TAILS[_last_random & 1023]
 
 class School:
+    # _json caches the encoded record; anything that changes a field must end with touch(),
+    # which also bumps the monotonically increasing version used for ETags.
+    # A stored record is never changed: updates change a copy() and store that in its place.
+    __slots__ = ('id', 'name', 'address', 'phone', '_created_us', '_updated_us', 'version', '_json')
+    
     def __init__(self, name: str, address: str, phone: str):
-        self.id = str(uuid.uuid4())
+        self.id = new_id()
         self.name = name
         self.address = address
         self.phone = phone
-        self.created_at = datetime.now().isoformat()
-        self.updated_at = datetime.now().isoformat()
+        self._created_us = self._updated_us = now_us()
+        self.version = 1
+        self._json = None
+    
+    @property
+    def created_at(self) -> str:
+        return _format_us(self._created_us)
+    
+    @created_at.setter
+    def created_at(self, value: str) -> None:
+        self._created_us = _parse_iso(value)
+        self._json = None
+    
+    @property
+    def updated_at(self) -> str:
+        return _format_us(self._updated_us)
+    
+    @updated_at.setter
+    def updated_at(self, value: str) -> None:
+        self._updated_us = _parse_iso(value)
+        self._json = None
+    
+    @property
+    def created_us(self) -> int:
+        return self._created_us
+    
+    @property
+    def updated_us(self) -> int:
+        return self._updated_us
+    
+    def touch(self) -> None:
+        self._updated_us = now_us()
+        self.version += 1
+        self._json = None
     
     def to_dict(self) -> Dict:
         return {
@@ -21,24 +126,104 @@ class School:
             'updated_at': self.updated_at
         }
     
+    def to_json(self) -> bytes:
+        if self._json is None:
+            self._json = encode_json(self.to_dict())
+        return self._json
+    
+    def to_row(self) -> Tuple:
+        return (self.id, self.name, self.address, self.phone, self._created_us, self._updated_us, self.version)
+    
+    @classmethod
+    def from_row(cls, row: Tuple) -> 'School':
+        school = cls.__new__(cls)
+        (school.id, school.name, school.address, school.phone, school._created_us, school._updated_us,
+         school.version) = row
+        school._json = None
+        return school
+    
+    def copy(self) -> 'School':
+        return School.from_row(self.to_row())
+    
     @classmethod
     def from_dict(cls, data: Dict) -> 'School':
-        school = cls(data['name'], data['address'], data['phone'])
+        # Not through __init__: the id and timestamps it would make are replaced anyway
+        school = cls.__new__(cls)
         school.id = data['id']
-        school.created_at = data['created_at']
-        school.updated_at = data['updated_at']
+        school.name = data['name']
+        school.address = data['address']
+        school.phone = data['phone']
+        school._created_us = _parse_iso(data['created_at'])
+        school._updated_us = _parse_iso(data['updated_at'])
+        school.version = 1
+        school._json = None
         return school
 
 class Student:
+    # _json caches the encoded record; anything that changes a field must end with touch(),
+    # which also bumps the monotonically increasing version used for ETags.
+    # A stored record is never changed: updates change a copy() and store that in its place.
+    __slots__ = ('id', 'first_name', 'last_name', 'age', '_school_id', '_grade', '_created_us', '_updated_us',
+                 'version', '_json')
+    
     def __init__(self, first_name: str, last_name: str, age: int, school_id: str, grade: str):
-        self.id = str(uuid.uuid4())
+        self.id = new_id()
         self.first_name = first_name
         self.last_name = last_name
         self.age = age
         self.school_id = school_id
         self.grade = grade
-        self.created_at = datetime.now().isoformat()
-        self.updated_at = datetime.now().isoformat()
+        self._created_us = self._updated_us = now_us()
+        self.version = 1
+        self._json = None
+    
+    # school_id and grade repeat across many students, so one shared string is kept per value
+    @property
+    def school_id(self) -> str:
+        return self._school_id
+    
+    @school_id.setter
+    def school_id(self, value: str) -> None:
+        self._school_id = sys.intern(value)
+    
+    @property
+    def grade(self) -> str:
+        return self._grade
+    
+    @grade.setter
+    def grade(self, value: str) -> None:
+        self._grade = sys.intern(value)
+    
+    @property
+    def created_at(self) -> str:
+        return _format_us(self._created_us)
+    
+    @created_at.setter
+    def created_at(self, value: str) -> None:
+        self._created_us = _parse_iso(value)
+        self._json = None
+    
+    @property
+    def updated_at(self) -> str:
+        return _format_us(self._updated_us)
+    
+    @updated_at.setter
+    def updated_at(self, value: str) -> None:
+        self._updated_us = _parse_iso(value)
+        self._json = None
+    
+    @property
+    def created_us(self) -> int:
+        return self._created_us
+    
+    @property
+    def updated_us(self) -> int:
+        return self._updated_us
+    
+    def touch(self) -> None:
+        self._updated_us = now_us()
+        self.version += 1
+        self._json = None
     
     def to_dict(self) -> Dict:
         return {
@@ -52,77 +237,649 @@ class Student:
             'updated_at': self.updated_at
         }
     
+    def to_json(self) -> bytes:
+        if self._json is None:
+            self._json = encode_json(self.to_dict())
+        return self._json
+    
+    def to_row(self) -> Tuple:
+        return (self.id, self.first_name, self.last_name, self.age, self._school_id, self._grade,
+                self._created_us, self._updated_us, self.version)
+    
+    @classmethod
+    def from_row(cls, row: Tuple) -> 'Student':
+        # Rows come from storage (snapshot, log, SQLite); the interning setters are skipped on this hot path,
+        # marshal already keeps school_id/grade interned
+        student = cls.__new__(cls)
+        (student.id, student.first_name, student.last_name, student.age, student._school_id, student._grade,
+         student._created_us, student._updated_us, student.version) = row
+        student._json = None
+        return student
+    
+    def copy(self) -> 'Student':
+        return Student.from_row(self.to_row())
+    
     @classmethod
     def from_dict(cls, data: Dict) -> 'Student':
-        student = cls(data['first_name'], data['last_name'], data['age'], data['school_id'], data['grade'])
+        # Not through __init__: the id and timestamps it would make are replaced anyway
+        student = cls.__new__(cls)
         student.id = data['id']
-        student.created_at = data['created_at']
-        student.updated_at = data['updated_at']
+        student.first_name = data['first_name']
+        student.last_name = data['last_name']
+        student.age = data['age']
+        student._school_id = sys.intern(data['school_id'])
+        student._grade = sys.intern(data['grade'])
+        student._created_us = _parse_iso(data['created_at'])
+        student._updated_us = _parse_iso(data['updated_at'])
+        student.version = 1
+        student._json = None
         return student
 
+# Concurrency: writes are serialized by write_lock, which also keeps listener calls in commit order.
+# Readers take no lock. Stored records are immutable (an update swaps in a new version of the record),
+# and collection reads work on a copy of the ids they cover, looking each one up as it is now; ids
+# removed meanwhile are skipped. Any thread may read while another writes.
+write_lock = threading.RLock()
+
 # In-memory storage using dictionaries
 schools_db: Dict[str, School] = {}
 students_db: Dict[str, Student] = {}
 
+# Secondary index: school_id -> ordered set of student ids (dict keys keep insertion order)
+students_by_school: Dict[str, Dict[str, None]] = {}
+
+# Sorted id lists give collection endpoints a stable order for keyset (?after=) pagination
+school_keys: List[str] = []
+student_keys: List[str] = []
+
+def _discard_key(keys: List[str], key: str) -> None:
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+def _discard_keys(keys: List[str], removed: Iterable[str]) -> None:
+    removed = set(removed)
+    if len(removed) == 1:
+        _discard_key(keys, removed.pop())
+    elif removed:
+        keys[:] = [key for key in keys if key not in removed]
+
+def _merge_keys(keys: List[str], added: List[str]) -> None:
+    added = sorted(added)
+    if not added:
+        return
+    if not keys or keys[-1] < added[0]:
+        # All past the end, as ids of an export imported in order are: appended where they go
+        keys.extend(added)
+        return
+    # Timsort merges the already sorted prefix with the new run in linear time. The merge is built
+    # aside and swapped in: sorting in place would show concurrent readers an empty list meanwhile.
+    merged = keys + added
+    merged.sort()
+    keys[:] = merged
+
+# Entries per TimeIndex block: an insert or removal moves at most this many references
+TIME_BLOCK = 1000
+
+class TimeIndex:
+    """Ids ordered by a microsecond timestamp, for range queries in O(log n + matches).
+
+    A sorted list cut into blocks of up to 2 * TIME_BLOCK entries with the last timestamp of each
+    block kept aside (the layout of sortedcontainers.SortedList): one sorted list of a million
+    entries would shift half a million references on every update. Each block is a pair of parallel
+    lists holding references to the record's own timestamp and id objects, 16 bytes per entry.
+
+    Writers hold write_lock. A reader may see a block one entry apart while a write is under way,
+    so callers check the records they get back.
+    """
+
+    __slots__ = ('times', 'ids', 'maxes')
+
+    def __init__(self, times: List[int], ids: List[str]):
+        # Stable sort by timestamp alone: the input is usually close to time order already
+        order = sorted(range(len(times)), key=times.__getitem__)
+        times = [times[i] for i in order]
+        ids = [ids[i] for i in order]
+        self.times: List[List[int]] = [times[i:i + TIME_BLOCK] for i in range(0, len(times), TIME_BLOCK)]
+        self.ids: List[List[str]] = [ids[i:i + TIME_BLOCK] for i in range(0, len(ids), TIME_BLOCK)]
+        self.maxes: List[int] = [block[-1] for block in self.times]
+
+    def add(self, us: int, entity_id: str) -> None:
+        if not self.maxes:
+            self.times.append([us])
+            self.ids.append([entity_id])
+            self.maxes.append(us)
+            return
+        # New records carry the latest timestamp, so this lands at the end of the last block
+        b = min(bisect_right(self.maxes, us), len(self.maxes) - 1)
+        times, ids = self.times[b], self.ids[b]
+        i = bisect_right(times, us)
+        times.insert(i, us)
+        ids.insert(i, entity_id)
+        self.maxes[b] = times[-1]
+        if len(times) > 2 * TIME_BLOCK:
+            # Split into new lists, so a reader holding the old block sees it whole
+            self.times[b:b + 1] = [times[:TIME_BLOCK], times[TIME_BLOCK:]]
+            self.ids[b:b + 1] = [ids[:TIME_BLOCK], ids[TIME_BLOCK:]]
+            self.maxes[b:b + 1] = [times[TIME_BLOCK - 1], times[-1]]
+
+    def discard(self, us: int, entity_id: str) -> None:
+        # Entries with equal timestamps may run over several blocks
+        for b in range(bisect_left(self.maxes, us), len(self.maxes)):
+            times, ids = self.times[b], self.ids[b]
+            i = bisect_left(times, us)
+            while i < len(times) and times[i] == us:
+                if ids[i] == entity_id:
+                    del times[i]
+                    del ids[i]
+                    if times:
+                        self.maxes[b] = times[-1]
+                    else:
+                        del self.times[b], self.ids[b], self.maxes[b]
+                    return
+                i += 1
+            if i < len(times):
+                return
+
+    def between(self, after: Optional[int] = None, before: Optional[int] = None) -> List[str]:
+        """Ids with after < timestamp < before, in timestamp order"""
+        found: List[str] = []
+        blocks = list(zip(self.times, self.ids))
+        start = bisect_right(self.maxes, after) if after is not None else 0
+        for times, ids in blocks[start:]:
+            first = bisect_right(times, after) if after is not None else 0
+            if before is not None and times and times[-1] >= before:
+                found.extend(ids[first:bisect_left(times, before)])
+                break
+            found.extend(ids[first:])
+        return found
+
+# Students by created_at and by updated_at, for ?created_after=&updated_after=. Built on the first
+# range query and kept up to date from then on: a warm restart does not wait for them, and a
+# deployment that never filters by time keeps no index.
+students_by_created: Optional[TimeIndex] = None
+students_by_updated: Optional[TimeIndex] = None
+
+def _time_indexes() -> Tuple[TimeIndex, TimeIndex]:
+    global students_by_created, students_by_updated
+    if students_by_updated is None:
+        with write_lock:
+            if students_by_updated is None:
+                students = list(students_db.values())
+                ids = [student.id for student in students]
+                students_by_created = TimeIndex([student._created_us for student in students], ids)
+                students_by_updated = TimeIndex([student._updated_us for student in students], ids)
+    return students_by_created, students_by_updated
+
+def _time_index_student(student: Student) -> None:
+    if students_by_updated is not None:
+        students_by_created.add(student._created_us, student.id)
+        students_by_updated.add(student._updated_us, student.id)
+
+def _time_unindex_student(student: Student) -> None:
+    if students_by_updated is not None:
+        students_by_created.discard(student._created_us, student.id)
+        students_by_updated.discard(student._updated_us, student.id)
+
+# Students by grade and by age, for ?grade=&age_min=&age_max=. One bucket per value: ages take a
+# few values, so an age range is a handful of buckets. Like the time indexes, built on the first
+# filtered query and kept up to date from then on.
+students_by_grade: Optional[Dict[str, Dict[str, None]]] = None
+students_by_age: Optional[Dict[int, Dict[str, None]]] = None
+
+def _filter_indexes() -> Tuple[Dict[str, Dict[str, None]], Dict[int, Dict[str, None]]]:
+    global students_by_grade, students_by_age
+    if students_by_age is None:
+        with write_lock:
+            if students_by_age is None:
+                by_grade: Dict[str, Dict[str, None]] = {}
+                by_age: Dict[int, Dict[str, None]] = {}
+                for student in students_db.values():
+                    by_grade.setdefault(student.grade, {})[student.id] = None
+                    by_age.setdefault(student.age, {})[student.id] = None
+                students_by_grade = by_grade
+                students_by_age = by_age
+    return students_by_grade, students_by_age
+
+def _filter_index_student(student: Student) -> None:
+    if students_by_age is not None:
+        students_by_grade.setdefault(student.grade, {})[student.id] = None
+        students_by_age.setdefault(student.age, {})[student.id] = None
+
+def _filter_unindex_student(student: Student) -> None:
+    if students_by_age is not None:
+        _unbucket(students_by_grade, student.grade, student.id)
+        _unbucket(students_by_age, student.age, student.id)
+
+def _unbucket(index: Dict, key, entity_id: str) -> None:
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.pop(entity_id, None)
+        if not bucket:
+            del index[key]
+
+def _matches(student: Student, school_id: Optional[str], grade: Optional[str], age_min: Optional[int],
+             age_max: Optional[int]) -> bool:
+    return ((school_id is None or student.school_id == school_id) and (grade is None or student.grade == grade)
+            and (age_min is None or student.age >= age_min) and (age_max is None or student.age <= age_max))
+
+def _in_range(us: int, after: Optional[int], before: Optional[int]) -> bool:
+    return (after is None or us > after) and (before is None or us < before)
+
+def _lookup(db: Dict, ids: Iterable[str]) -> List:
+    # One get per id, so an id deleted between listing and lookup is skipped rather than a KeyError
+    return [entity for entity in map(db.get, ids) if entity is not None]
+
+def _page(keys: List[str], db: Dict, after: Optional[str], limit: int) -> List:
+    # Ids deleted between listing and lookup are skipped: read on until the page is full or the keys
+    # run out, so a short page always means the end
+    page: List = []
+    while len(page) < limit:
+        start = bisect_right(keys, after) if after is not None else 0
+        ids = keys[start:start + limit - len(page)]
+        if not ids:
+            break
+        page.extend(_lookup(db, ids))
+        after = ids[-1]
+    return page
+
+def _index_student(student: Student) -> None:
+    students_by_school.setdefault(student.school_id, {})[student.id] = None
+
+def _unindex_student(student: Student) -> None:
+    _unbucket(students_by_school, student.school_id, student.id)
+
+# Mutation listeners are called as listener(kind, op, entity, before) after every repository write.
+# kind is SCHOOL or STUDENT. For PUT, entity is the stored entity and before is a detached copy of
+# its previous state (None on create). For DELETE, entity is the removed entity and before is None.
+SCHOOL = 'school'
+STUDENT = 'student'
+PUT = 'put'
+DELETE = 'delete'
+
+Listener = Callable[[str, str, object, Optional[object]], None]
+_listeners: List[Listener] = []
+
+# A listener may come with a batch form, listener(kind, op, entities, befores), called once for a bulk
+# write (import) instead of once per record; listeners without one get the events one by one
+BatchListener = Callable[[str, str, List, List], None]
+_batch_listeners: Dict[Listener, BatchListener] = {}
+
+def add_listener(listener: Listener, batch: Optional[BatchListener] = None) -> None:
+    _listeners.append(listener)
+    if batch is not None:
+        _batch_listeners[listener] = batch
+
+def remove_listener(listener: Listener) -> None:
+    _listeners.remove(listener)
+    _batch_listeners.pop(listener, None)
+
+def emit(kind: str, op: str, entity, before=None) -> None:
+    for listener in _listeners:
+        listener(kind, op, entity, before)
+
+def emit_many(kind: str, op: str, entities: List, befores: List) -> None:
+    for listener in _listeners:
+        batch = _batch_listeners.get(listener)
+        if batch is not None:
+            batch(kind, op, entities, befores)
+        else:
+            for entity, before in zip(entities, befores):
+                listener(kind, op, entity, before)
+
+class VersionConflict(Exception):
+    """The entity exists but its version differs from the one the caller expected (If-Match)"""
+
+def _put_school(school: School) -> None:
+    if schools_db.get(school.id) is None:
+        insort(school_keys, school.id)
+    schools_db[school.id] = school
+
+def _put_student(student: Student) -> None:
+    previous = students_db.get(student.id)
+    if previous is None:
+        insort(student_keys, student.id)
+    students_db[student.id] = student
+    _reindex_student(student, previous)
+
+def _reindex_student(student: Student, previous: Optional[Student]) -> None:
+    # Reindexed only on a school change, so the student keeps its place in the school's list
+    if previous is None or previous.school_id != student.school_id:
+        if previous is not None:
+            _unindex_student(previous)
+        _index_student(student)
+    if previous is None or previous.grade != student.grade or previous.age != student.age:
+        if previous is not None:
+            _filter_unindex_student(previous)
+        _filter_index_student(student)
+    if previous is not None:
+        _time_unindex_student(previous)
+    _time_index_student(student)
+
+def _replace(db: Dict, keys: List[str], entities: List) -> List[Optional[object]]:
+    """Store entities that keep their ids: a stored one with the same id is replaced, its version
+    carried on so validators handed out for it stop matching. Returns what each one replaced."""
+    befores = []
+    added = []
+    for entity in entities:
+        before = db.get(entity.id)
+        if before is None:
+            added.append(entity.id)
+        else:
+            entity.version = before.version + 1
+        db[entity.id] = entity
+        befores.append(before)
+    # New ids merged in one pass: inserting a million imported ids one by one would shift the list each time
+    _merge_keys(keys, added)
+    return befores
+
+def _delete_schools(school_ids: List[str]) -> Tuple[List[Optional[School]], List[Student]]:
+    removed = []
+    orphans = []
+    for school_id in school_ids:
+        school = schools_db.pop(school_id, None)
+        if school:
+            # Cascade: drop the school's students so none of them is left orphaned
+            orphans.extend(students_db.pop(student_id) for student_id in students_by_school.pop(school_id, {}))
+        removed.append(school)
+    _discard_keys(school_keys, [school.id for school in removed if school])
+    _discard_keys(student_keys, [student.id for student in orphans])
+    for student in orphans:
+        _filter_unindex_student(student)
+        _time_unindex_student(student)
+    return removed, orphans
+
+def _delete_students(student_ids: List[str]) -> List[Optional[Student]]:
+    removed = []
+    for student_id in student_ids:
+        student = students_db.pop(student_id, None)
+        if student:
+            _unindex_student(student)
+            _filter_unindex_student(student)
+            _time_unindex_student(student)
+        removed.append(student)
+    _discard_keys(student_keys, [student.id for student in removed if student])
+    return removed
+
+def _check_version(entity, expected_version: Optional[int]) -> None:
+    if entity and expected_version is not None and entity.version != expected_version:
+        raise VersionConflict(entity.id)
+
+# Replay entry points (snapshot load, log replay): they change the store without notifying listeners
+def load_snapshot(schools: Iterable[School], students: Iterable[Student]) -> None:
+    global schools_db, students_db, students_by_school, school_keys, student_keys
+    global students_by_created, students_by_updated, students_by_grade, students_by_age
+    # Built aside and swapped in (a replication follower reloads while serving reads)
+    new_schools = {school.id: school for school in schools}
+    new_students = {student.id: student for student in students}
+    new_index: Dict[str, Dict[str, None]] = {}
+    for student in new_students.values():
+        bucket = new_index.get(student._school_id)
+        if bucket is None:
+            bucket = new_index[student._school_id] = {}
+        bucket[student.id] = None
+    with write_lock:
+        schools_db, students_db, students_by_school = new_schools, new_students, new_index
+        school_keys, student_keys = sorted(new_schools), sorted(new_students)
+        # Rebuilt from the new records on the next range or filtered query
+        students_by_created = students_by_updated = None
+        students_by_grade = students_by_age = None
+
+def replay_put(kind: str, entity) -> None:
+    with write_lock:
+        if kind == SCHOOL:
+            _put_school(entity)
+        else:
+            _put_student(entity)
+
+def replay_delete(kind: str, entity_id: str) -> None:
+    with write_lock:
+        if kind == SCHOOL:
+            _delete_schools([entity_id])
+        else:
+            _delete_students([entity_id])
+
+# Point-in-time export: references to both stores taken together under the write lock, then handed
+# out batch by batch. Stored records are never changed in place, so the batches are exactly the
+# state at that moment however long the caller takes; only the references are copied, not the records.
+def export_batches(batch_size: int) -> Iterator[Tuple[str, List]]:
+    with write_lock:
+        entities = [(SCHOOL, list(schools_db.values())), (STUDENT, list(students_db.values()))]
+    for kind, items in entities:
+        for start in range(0, len(items), batch_size):
+            yield kind, items[start:start + batch_size]
+
+# Replication followers apply the leader's log: the same changes as replay, but with the notifications
+# a local write makes, so listener-fed state (search, stats, versions, change feed) follows along
+def apply_put(kind: str, entity) -> None:
+    with write_lock:
+        # Stored records are replaced, never changed, so the one being replaced is the before state
+        before = (schools_db if kind == SCHOOL else students_db).get(entity.id)
+        replay_put(kind, entity)
+        emit(kind, PUT, entity, before)
+
+def apply_delete(kind: str, entity_id: str) -> None:
+    with write_lock:
+        if kind == SCHOOL:
+            removed, orphans = _delete_schools([entity_id])
+            for student in orphans:
+                emit(STUDENT, DELETE, student)
+        else:
+            removed = _delete_students([entity_id])
+        if removed[0]:
+            emit(kind, DELETE, removed[0])
+
 class SchoolRepository:
     @staticmethod
     def create_school(name: str, address: str, phone: str) -> School:
         school = School(name, address, phone)
-        schools_db[school.id] = school
+        with write_lock:
+            schools_db[school.id] = school
+            insort(school_keys, school.id)
+            emit(SCHOOL, PUT, school)
         return school
     
+    @staticmethod
+    def create_schools(items: List[Dict]) -> List[School]:
+        schools = [School(**item) for item in items]
+        with write_lock:
+            schools_db.update((school.id, school) for school in schools)
+            _merge_keys(school_keys, [school.id for school in schools])
+            for school in schools:
+                emit(SCHOOL, PUT, school)
+        return schools
+    
+    @staticmethod
+    def import_schools(schools: List[School]) -> None:
+        """Store schools as they are, ids and timestamps included; the last of one id wins"""
+        schools = list({school.id: school for school in schools}.values())
+        with write_lock:
+            befores = _replace(schools_db, school_keys, schools)
+            emit_many(SCHOOL, PUT, schools, befores)
+    
     @staticmethod
     def get_school(school_id: str) -> Optional[School]:
         return schools_db.get(school_id)
     
+    @staticmethod
+    def get_schools_by_ids(school_ids: List[str]) -> List[School]:
+        return _lookup(schools_db, school_ids)
+    
     @staticmethod
     def get_all_schools() -> List[School]:
         return list(schools_db.values())
     
     @staticmethod
-    def update_school(school_id: str, name: str = None, address: str = None, phone: str = None) -> Optional[School]:
-        school = schools_db.get(school_id)
-        if school:
+    def get_schools_page(after: Optional[str] = None, limit: int = 100) -> List[School]:
+        return _page(school_keys, schools_db, after, limit)
+    
+    @staticmethod
+    def update_school(school_id: str, name: str = None, address: str = None, phone: str = None,
+                      expected_version: Optional[int] = None) -> Optional[School]:
+        with write_lock:
+            before = schools_db.get(school_id)
+            _check_version(before, expected_version)
+            if not before:
+                return None
+            school = before.copy()
             if name:
                 school.name = name
             if address:
                 school.address = address
             if phone:
                 school.phone = phone
-            school.updated_at = datetime.now().isoformat()
+            school.touch()
+            schools_db[school_id] = school
+            emit(SCHOOL, PUT, school, before)
         return school
     
     @staticmethod
-    def delete_school(school_id: str) -> bool:
-        if school_id in schools_db:
-            del schools_db[school_id]
-            return True
-        return False
+    def update_schools(items: List[Dict]) -> List[Optional[School]]:
+        with write_lock:
+            return [SchoolRepository.update_school(**item) for item in items]
+    
+    @staticmethod
+    def delete_school(school_id: str, expected_version: Optional[int] = None) -> bool:
+        with write_lock:
+            _check_version(schools_db.get(school_id), expected_version)
+            return SchoolRepository.delete_schools([school_id])[0]
+    
+    @staticmethod
+    def delete_schools(school_ids: List[str]) -> List[bool]:
+        with write_lock:
+            removed, orphans = _delete_schools(school_ids)
+            # Cascaded students go first, so listeners never see a student outlive its school
+            for student in orphans:
+                emit(STUDENT, DELETE, student)
+            for school in removed:
+                if school:
+                    emit(SCHOOL, DELETE, school)
+        return [school is not None for school in removed]
 
 class StudentRepository:
     @staticmethod
     def create_student(first_name: str, last_name: str, age: int, school_id: str, grade: str) -> Student:
         student = Student(first_name, last_name, age, school_id, grade)
-        students_db[student.id] = student
+        with write_lock:
+            students_db[student.id] = student
+            insort(student_keys, student.id)
+            _index_student(student)
+            _filter_index_student(student)
+            _time_index_student(student)
+            emit(STUDENT, PUT, student)
         return student
     
+    @staticmethod
+    def create_students(items: List[Dict]) -> List[Student]:
+        students = [Student(**item) for item in items]
+        with write_lock:
+            students_db.update((student.id, student) for student in students)
+            _merge_keys(student_keys, [student.id for student in students])
+            for student in students:
+                _index_student(student)
+                _filter_index_student(student)
+                _time_index_student(student)
+                emit(STUDENT, PUT, student)
+        return students
+    
+    @staticmethod
+    def import_students(students: List[Student]) -> None:
+        """Store students as they are, ids and timestamps included; the last of one id wins"""
+        students = list({student.id: student for student in students}.values())
+        with write_lock:
+            befores = _replace(students_db, student_keys, students)
+            for student, before in zip(students, befores):
+                _reindex_student(student, before)
+            emit_many(STUDENT, PUT, students, befores)
+    
     @staticmethod
     def get_student(student_id: str) -> Optional[Student]:
         return students_db.get(student_id)
     
+    @staticmethod
+    def get_students_by_ids(student_ids: List[str]) -> List[Student]:
+        return _lookup(students_db, student_ids)
+    
     @staticmethod
     def get_all_students() -> List[Student]:
         return list(students_db.values())
     
+    @staticmethod
+    def get_students_page(after: Optional[str] = None, limit: int = 100) -> List[Student]:
+        return _page(student_keys, students_db, after, limit)
+    
     @staticmethod
     def get_students_by_school(school_id: str) -> List[Student]:
-        return [student for student in students_db.values() if student.school_id == school_id]
+        # list() copies the bucket in one step; a student that moved away meanwhile is filtered out
+        return [student for student in _lookup(students_db, list(students_by_school.get(school_id, ())))
+                if student.school_id == school_id]
+    
+    @staticmethod
+    def get_student_ids_in_range(created_after: Optional[int] = None, created_before: Optional[int] = None,
+                                 updated_after: Optional[int] = None,
+                                 updated_before: Optional[int] = None) -> List[str]:
+        """Sorted ids of students created/updated strictly between the bounds (microseconds)"""
+        by_created, by_updated = _time_indexes()
+        candidates = []
+        if created_after is not None or created_before is not None:
+            candidates.append(by_created.between(created_after, created_before))
+        if updated_after is not None or updated_before is not None:
+            candidates.append(by_updated.between(updated_after, updated_before))
+        if not candidates:
+            return list(student_keys)
+        # Walk the narrower range and check both bounds on each record as it is now
+        students = _lookup(students_db, min(candidates, key=len))
+        return sorted(student.id for student in students
+                      if _in_range(student._created_us, created_after, created_before)
+                      and _in_range(student._updated_us, updated_after, updated_before))
+    
+    @staticmethod
+    def get_student_ids_filtered(school_id: Optional[str] = None, grade: Optional[str] = None,
+                                 age_min: Optional[int] = None, age_max: Optional[int] = None) -> List[str]:
+        """Sorted ids of students matching every given filter (ages inclusive)"""
+        by_grade, by_age = _filter_indexes()
+        # Plan: size up the index of each filter and walk the smallest; its ids are narrowed by membership
+        # in the other indexes, smallest first, and only what is left is looked up and checked
+        sources: List[List[Dict[str, None]]] = []
+        if school_id is not None:
+            sources.append([students_by_school.get(school_id, {})])
+        if grade is not None:
+            sources.append([by_grade.get(grade, {})])
+        if age_min is not None or age_max is not None:
+            sources.append([bucket for age, bucket in list(by_age.items())
+                            if (age_min is None or age >= age_min) and (age_max is None or age <= age_max)])
+        if not sources:
+            return list(student_keys)
+        sized = sorted((sum(map(len, buckets)), n, buckets) for n, buckets in enumerate(sources))
+        size, _, buckets = sized[0]
+        if size * 4 > len(students_db):
+            # A large share of the store: one pass over the records in storage order is cheaper than
+            # looking up the index's ids scattered across it
+            students = list(students_db.values())
+        else:
+            # list() copies each bucket in one step, as writers may change it meanwhile
+            ids = [student_id for bucket in buckets for student_id in list(bucket)]
+            if len(sized) > 1:
+                # Intersections of key views run in C over the smaller side
+                narrowed = set(ids)
+                for _, _, others in sized[1:]:
+                    narrowed = set().union(*[narrowed & bucket.keys() for bucket in others])
+                ids = list(narrowed)
+            students = _lookup(students_db, ids)
+        # Checked on the records as they are now: an index may be mid-update. Buckets keep insertion
+        # order and ids are time-ordered, so the sort mostly merges sorted runs.
+        return sorted(student.id for student in students if _matches(student, school_id, grade, age_min, age_max))
     
     @staticmethod
     def update_student(student_id: str, first_name: str = None, last_name: str = None, 
-                      age: int = None, school_id: str = None, grade: str = None) -> Optional[Student]:
-        student = students_db.get(student_id)
-        if student:
+                      age: int = None, school_id: str = None, grade: str = None,
+                      expected_version: Optional[int] = None) -> Optional[Student]:
+        with write_lock:
+            before = students_db.get(student_id)
+            _check_version(before, expected_version)
+            if not before:
+                return None
+            student = before.copy()
             if first_name:
                 student.first_name = first_name
             if last_name:
@@ -133,12 +890,27 @@ class StudentRepository:
                 student.school_id = school_id
             if grade:
                 student.grade = grade
-            student.updated_at = datetime.now().isoformat()
+            student.touch()
+            _put_student(student)
+            emit(STUDENT, PUT, student, before)
         return student
     
     @staticmethod
-    def delete_student(student_id: str) -> bool:
-        if student_id in students_db:
-            del students_db[student_id]
-            return True
-        return False 
\ No newline at end of file
+    def update_students(items: List[Dict]) -> List[Optional[Student]]:
+        with write_lock:
+            return [StudentRepository.update_student(**item) for item in items]
+    
+    @staticmethod
+    def delete_student(student_id: str, expected_version: Optional[int] = None) -> bool:
+        with write_lock:
+            _check_version(students_db.get(student_id), expected_version)
+            return StudentRepository.delete_students([student_id])[0]
+    
+    @staticmethod
+    def delete_students(student_ids: List[str]) -> List[bool]:
+        with write_lock:
+            removed = _delete_students(student_ids)
+            for student in removed:
+                if student:
+                    emit(STUDENT, DELETE, student)
+        return [student is not None for student in removed]
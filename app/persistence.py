@@ -0,0 +1,318 @@
+"""Optional durability for the in-memory repositories.
+
+Every repository mutation is appended to a write-ahead log by a background
+writer thread (group commit: whatever accumulated since the last write goes
+out in one write and at most one fsync). Periodically a compact snapshot of
+both stores is written and the log segments it covers are removed. At
+startup the latest snapshot is memory-mapped and loaded, then the log tail is
+replayed.
+
+Enabled by setting PERSISTENCE_DIR; see start_from_env() for the options.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+import gc
+import itertools
+import logging
+import marshal
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from app import models
+from app.models import School, Student
+
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = 'always'      # fsync every group commit
+FSYNC_INTERVAL = 'interval'  # fsync at most once per fsync_interval seconds
+FSYNC_OFF = 'off'            # leave flushing to the OS
+FSYNC_MODES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_OFF)
+
+# Version 2 added the entity version as the last row column
+SNAPSHOT_VERSION = 2
+SNAPSHOT_CHUNK_ROWS = 10000
+
+# Every log record and snapshot chunk is framed as <payload length, crc32> + marshal payload,
+# so a torn write at the tail of the log is detected and ignored on replay.
+_FRAME_HEADER = struct.Struct('<II')
+
+_ENTITY_TYPES = {models.SCHOOL: School, models.STUDENT: Student}
+_LEGACY_ROW_LENGTH = {models.SCHOOL: 6, models.STUDENT: 8}
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(buffer) -> Iterator[bytes]:
+    offset = 0
+    size = len(buffer)
+    while offset + _FRAME_HEADER.size <= size:
+        length, crc = _FRAME_HEADER.unpack_from(buffer, offset)
+        start = offset + _FRAME_HEADER.size
+        end = start + length
+        payload = buffer[start:end]
+        if end > size or zlib.crc32(payload) != crc:
+            logger.warning(f"Ignoring torn record at offset {offset}")
+            return
+        yield payload
+        offset = end
+
+
+def _entity(kind: str, row: Tuple):
+    if len(row) == _LEGACY_ROW_LENGTH[kind]:
+        row += (1,)
+    return _ENTITY_TYPES[kind].from_row(row)
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, fsync: str = FSYNC_INTERVAL, fsync_interval: float = 1.0,
+                 snapshot_every: int = 100000):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"Unknown fsync mode: {fsync}")
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.last_seq = 0
+        self._counter = itertools.count(1)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = None
+        self._writer: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._written_seq = 0
+        self._since_snapshot = 0
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+
+    # File layout: snapshot-<seq>.bin holds the state up to and including <seq>;
+    # wal-<seq>.log holds records starting at <seq>.
+    def _path(self, prefix: str, seq: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{prefix}-{seq:020d}{suffix}")
+
+    def _files(self, prefix: str, suffix: str) -> List[Tuple[int, str]]:
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix + '-') and name.endswith(suffix):
+                found.append((int(name[len(prefix) + 1:-len(suffix)]), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def recover(self) -> Tuple[int, int]:
+        """Load the latest snapshot and replay the log tail; returns (snapshot seq, last seq)"""
+        # Loading allocates millions of tracked objects; running the cyclic GC over them while
+        # they are created dominates startup time, and none of them form cycles.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._recover()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+            # Keep the loaded records out of future collections as well
+            gc.freeze()
+
+    def _recover(self) -> Tuple[int, int]:
+        snapshot_seq = 0
+        snapshots = self._files('snapshot', '.bin')
+        if snapshots:
+            snapshot_seq, path = snapshots[-1]
+            self._load_snapshot(path)
+        last_seq = snapshot_seq
+        for _, path in self._files('wal', '.log'):
+            with open(path, 'rb') as f:
+                content = f.read()
+            valid_end = 0
+            for payload in _read_frames(content):
+                valid_end += _FRAME_HEADER.size + len(payload)
+                seq, kind, op, record = marshal.loads(payload)
+                if seq <= snapshot_seq:
+                    continue
+                if op == models.PUT:
+                    models.replay_put(kind, _entity(kind, record))
+                else:
+                    models.replay_delete(kind, record)
+                last_seq = seq
+            if valid_end < len(content):
+                # Drop the torn tail so records appended after restart stay readable
+                os.truncate(path, valid_end)
+        self.last_seq = self._written_seq = last_seq
+        self._counter = itertools.count(last_seq + 1)
+        return snapshot_seq, last_seq
+
+    def _load_snapshot(self, path: str) -> None:
+        schools: List[School] = []
+        students: List[Student] = []
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            frames = _read_frames(data)
+            version, _ = marshal.loads(next(frames))
+            if version > SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version {version} in {path}")
+            for payload in frames:
+                kind, rows = marshal.loads(payload)
+                if version < SNAPSHOT_VERSION:
+                    rows = [row + (1,) for row in rows]
+                if kind == models.SCHOOL:
+                    schools.extend(map(School.from_row, rows))
+                else:
+                    students.extend(map(Student.from_row, rows))
+        models.load_snapshot(schools, students)
+
+    def start(self) -> None:
+        self._open_segment(self.last_seq + 1)
+        models.add_listener(self.append)
+        self._writer = threading.Thread(target=self._run, name='wal-writer', daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        models.remove_listener(self.append)
+        self._queue.put(None)
+        if self._writer:
+            self._writer.join()
+        if self._snapshotter:
+            self._snapshotter.join()
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def append(self, kind: str, op: str, entity, before=None) -> None:
+        # Runs on the request path: only captures the record and enqueues it
+        seq = next(self._counter)
+        self.last_seq = seq
+        self._queue.put((seq, kind, op, entity.to_row() if op == models.PUT else entity.id))
+
+    def _open_segment(self, first_seq: int) -> None:
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = open(self._path('wal', first_seq, '.log'), 'ab')
+        _fsync_dir(self.directory)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            timeout = self.fsync_interval if self._dirty and self.fsync == FSYNC_INTERVAL else None
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch and batch[-1] is None:
+                batch.pop()
+                stopping = True
+            if batch:
+                self._write(batch)
+            self._maybe_fsync(force=self.fsync == FSYNC_ALWAYS and bool(batch))
+            if self._since_snapshot >= self.snapshot_every and not self._snapshot_running():
+                self._start_snapshot()
+
+    def _write(self, batch: List[Tuple]) -> None:
+        self._file.write(b''.join(_frame(marshal.dumps(record)) for record in batch))
+        self._file.flush()
+        self._written_seq = batch[-1][0]
+        self._since_snapshot += len(batch)
+        self._dirty = True
+
+    def _maybe_fsync(self, force: bool) -> None:
+        if not self._dirty or self.fsync == FSYNC_OFF:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+            self._dirty = False
+
+    def _snapshot_running(self) -> bool:
+        return self._snapshotter is not None and self._snapshotter.is_alive()
+
+    def _start_snapshot(self) -> None:
+        # Everything up to the written seq is already applied to the stores; later records go
+        # to a fresh segment and are replayed on top of the snapshot (puts carry full rows).
+        seq = self._written_seq
+        self._open_segment(seq + 1)
+        self._dirty = False
+        self._since_snapshot = 0
+        self._snapshotter = threading.Thread(target=self.write_snapshot, args=(seq,),
+                                             name='wal-snapshot', daemon=True)
+        self._snapshotter.start()
+
+    def write_snapshot(self, seq: int) -> str:
+        started = time.perf_counter()
+        path = self._path('snapshot', seq, '.bin')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_frame(marshal.dumps((SNAPSHOT_VERSION, seq))))
+            for kind, db in ((models.SCHOOL, models.schools_db), (models.STUDENT, models.students_db)):
+                entities = list(db.values())
+                for start in range(0, len(entities), SNAPSHOT_CHUNK_ROWS):
+                    rows = [entity.to_row() for entity in entities[start:start + SNAPSHOT_CHUNK_ROWS]]
+                    f.write(_frame(marshal.dumps((kind, rows))))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(self.directory)
+        for old_seq, old_path in self._files('snapshot', '.bin'):
+            if old_seq < seq:
+                os.remove(old_path)
+        for first_seq, old_path in self._files('wal', '.log'):
+            if first_seq <= seq:
+                os.remove(old_path)
+        logger.info(f"Snapshot at seq {seq} written in {time.perf_counter() - started:.2f}s")
+        return path
+
+
+_log: Optional[WriteAheadLog] = None
+
+
+def start_from_env() -> Optional[WriteAheadLog]:
+    """Enable persistence if PERSISTENCE_DIR is set.
+
+    PERSISTENCE_FSYNC: always | interval | off (default interval)
+    PERSISTENCE_FSYNC_INTERVAL: seconds between fsyncs in interval mode (default 1.0)
+    PERSISTENCE_SNAPSHOT_EVERY: log records between snapshots (default 100000)
+    """
+    global _log
+    directory = os.environ.get('PERSISTENCE_DIR')
+    if not directory:
+        return None
+    _log = WriteAheadLog(
+        directory,
+        fsync=os.environ.get('PERSISTENCE_FSYNC', FSYNC_INTERVAL),
+        fsync_interval=float(os.environ.get('PERSISTENCE_FSYNC_INTERVAL', '1.0')),
+        snapshot_every=int(os.environ.get('PERSISTENCE_SNAPSHOT_EVERY', '100000')),
+    )
+    started = time.perf_counter()
+    snapshot_seq, last_seq = _log.recover()
+    logger.info(
+        f"Recovered {len(models.schools_db)} schools and {len(models.students_db)} students "
+        f"(snapshot seq {snapshot_seq}, log seq {last_seq}) in {time.perf_counter() - started:.2f}s"
+    )
+    _log.start()
+    return _log
+
+
+def stop() -> None:
+    global _log
+    if _log:
+        _log.close()
+        _log = None
@@ -0,0 +1,437 @@
+"""Leader/follower replication for the memory backend.
+
+One replica accepts writes (REPLICATION_ROLE=leader). Every repository write
+there gets a sequence number and goes into a bounded in-memory log. Followers
+(REPLICATION_ROLE=follower, REPLICATION_LEADER=http://leader:8000) load a
+snapshot, then stream the log from the snapshot's position and apply it to
+their own dicts through models.apply_put/apply_delete, so search, stats,
+ETags and /changes follow along. Reads are served from local memory; writes
+sent to a follower are forwarded to the leader.
+
+Wire format (internal endpoints, leader only): length-prefixed marshal frames.
+  GET /replication/snapshot           (boot, seq), then (kind, [rows]) chunks
+  GET /replication/stream?boot=&after= (seq, kind, op, row or id) per write, (seq,) heartbeats
+A follower whose position has left the log, or that sees a new leader boot,
+loads a fresh snapshot.
+
+Consistency:
+  - Every response carries X-Replication-Token: <boot>.<seq>, the log position its data reflects.
+    A read sent to a follower with that header waits (REPLICATION_WAIT, default 2 s) until the
+    follower has applied at least that position, else it gets 503. A token from a leader boot the
+    follower has not loaded yet (the leader restarted) waits for the follower to reload the snapshot.
+    A client that passes back the token of its last write reads its own writes on any replica.
+  - A forwarded write is answered only once the follower has applied it.
+  - A follower that has not heard from the leader (writes or 1 s heartbeats) within
+    REPLICATION_MAX_STALENESS (default 5 s) answers reads with 503, and /replication/status
+    (its readiness probe) fails.
+"""
+
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Callable, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import marshal
+import os
+import struct
+import time
+
+from app import models
+from app.models import School, Student
+from app.versions import BOOT_ID
+
+logger = logging.getLogger(__name__)
+
+LEADER = 'leader'
+FOLLOWER = 'follower'
+
+TOKEN_HEADER = 'X-Replication-Token'
+MEDIA_TYPE = 'application/octet-stream'
+
+DEFAULT_LOG_SIZE = 100000
+HEARTBEAT_INTERVAL = 1.0
+RETRY_INTERVAL = 1.0
+# A stream ends after this long and the follower resumes from where it was: uvicorn's graceful
+# shutdown waits for open responses, so an endless stream would hold up a leader restart
+STREAM_DURATION = 10.0
+SNAPSHOT_CHUNK_ROWS = 10000
+MAX_RECORDS_PER_WRITE = 1000
+
+# Served locally on a follower whatever its state
+_LOCAL_PATHS = ('/health', '/metrics', '/replication/')
+_HOP_BY_HOP = {b'connection', b'keep-alive', b'transfer-encoding', b'content-length', b'host'}
+
+_LENGTH = struct.Struct('<I')
+_FACTORIES = {models.SCHOOL: School.from_row, models.STUDENT: Student.from_row}
+
+
+def _frame(value) -> bytes:
+    payload = marshal.dumps(value)
+    return _LENGTH.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """Splits a byte stream back into the values framed by _frame"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List:
+        buffer = self._buffer
+        buffer += data
+        values = []
+        offset = 0
+        while len(buffer) - offset >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(buffer, offset)
+            end = offset + _LENGTH.size + length
+            if end > len(buffer):
+                break
+            values.append(marshal.loads(buffer[offset + _LENGTH.size:end]))
+            offset = end
+        del buffer[:offset]
+        return values
+
+
+def token(boot: str, seq: int) -> str:
+    return f"{boot}.{seq}"
+
+
+def parse_token(value: str) -> Optional[Tuple[str, int]]:
+    boot, _, seq = value.strip().partition('.')
+    try:
+        return boot, int(seq)
+    except ValueError:
+        return None
+
+
+class ReplicationLog:
+    """Leader side: numbered writes in a ring buffer, streamed to followers"""
+
+    def __init__(self, size: int = DEFAULT_LOG_SIZE):
+        self._records: deque = deque(maxlen=size)
+        self.seq = 0
+        # Memory backend writes run on the event loop, like the streams waiting here
+        self._changed = asyncio.Event()
+        self._waiting = False
+
+    @property
+    def token(self) -> str:
+        return token(BOOT_ID, self.seq)
+
+    def append(self, kind: str, op: str, entity, before=None) -> None:
+        self.seq += 1
+        self._records.append(_frame((self.seq, kind, op, entity.to_row() if op == models.PUT else entity.id)))
+        if self._waiting:
+            self._waiting = False
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+    def can_resume(self, boot: str, after: int) -> bool:
+        return boot == BOOT_ID and after <= self.seq and self._since(after) is not None
+
+    def _since(self, cursor: int) -> Optional[List[bytes]]:
+        first = self.seq - len(self._records) + 1
+        if cursor + 1 < first:
+            return None
+        start = cursor + 1 - first
+        return list(islice(self._records, start, start + MAX_RECORDS_PER_WRITE))
+
+    async def stream(self, after: int) -> AsyncIterator[bytes]:
+        cursor = after
+        deadline = time.monotonic() + STREAM_DURATION
+        while time.monotonic() < deadline:
+            records = self._since(cursor)
+            if records is None:
+                # Fell out of the log: the follower reconnects, gets 410 and loads a snapshot
+                return
+            if records:
+                cursor += len(records)
+                yield b"".join(records)
+                continue
+            self._waiting = True
+            try:
+                await asyncio.wait_for(self._changed.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield _frame((cursor,))
+
+    async def snapshot(self) -> AsyncIterator[bytes]:
+        # Taken under the write lock, so it matches seq. Rows are encoded chunk by chunk later; stored
+        # records are never changed in place, so the rows are exactly the state at seq.
+        with models.write_lock:
+            seq = self.seq
+            entities = [(models.SCHOOL, list(models.schools_db.values())),
+                        (models.STUDENT, list(models.students_db.values()))]
+        yield _frame((BOOT_ID, seq))
+        for kind, items in entities:
+            for start in range(0, len(items), SNAPSHOT_CHUNK_ROWS):
+                yield _frame((kind, [entity.to_row() for entity in items[start:start + SNAPSHOT_CHUNK_ROWS]]))
+                await asyncio.sleep(0)
+
+
+class _SnapshotLoader:
+    """Decodes a snapshot as its body arrives, so only the records are held, not the whole body"""
+
+    def __init__(self):
+        self._reader = FrameReader()
+        self._position: Optional[Tuple[str, int]] = None
+        self._schools: List[School] = []
+        self._students: List[Student] = []
+
+    def feed(self, data: bytes) -> None:
+        for frame in self._reader.feed(data):
+            if self._position is None:
+                self._position = frame
+                continue
+            kind, rows = frame
+            if kind == models.SCHOOL:
+                self._schools.extend(map(School.from_row, rows))
+            else:
+                self._students.extend(map(Student.from_row, rows))
+
+    def load(self, rebuild: Callable[[List[School], List[Student]], None]) -> Tuple[str, int]:
+        if self._position is None:
+            raise ValueError("Empty snapshot from the leader")
+        models.load_snapshot(self._schools, self._students)
+        rebuild(self._schools, self._students)
+        return self._position
+
+
+class Follower:
+    """Follower side: keeps the local store in step with the leader's log"""
+
+    def __init__(self, leader_url: str, max_staleness: float = 5.0, wait: float = 2.0):
+        self.leader_url = leader_url.rstrip('/')
+        self.max_staleness = max_staleness
+        self.wait = wait
+        self.boot: Optional[str] = None
+        # Leader boots this follower has followed and then left; boot ids are random, so this is
+        # the only way to tell a token from an earlier boot from one of a boot not reached yet
+        self._left_boots: Set[str] = set()
+        self.seq = 0
+        self.ready = False
+        self.heard = 0.0
+        self.client = None
+        self._applied = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> str:
+        return token(self.boot or '', self.seq)
+
+    @property
+    def staleness(self) -> float:
+        return time.monotonic() - self.heard if self.ready else float('inf')
+
+    def fresh(self) -> bool:
+        return self.staleness <= self.max_staleness
+
+    async def caught_up(self, boot: str, seq: int) -> bool:
+        """Wait until the position is applied. A token from a leader boot this follower has already
+        left counts as applied; one from any other boot waits for the follower to load that boot."""
+        deadline = time.monotonic() + self.wait
+        while not (self.ready and (boot in self._left_boots or (boot == self.boot and self.seq >= seq))):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._applied.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def _notify(self) -> None:
+        applied, self._applied = self._applied, asyncio.Event()
+        applied.set()
+
+    def start(self, rebuild: Callable[[List[School], List[Student]], None]) -> None:
+        import httpx
+        # Reads time out well after a missed heartbeat, so a dead leader shows up as an error
+        self.client = httpx.AsyncClient(base_url=self.leader_url,
+                                        timeout=httpx.Timeout(30.0, read=HEARTBEAT_INTERVAL * 5))
+        self._task = asyncio.create_task(self._run(rebuild))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.client:
+            await self.client.aclose()
+
+    async def _run(self, rebuild) -> None:
+        while True:
+            try:
+                if not self.ready:
+                    await self._bootstrap(rebuild)
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Replication from {self.leader_url} interrupted: {e!r}")
+                await asyncio.sleep(RETRY_INTERVAL)
+
+    async def _bootstrap(self, rebuild) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        loader = _SnapshotLoader()
+        async with self.client.stream('GET', '/replication/snapshot', timeout=None) as response:
+            response.raise_for_status()
+            async for data in response.aiter_bytes():
+                await loop.run_in_executor(None, loader.feed, data)
+        # Reads are refused until ready, so nothing else touches the store while it is replaced
+        boot, self.seq = await loop.run_in_executor(None, loader.load, rebuild)
+        if self.boot is not None and self.boot != boot:
+            self._left_boots.add(self.boot)
+        self.boot = boot
+        self.ready = True
+        self.heard = time.monotonic()
+        self._notify()
+        logger.info(f"Loaded snapshot of {self.leader_url} at {self.token}: {len(models.schools_db)} schools, "
+                    f"{len(models.students_db)} students in {time.perf_counter() - started:.2f}s")
+
+    async def _follow(self) -> None:
+        params = {'boot': self.boot, 'after': self.seq}
+        async with self.client.stream('GET', '/replication/stream', params=params) as response:
+            if response.status_code == 410:
+                logger.info(f"Position {self.token} is gone from the leader's log; reloading the snapshot")
+                self.ready = False
+                return
+            response.raise_for_status()
+            self.heard = time.monotonic()
+            reader = FrameReader()
+            async for data in response.aiter_raw():
+                self.heard = time.monotonic()
+                for record in reader.feed(data):
+                    self._apply(record)
+                self._notify()
+
+    def _apply(self, record: tuple) -> None:
+        if len(record) == 1:
+            return
+        seq, kind, op, payload = record
+        if seq != self.seq + 1:
+            self.ready = False
+            raise ValueError(f"Expected seq {self.seq + 1} from the leader, got {seq}")
+        if op == models.PUT:
+            models.apply_put(kind, _FACTORIES[kind](payload))
+        else:
+            models.apply_delete(kind, payload)
+        self.seq = seq
+
+
+def _json_error(status_code: int, detail: str) -> Tuple[dict, dict]:
+    body = json.dumps({'detail': detail}).encode()
+    start = {'type': 'http.response.start', 'status': status_code, 'headers': [
+        (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+        (b'retry-after', b'1'),
+    ]}
+    return start, {'type': 'http.response.body', 'body': body}
+
+
+class ReplicationMiddleware:
+    """Plain ASGI middleware: tokens on every response; on a follower, read gating and write forwarding"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or role is None:
+            await self.app(scope, receive, send)
+            return
+        if role == LEADER:
+            await self.app(scope, receive, _with_token(send, lambda: log.token))
+            return
+        if scope['path'].startswith(_LOCAL_PATHS) or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            await _forward(scope, receive, send)
+            return
+        if not follower.fresh():
+            for message in _json_error(503, "Replica is not in sync with the leader"):
+                await send(message)
+            return
+        requested = next((value for name, value in scope['headers'] if name == b'x-replication-token'), None)
+        position = parse_token(requested.decode('latin-1')) if requested else None
+        if position and not await follower.caught_up(*position):
+            for message in _json_error(503, "Replica has not caught up with the requested token"):
+                await send(message)
+            return
+        await self.app(scope, receive, _with_token(send, lambda: follower.token))
+
+
+def _with_token(send, current: Callable[[], str]):
+    async def send_with_token(message):
+        if message['type'] == 'http.response.start':
+            message['headers'] = list(message.get('headers', [])) + [
+                (TOKEN_HEADER.lower().encode(), current().encode())]
+        await send(message)
+    return send_with_token
+
+
+async def _forward(scope, receive, send) -> None:
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    path = scope['raw_path'].decode('latin-1') if scope.get('raw_path') else scope['path']
+    if scope.get('query_string'):
+        path += '?' + scope['query_string'].decode('latin-1')
+    headers = [(name, value) for name, value in scope['headers'] if name not in _HOP_BY_HOP]
+    try:
+        request = follower.client.build_request(scope['method'], path, headers=headers, content=body)
+        response = await follower.client.send(request, stream=True)
+        try:
+            # Raw bytes: whatever content encoding the leader chose is passed through untouched
+            content = b''.join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+    except Exception as e:
+        logger.error(f"Error forwarding {scope['method']} {path} to the leader: {e!r}")
+        for message in _json_error(503, "Leader unavailable"):
+            await send(message)
+        return
+    written = parse_token(response.headers.get(TOKEN_HEADER, ''))
+    if written:
+        # Read-your-writes on this replica: answer once the write has arrived here
+        await follower.caught_up(*written)
+    headers = [(name, value) for name, value in response.headers.raw if name.lower() not in _HOP_BY_HOP]
+    headers.append((b'content-length', str(len(content)).encode()))
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+def status() -> Tuple[int, dict]:
+    """(HTTP status, body) for /replication/status; 503 for a follower that is out of sync"""
+    if role == LEADER:
+        return 200, {'role': LEADER, 'token': log.token}
+    if role == FOLLOWER:
+        staleness = follower.staleness
+        body = {'role': FOLLOWER, 'leader': follower.leader_url, 'token': follower.token,
+                'staleness_seconds': round(staleness, 3) if follower.ready else None}
+        return (200 if follower.fresh() else 503), body
+    return 200, {'role': None}
+
+
+role = os.getenv('REPLICATION_ROLE') or None
+log: Optional[ReplicationLog] = None
+follower: Optional[Follower] = None
+
+if role == LEADER:
+    log = ReplicationLog(int(os.getenv('REPLICATION_LOG_SIZE', DEFAULT_LOG_SIZE)))
+    models.add_listener(log.append)
+elif role == FOLLOWER:
+    if not os.getenv('REPLICATION_LEADER'):
+        raise ValueError("REPLICATION_ROLE=follower needs REPLICATION_LEADER (the leader's base URL)")
+    follower = Follower(
+        os.environ['REPLICATION_LEADER'],
+        max_staleness=float(os.getenv('REPLICATION_MAX_STALENESS', '5')),
+        wait=float(os.getenv('REPLICATION_WAIT', '2')),
+    )
+elif role is not None:
+    raise ValueError(f"Unknown REPLICATION_ROLE: {role}")
@@ -0,0 +1,147 @@
+"""Pluggable repository backends behind an async facade.
+
+STORAGE_BACKEND selects the implementation:
+  memory - the dict-backed SchoolRepository/StudentRepository (default)
+  sqlite - SqliteSchoolRepository/SqliteStudentRepository (SQLITE_PATH, SQLITE_POOL_SIZE,
+           SQLITE_MMAP_SIZE); the only backend several worker processes (WEB_CONCURRENCY > 1) can share
+
+Endpoints await schools_repo.<method>(...) / students_repo.<method>(...). Calls into the
+memory backend run inline on the event loop; calls into a blocking backend run
+in a bounded thread pool sized to its connection pool. Every call is timed into
+the repository_call_duration_seconds histogram.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Protocol, Tuple
+from time import perf_counter
+import asyncio
+import functools
+import os
+
+from app import metrics, models
+from app.models import School, Student, SchoolRepository, StudentRepository
+
+MEMORY = 'memory'
+SQLITE = 'sqlite'
+
+
+class SchoolStore(Protocol):
+    def create_school(self, name: str, address: str, phone: str) -> School: ...
+    def create_schools(self, items: List[Dict]) -> List[School]: ...
+    def import_schools(self, schools: List[School]) -> None: ...
+    def get_school(self, school_id: str) -> Optional[School]: ...
+    def get_schools_by_ids(self, school_ids: List[str]) -> List[School]: ...
+    def get_all_schools(self) -> List[School]: ...
+    def get_schools_page(self, after: Optional[str] = None, limit: int = 100) -> List[School]: ...
+    def update_school(self, school_id: str, name: str = None, address: str = None,
+                      phone: str = None, expected_version: Optional[int] = None) -> Optional[School]: ...
+    def update_schools(self, items: List[Dict]) -> List[Optional[School]]: ...
+    def delete_school(self, school_id: str, expected_version: Optional[int] = None) -> bool: ...
+    def delete_schools(self, school_ids: List[str]) -> List[bool]: ...
+
+
+class StudentStore(Protocol):
+    def create_student(self, first_name: str, last_name: str, age: int, school_id: str, grade: str) -> Student: ...
+    def create_students(self, items: List[Dict]) -> List[Student]: ...
+    def import_students(self, students: List[Student]) -> None: ...
+    def get_student(self, student_id: str) -> Optional[Student]: ...
+    def get_students_by_ids(self, student_ids: List[str]) -> List[Student]: ...
+    def get_all_students(self) -> List[Student]: ...
+    def get_students_page(self, after: Optional[str] = None, limit: int = 100) -> List[Student]: ...
+    def get_students_by_school(self, school_id: str) -> List[Student]: ...
+    def get_student_ids_in_range(self, created_after: Optional[int] = None, created_before: Optional[int] = None,
+                                 updated_after: Optional[int] = None,
+                                 updated_before: Optional[int] = None) -> List[str]: ...
+    def get_student_ids_filtered(self, school_id: Optional[str] = None, grade: Optional[str] = None,
+                                 age_min: Optional[int] = None, age_max: Optional[int] = None) -> List[str]: ...
+    def update_student(self, student_id: str, first_name: str = None, last_name: str = None,
+                       age: int = None, school_id: str = None, grade: str = None,
+                       expected_version: Optional[int] = None) -> Optional[Student]: ...
+    def update_students(self, items: List[Dict]) -> List[Optional[Student]]: ...
+    def delete_student(self, student_id: str, expected_version: Optional[int] = None) -> bool: ...
+    def delete_students(self, student_ids: List[str]) -> List[bool]: ...
+
+
+class AsyncRepository:
+    """Awaitable view of a repository class"""
+
+    def __init__(self, repository, executor: Optional[ThreadPoolExecutor] = None):
+        self.repository = repository
+        self.executor = executor
+
+    def __getattr__(self, name: str):
+        method = getattr(self.repository, name)
+        executor = self.executor
+        histogram = metrics.repository_histogram(self.repository.__name__, name)
+        if executor is None:
+            async def call(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    histogram.observe(perf_counter() - started)
+        else:
+            async def call(*args, **kwargs):
+                started = perf_counter()
+                loop = asyncio.get_running_loop()
+                try:
+                    return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+                finally:
+                    # Includes the wait for a free pool thread, which is part of what callers see
+                    histogram.observe(perf_counter() - started)
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+
+def workers() -> int:
+    """Worker processes serving the app: WEB_CONCURRENCY, as read by uvicorn and app.serve"""
+    return int(os.environ.get('WEB_CONCURRENCY') or 1)
+
+
+def from_env():
+    """Build (backend, schools_repo, students_repo) for the backend named in STORAGE_BACKEND"""
+    global shared
+    backend = os.environ.get('STORAGE_BACKEND', MEMORY)
+    shared = workers() > 1
+    if backend == MEMORY:
+        if workers() > 1:
+            raise ValueError("The memory backend lives in one process; use STORAGE_BACKEND=sqlite with several workers")
+        return backend, AsyncRepository(SchoolRepository), AsyncRepository(StudentRepository)
+    if backend == SQLITE:
+        from app import sqlite_store
+        pool_size = int(os.environ.get('SQLITE_POOL_SIZE', '4'))
+        sqlite_store.configure(
+            os.environ.get('SQLITE_PATH', 'school.db'), pool_size, shared=shared,
+            mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', sqlite_store.DEFAULT_MMAP_SIZE)),
+        )
+        executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='sqlite')
+        return (backend, AsyncRepository(sqlite_store.SqliteSchoolRepository, executor),
+                AsyncRepository(sqlite_store.SqliteStudentRepository, executor))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def export_batches(batch_size: int) -> Iterator[Tuple[str, List]]:
+    """(kind, records) batches of both stores as of one moment, schools first. A blocking iterator:
+    with SQLite, step it in students_repo.executor"""
+    if backend == SQLITE:
+        from app import sqlite_store
+        return sqlite_store.export_batches(batch_size)
+    return models.export_batches(batch_size)
+
+
+def start_following(rebuild: Callable[[List[School], List[Student]], None]) -> None:
+    """Shared SQLite file: rebuild process-local state, then keep applying other workers' writes to it"""
+    from app import sqlite_store
+    sqlite_store.start_follower(rebuild)
+
+
+def stop_following() -> None:
+    if shared:
+        from app import sqlite_store
+        sqlite_store.stop_follower()
+
+
+# Several worker processes share the store (SQLite only)
+shared = False
+backend, schools_repo, students_repo = from_env()
@@ -0,0 +1,238 @@
+"""In-memory search index behind GET /schools?q= and GET /students?q=.
+
+Field values are split into words and normalized (casefold, ё -> е), so
+Cyrillic and Latin text match case-insensitively. Two maps are kept:
+
+  word    -> ids of the records containing it (postings)
+  trigram -> words containing it, over the distinct words only
+
+A query word is looked up by intersecting the word sets of its trigrams and
+checking the survivors for the substring, which covers both prefix and
+infix matches; words shorter than a trigram scan the vocabulary instead.
+Words first seen in a batch write (an import) get their trigrams on the
+next search rather than during the write.
+Names repeat a lot, so the vocabulary is much smaller than the record count.
+Every query word has to match (AND); results come back as sorted ids.
+
+The indexes follow repository writes through a models listener. Replay
+paths (snapshot load, log replay) and rows already in an SQLite file do not
+notify listeners, so the application rebuilds the indexes once at startup.
+SQLite listeners run on executor threads, hence the lock.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+from operator import attrgetter
+import re
+import threading
+
+from app import models
+
+GRAM = 3
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace('ё', 'е')
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def _grams(word: str) -> Set[str]:
+    return {word[i:i + GRAM] for i in range(len(word) - GRAM + 1)}
+
+
+class SearchIndex:
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self._postings: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        # Words added in bulk (put_many) whose trigrams are indexed by the next search
+        self._unindexed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _words(self, entity) -> Set[str]:
+        return {word for field in self.fields for word in words(getattr(entity, field))}
+
+    def _add(self, entity_id: str, entity_words: Iterable[str]) -> None:
+        for word in entity_words:
+            ids = self._postings.get(word)
+            if ids is None:
+                ids = self._postings[word] = set()
+                for gram in _grams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            ids.add(entity_id)
+
+    def _remove(self, entity_id: str, entity_words: Iterable[str]) -> None:
+        for word in entity_words:
+            self._remove_ids(word, (entity_id,))
+
+    def _remove_ids(self, word: str, entity_ids: Iterable[str]) -> None:
+        ids = self._postings.get(word)
+        if ids is None:
+            return
+        ids.difference_update(entity_ids)
+        if not ids:
+            del self._postings[word]
+            if word in self._unindexed:
+                self._unindexed.discard(word)
+                return
+            for gram in _grams(word):
+                gram_words = self._grams[gram]
+                gram_words.discard(word)
+                if not gram_words:
+                    del self._grams[gram]
+
+    def put(self, entity, before=None) -> None:
+        new = self._words(entity)
+        old = self._words(before) if before is not None else set()
+        if new == old:
+            return
+        with self._lock:
+            self._remove(entity.id, old - new)
+            self._add(entity.id, new - old)
+
+    def put_many(self, entities: List, befores: List) -> None:
+        # Names repeat across a batch: each distinct field value is split into words once, and each
+        # distinct word gets its postings updated once; trigrams of new words wait for a search
+        cache: Dict[str, List[str]] = {}
+        # Net changes: a record listed twice in the batch may take a word out and put it back
+        added: Dict[str, Set[str]] = {}
+        removed: Dict[str, Set[str]] = {}
+
+        def entity_words(entity) -> Set[str]:
+            found: Set[str] = set()
+            for field in self.fields:
+                value = getattr(entity, field)
+                value_words = cache.get(value)
+                if value_words is None:
+                    value_words = cache[value] = words(value)
+                found.update(value_words)
+            return found
+
+        pairs = zip(entities, befores)
+        if len({entity.id for entity in entities}) == len(entities):
+            # No record twice, so a new one has nothing to net: each word of each of its field values
+            # goes straight to its postings, without a word set per record
+            pairs = [(entity, before) for entity, before in pairs if before is not None]
+            fresh = [entity for entity, before in zip(entities, befores) if before is None]
+            for field in self.fields:
+                for entity_id, value in zip([entity.id for entity in fresh], map(attrgetter(field), fresh)):
+                    value_words = cache.get(value)
+                    if value_words is None:
+                        value_words = cache[value] = words(value)
+                    for word in value_words:
+                        ids = added.get(word)
+                        if ids is None:
+                            added[word] = {entity_id}
+                        else:
+                            ids.add(entity_id)
+
+        for entity, before in pairs:
+            new = entity_words(entity)
+            if before is not None:
+                old = entity_words(before)
+                for word in old - new:
+                    if entity.id in added.get(word, ()):
+                        added[word].discard(entity.id)
+                    else:
+                        removed.setdefault(word, set()).add(entity.id)
+                new -= old
+            for word in new:
+                if removed and entity.id in removed.get(word, ()):
+                    removed[word].discard(entity.id)
+                    continue
+                ids = added.get(word)
+                if ids is None:
+                    added[word] = {entity.id}
+                else:
+                    ids.add(entity.id)
+
+        with self._lock:
+            for word, ids in removed.items():
+                self._remove_ids(word, ids)
+            for word, ids in added.items():
+                postings = self._postings.get(word)
+                if postings is None:
+                    if ids:
+                        self._postings[word] = ids
+                        self._unindexed.add(word)
+                else:
+                    postings.update(ids)
+
+    def _index_grams(self) -> None:
+        for word in self._unindexed:
+            for gram in _grams(word):
+                self._grams.setdefault(gram, set()).add(word)
+        self._unindexed = set()
+
+    def delete(self, entity) -> None:
+        with self._lock:
+            self._remove(entity.id, self._words(entity))
+
+    def rebuild(self, entities: Iterable) -> None:
+        with self._lock:
+            self._postings = {}
+            self._grams = {}
+            self._unindexed = set()
+            for entity in entities:
+                self._add(entity.id, self._words(entity))
+
+    def _matching_words(self, fragment: str) -> Iterable[str]:
+        if len(fragment) < GRAM:
+            return [word for word in self._postings if fragment in word]
+        candidates = sorted((self._grams.get(gram, ()) for gram in _grams(fragment)), key=len)
+        if not candidates[0]:
+            return []
+        words_with_grams = set(candidates[0]).intersection(*candidates[1:])
+        return [word for word in words_with_grams if fragment in word]
+
+    def search(self, query: str) -> List[str]:
+        """Sorted ids of the records whose words contain every word of the query"""
+        matched = None
+        with self._lock:
+            if self._unindexed:
+                self._index_grams()
+            # Longest fragment first: it is usually the most selective, later ones only narrow the result
+            for fragment in sorted(set(words(query)), key=len, reverse=True):
+                ids = set()
+                for word in self._matching_words(fragment):
+                    ids.update(self._postings[word] if matched is None else self._postings[word] & matched)
+                matched = ids
+                if not matched:
+                    break
+        return sorted(matched or ())
+
+
+schools = SearchIndex(('name', 'address'))
+students = SearchIndex(('first_name', 'last_name'))
+
+_INDEXES: Dict[str, SearchIndex] = {models.SCHOOL: schools, models.STUDENT: students}
+
+
+def _on_mutation(kind: str, op: str, entity, before=None) -> None:
+    index = _INDEXES[kind]
+    if op == models.PUT:
+        index.put(entity, before)
+    else:
+        index.delete(entity)
+
+
+def _on_mutations(kind: str, op: str, entities: List, befores: List) -> None:
+    index = _INDEXES[kind]
+    if op == models.PUT:
+        index.put_many(entities, befores)
+    else:
+        for entity in entities:
+            index.delete(entity)
+
+
+models.add_listener(_on_mutation, _on_mutations)
+
+
+def rebuild(all_schools: Iterable, all_students: Iterable) -> None:
+    schools.rebuild(all_schools)
+    students.rebuild(all_students)
+
@@ -0,0 +1,38 @@
+"""Production entry point: python -m app.serve
+
+Runs WEB_CONCURRENCY uvicorn worker processes on uvloop and httptools, with no
+file watching and no uvicorn access log (app.access covers it). Several
+workers need the shared SQLite backend; the memory backend keeps its data in
+one process, so it always runs a single worker.
+
+  WEB_CONCURRENCY   worker processes (default: CPU count with sqlite, 1 with memory)
+  HOST, PORT        listen address (default 0.0.0.0:8000)
+"""
+
+import os
+
+import uvicorn
+
+
+def main() -> None:
+    backend = os.environ.get('STORAGE_BACKEND', 'memory')
+    default_workers = (os.cpu_count() or 1) if backend == 'sqlite' else 1
+    workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers)
+    if workers > 1 and backend != 'sqlite':
+        raise SystemExit(f"WEB_CONCURRENCY={workers} needs STORAGE_BACKEND=sqlite: "
+                         f"the {backend} backend cannot be shared between processes")
+    # Workers read it to turn on the shared change log (see app.repository)
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    uvicorn.run(
+        'app.main:app',
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8000')),
+        workers=workers,
+        loop='uvloop',
+        http='httptools',
+        access_log=False,
+    )
+
+
+if __name__ == '__main__':
+    main()
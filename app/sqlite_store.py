@@ -0,0 +1,594 @@
+"""SQLite storage backend with the same interface as the in-memory repositories.
+
+The database runs in WAL mode so readers never wait for the writer, and reads
+go through a memory map of the file. Connections come from a bounded pool
+shared by the executor threads that AsyncRepository runs these calls in;
+sqlite3 keeps a per-connection cache of prepared statements, so every query
+below is a constant SQL string. Writes in one process run one at a time, and
+each one's listeners are called before the next begins, so they hear about
+writes in commit order whichever pool thread ran them.
+
+Several worker processes can share one database file (configure(shared=True)).
+Each process keeps its own listener-fed state (search index, stats, collection
+versions, change feed), so every write is also appended to a `changes` table
+in the same transaction, and a ChangeFollower in each process applies that log
+to the local listeners in commit order: the writer catches up right after its
+commit (so it reads its own writes), the others within CHANGES_POLL_INTERVAL.
+"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+from app import models
+from app.models import School, Student, VersionConflict, now_us
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schools (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    created_us INTEGER NOT NULL,
+    updated_us INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS students (
+    id TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    school_id TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    created_us INTEGER NOT NULL,
+    updated_us INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS students_school_id ON students (school_id);
+CREATE INDEX IF NOT EXISTS students_grade ON students (grade);
+CREATE INDEX IF NOT EXISTS students_age ON students (age);
+CREATE INDEX IF NOT EXISTS schools_created_us ON schools (created_us);
+CREATE INDEX IF NOT EXISTS schools_updated_us ON schools (updated_us);
+CREATE INDEX IF NOT EXISTS students_created_us ON students (created_us);
+CREATE INDEX IF NOT EXISTS students_updated_us ON students (updated_us);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    op TEXT NOT NULL,
+    row TEXT NOT NULL,
+    before TEXT
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+
+# Shared mode: how often other processes' writes are picked up, and how much of the log is kept
+CHANGES_POLL_INTERVAL = 0.1
+CHANGES_BATCH = 1000
+CHANGES_RETENTION = 100000
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = [
+    ("schools", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("students", "version", "INTEGER NOT NULL DEFAULT 1"),
+]
+
+SCHOOL_COLUMNS = "id, name, address, phone, created_us, updated_us, version"
+STUDENT_COLUMNS = "id, first_name, last_name, age, school_id, grade, created_us, updated_us, version"
+
+INSERT_SCHOOL = f"INSERT INTO schools ({SCHOOL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SELECT_SCHOOL = f"SELECT {SCHOOL_COLUMNS} FROM schools WHERE id = ?"
+SELECT_SCHOOLS = f"SELECT {SCHOOL_COLUMNS} FROM schools ORDER BY rowid"
+# Id lists are bound as one JSON array parameter, so the statement text stays constant
+SELECT_SCHOOLS_BY_IDS = f"SELECT {SCHOOL_COLUMNS} FROM schools WHERE id IN (SELECT value FROM json_each(?))"
+SELECT_SCHOOLS_PAGE = f"SELECT {SCHOOL_COLUMNS} FROM schools WHERE id > ? ORDER BY id LIMIT ?"
+UPDATE_SCHOOL = f"""
+UPDATE schools SET name = coalesce(?, name), address = coalesce(?, address), phone = coalesce(?, phone),
+    updated_us = ?, version = version + 1
+WHERE id = ? RETURNING {SCHOOL_COLUMNS}
+"""
+DELETE_SCHOOL = f"DELETE FROM schools WHERE id = ? RETURNING {SCHOOL_COLUMNS}"
+# Import keeps ids: an existing row is updated in place, so it keeps its rowid (collection order)
+UPSERT_SCHOOL = f"""
+INSERT INTO schools ({SCHOOL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET name = excluded.name, address = excluded.address, phone = excluded.phone,
+    created_us = excluded.created_us, updated_us = excluded.updated_us, version = excluded.version
+"""
+
+INSERT_STUDENT = f"INSERT INTO students ({STUDENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SELECT_STUDENT = f"SELECT {STUDENT_COLUMNS} FROM students WHERE id = ?"
+SELECT_STUDENTS = f"SELECT {STUDENT_COLUMNS} FROM students ORDER BY rowid"
+SELECT_STUDENTS_BY_IDS = f"SELECT {STUDENT_COLUMNS} FROM students WHERE id IN (SELECT value FROM json_each(?))"
+SELECT_STUDENTS_PAGE = f"SELECT {STUDENT_COLUMNS} FROM students WHERE id > ? ORDER BY id LIMIT ?"
+SELECT_STUDENTS_BY_SCHOOL = f"SELECT {STUDENT_COLUMNS} FROM students WHERE school_id = ? ORDER BY rowid"
+# Time range queries: one statement per index, so the planner scans the bounded one; open bounds become
+# TIME_MIN/TIME_MAX to keep the statement text constant
+TIME_RANGE = "created_us > ? AND created_us < ? AND updated_us > ? AND updated_us < ?"
+SELECT_STUDENT_IDS_BY_CREATED = f"SELECT id FROM students INDEXED BY students_created_us WHERE {TIME_RANGE} ORDER BY id"
+SELECT_STUDENT_IDS_BY_UPDATED = f"SELECT id FROM students INDEXED BY students_updated_us WHERE {TIME_RANGE} ORDER BY id"
+TIME_MIN = -(1 << 62)
+TIME_MAX = 1 << 62
+# ?school_id=&grade=&age_min=&age_max=: only the given filters go into the statement. Without
+# statistics SQLite picks the grade index over the school one, so the index is named: a school's
+# students are fewer than a grade's. An age range alone is left to SQLite, which scans in id order
+# when the range is wide.
+STUDENT_FILTERS = (('school_id', 'school_id = ?', 'students_school_id'), ('grade', 'grade = ?', 'students_grade'),
+                   ('age_min', 'age >= ?', None), ('age_max', 'age <= ?', None))
+UPDATE_STUDENT = f"""
+UPDATE students SET first_name = coalesce(?, first_name), last_name = coalesce(?, last_name),
+    age = coalesce(?, age), school_id = coalesce(?, school_id), grade = coalesce(?, grade), updated_us = ?,
+    version = version + 1
+WHERE id = ? RETURNING {STUDENT_COLUMNS}
+"""
+DELETE_STUDENT = f"DELETE FROM students WHERE id = ? RETURNING {STUDENT_COLUMNS}"
+UPSERT_STUDENT = f"""
+INSERT INTO students ({STUDENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name,
+    age = excluded.age, school_id = excluded.school_id, grade = excluded.grade, created_us = excluded.created_us,
+    updated_us = excluded.updated_us, version = excluded.version
+"""
+DELETE_STUDENTS_BY_SCHOOL = f"DELETE FROM students WHERE school_id = ? RETURNING {STUDENT_COLUMNS}"
+
+INSERT_CHANGE = "INSERT INTO changes (kind, op, row, before) VALUES (?, ?, ?, ?)"
+SELECT_CHANGES = "SELECT seq, kind, op, row, before FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+SELECT_LAST_CHANGE = "SELECT coalesce(max(seq), 0) FROM changes"
+TRIM_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+
+# (kind, op, entity, before) as passed to models.emit
+Event = Tuple[str, str, object, Optional[object]]
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = 4, mmap_size: int = DEFAULT_MMAP_SIZE):
+        self.path = path
+        self.size = size
+        self.mmap_size = mmap_size
+        self._connections: queue.Queue = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect())
+        with self.connection(write=True) as conn:
+            conn.executescript(SCHEMA)
+            for table, column, definition in MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are handed between executor threads, never used by two at once
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Reads map the file instead of copying pages; worker processes share them through the page cache
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    @contextmanager
+    def connection(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        conn = self._connections.get()
+        try:
+            with conn:
+                if write:
+                    # Take the write lock up front so read-check-write sequences are atomic
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            self._connections.put(conn)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self._connections.get().close()
+
+
+class ChangeFollower:
+    """Applies the shared change log to this process's listeners, in commit order"""
+
+    def __init__(self, pool: ConnectionPool, rebuild: Callable[[List[School], List[Student]], None],
+                 poll_interval: float = CHANGES_POLL_INTERVAL):
+        self._pool = pool
+        self._rebuild = rebuild
+        self._poll_interval = poll_interval
+        self._conn = pool._connect()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.seq = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self._resync()
+        self._thread = threading.Thread(target=self._run, name='sqlite-changes', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+        self._conn.close()
+
+    def _resync(self) -> None:
+        # One read transaction, so the rows and the log position agree
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN")
+            seq = conn.execute(SELECT_LAST_CHANGE).fetchone()[0]
+            schools = [School.from_row(row) for row in conn.execute(SELECT_SCHOOLS)]
+            students = [Student.from_row(row) for row in conn.execute(SELECT_STUDENTS)]
+        self._rebuild(schools, students)
+        self.seq = seq
+
+    def catch_up(self) -> None:
+        with self._lock:
+            while True:
+                rows = self._conn.execute(SELECT_CHANGES, (self.seq, CHANGES_BATCH)).fetchall()
+                if not rows:
+                    return
+                if rows[0][0] != self.seq + 1:
+                    # Fell further behind than the log keeps
+                    logger.warning(f"Change log trimmed past seq {self.seq}; rebuilding from the database")
+                    self._resync()
+                    continue
+                for _, kind, op, row, before in rows:
+                    factory = School.from_row if kind == models.SCHOOL else Student.from_row
+                    models.emit(kind, op, factory(json.loads(row)), factory(json.loads(before)) if before else None)
+                self.seq = rows[-1][0]
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._poll_interval):
+            try:
+                self.catch_up()
+            except Exception as e:
+                logger.error(f"Error following the change log: {e}")
+
+
+_pool: Optional[ConnectionPool] = None
+_shared = False
+# Held by _write() from the start of a write transaction until its listeners have been called
+_write_lock = threading.Lock()
+_follower: Optional[ChangeFollower] = None
+
+
+def configure(path: str, pool_size: int = 4, shared: bool = False,
+              mmap_size: int = DEFAULT_MMAP_SIZE) -> ConnectionPool:
+    """shared: other processes write to the same file; log every change for them (see ChangeFollower)"""
+    global _pool, _shared
+    _pool = ConnectionPool(path, pool_size, mmap_size)
+    _shared = shared
+    return _pool
+
+
+def start_follower(rebuild: Callable[[List[School], List[Student]], None]) -> ChangeFollower:
+    """Shared mode: rebuild local state from the database, then keep applying the change log to it"""
+    global _follower
+    _follower = ChangeFollower(_pool, rebuild)
+    _follower.start()
+    return _follower
+
+
+def stop_follower() -> None:
+    global _follower
+    if _follower:
+        _follower.stop()
+        _follower = None
+
+
+def _connection(write: bool = False):
+    return _pool.connection(write)
+
+
+@contextmanager
+def _write() -> Iterator[Tuple[sqlite3.Connection, List[Event]]]:
+    """A write transaction; the events added to the list go to the change log inside it and to the
+    listeners after it commits. One at a time in this process, and the listeners are called before the
+    next one starts: SQLite orders the commits, this lock keeps the listener calls in that order."""
+    events: List[Event] = []
+    with _write_lock:
+        with _connection(write=True) as conn:
+            yield conn, events
+            _record(conn, events)
+        _publish(events)
+
+
+def _record(conn: sqlite3.Connection, events: List[Event]) -> None:
+    """Append the events to the change log, inside the write transaction that made them"""
+    if not _shared or not events:
+        return
+    conn.executemany(INSERT_CHANGE, [
+        (kind, op, json.dumps(entity.to_row()), json.dumps(before.to_row()) if before else None)
+        for kind, op, entity, before in events
+    ])
+    last_seq = conn.execute(SELECT_LAST_CHANGE).fetchone()[0]
+    if last_seq % CHANGES_BATCH < len(events):
+        conn.execute(TRIM_CHANGES, (last_seq - CHANGES_RETENTION,))
+
+
+def _publish(events: List[Event]) -> None:
+    # Listeners hear about writes once the transaction has committed
+    if _follower:
+        # Through the log, so this process applies its own and other processes' writes in one order
+        _follower.catch_up()
+        return
+    # Runs of one kind and op (a bulk write) go to the listeners as one batch
+    for (kind, op), run in itertools.groupby(events, key=lambda event: event[:2]):
+        run = list(run)
+        models.emit_many(kind, op, [event[2] for event in run], [event[3] for event in run])
+
+
+def _school(row) -> Optional[School]:
+    return School.from_row(row) if row else None
+
+
+def _student(row) -> Optional[Student]:
+    return Student.from_row(row) if row else None
+
+
+def _by_ids(conn: sqlite3.Connection, select_sql: str, ids: List[str], factory) -> List:
+    # Keep the caller's order; ids that do not exist are skipped
+    rows = {row[0]: row for row in conn.execute(select_sql, (json.dumps(ids),))}
+    return [factory(rows[entity_id]) for entity_id in ids if entity_id in rows]
+
+
+def _update(conn: sqlite3.Connection, select_sql: str, update_sql: str, params: tuple, entity_id: str,
+            expected_version: Optional[int], factory):
+    """Update one row; returns (after, before), both None when the row does not exist"""
+    row = conn.execute(select_sql, (entity_id,)).fetchone()
+    if row is None:
+        return None, None
+    before = factory(row)
+    if expected_version is not None and before.version != expected_version:
+        raise VersionConflict(entity_id)
+    return factory(conn.execute(update_sql, params).fetchone()), before
+
+
+def _check_version(conn: sqlite3.Connection, select_sql: str, entity_id: str,
+                   expected_version: Optional[int], factory) -> None:
+    if expected_version is None:
+        return
+    entity = factory(conn.execute(select_sql, (entity_id,)).fetchone())
+    if entity and entity.version != expected_version:
+        raise VersionConflict(entity_id)
+
+
+def _delete_schools(conn: sqlite3.Connection,
+                    school_ids: List[str]) -> Tuple[List[Optional[School]], List[Student]]:
+    removed = []
+    orphans = []
+    for school_id in school_ids:
+        school = _school(conn.execute(DELETE_SCHOOL, (school_id,)).fetchone())
+        if school:
+            # Cascade: drop the school's students so none of them is left orphaned
+            orphans.extend(map(Student.from_row, conn.execute(DELETE_STUDENTS_BY_SCHOOL, (school_id,))))
+        removed.append(school)
+    return removed, orphans
+
+
+def _school_delete_events(removed: List[Optional[School]], orphans: List[Student]) -> List[Event]:
+    # Cascaded students first
+    return ([(models.STUDENT, models.DELETE, student, None) for student in orphans] +
+            [(models.SCHOOL, models.DELETE, school, None) for school in removed if school])
+
+
+def _delete_students(conn: sqlite3.Connection, student_ids: List[str]) -> List[Optional[Student]]:
+    return [_student(conn.execute(DELETE_STUDENT, (student_id,)).fetchone()) for student_id in student_ids]
+
+
+def _student_delete_events(removed: List[Optional[Student]]) -> List[Event]:
+    return [(models.STUDENT, models.DELETE, student, None) for student in removed if student]
+
+
+def _import(conn: sqlite3.Connection, select_sql: str, upsert_sql: str, kind: str, entities: List,
+            factory) -> List[Event]:
+    """Upsert entities that keep their ids; a replaced row's version is carried on, as in the memory backend"""
+    entities = list({entity.id: entity for entity in entities}.values())
+    befores = {before.id: before for before in _by_ids(conn, select_sql, [entity.id for entity in entities], factory)}
+    for entity in entities:
+        before = befores.get(entity.id)
+        if before is not None:
+            entity.version = before.version + 1
+    conn.executemany(upsert_sql, [entity.to_row() for entity in entities])
+    return [(kind, models.PUT, entity, befores.get(entity.id)) for entity in entities]
+
+
+def export_batches(batch_size: int) -> Iterator[Tuple[str, List]]:
+    """Point-in-time batches of both tables: in WAL mode a read transaction sees the database as of its
+    first read, whatever is committed meanwhile. Holds one pool connection until exhausted or closed."""
+    with _connection() as conn:
+        conn.execute("BEGIN")
+        for kind, select_sql, factory in ((models.SCHOOL, SELECT_SCHOOLS, School.from_row),
+                                          (models.STUDENT, SELECT_STUDENTS, Student.from_row)):
+            cursor = conn.execute(select_sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield kind, [factory(row) for row in rows]
+
+
+class SqliteSchoolRepository:
+    @staticmethod
+    def create_school(name: str, address: str, phone: str) -> School:
+        return SqliteSchoolRepository.create_schools([{'name': name, 'address': address, 'phone': phone}])[0]
+
+    @staticmethod
+    def create_schools(items: List[Dict]) -> List[School]:
+        schools = [School(**item) for item in items]
+        with _write() as (conn, events):
+            conn.executemany(INSERT_SCHOOL, [school.to_row() for school in schools])
+            events.extend((models.SCHOOL, models.PUT, school, None) for school in schools)
+        return schools
+
+    @staticmethod
+    def import_schools(schools: List[School]) -> None:
+        with _write() as (conn, events):
+            events.extend(_import(conn, SELECT_SCHOOLS_BY_IDS, UPSERT_SCHOOL, models.SCHOOL, schools,
+                                  School.from_row))
+
+    @staticmethod
+    def get_school(school_id: str) -> Optional[School]:
+        with _connection() as conn:
+            return _school(conn.execute(SELECT_SCHOOL, (school_id,)).fetchone())
+
+    @staticmethod
+    def get_schools_by_ids(school_ids: List[str]) -> List[School]:
+        with _connection() as conn:
+            return _by_ids(conn, SELECT_SCHOOLS_BY_IDS, school_ids, School.from_row)
+
+    @staticmethod
+    def get_all_schools() -> List[School]:
+        with _connection() as conn:
+            return [School.from_row(row) for row in conn.execute(SELECT_SCHOOLS)]
+
+    @staticmethod
+    def get_schools_page(after: Optional[str] = None, limit: int = 100) -> List[School]:
+        with _connection() as conn:
+            return [School.from_row(row) for row in conn.execute(SELECT_SCHOOLS_PAGE, (after or '', limit))]
+
+    @staticmethod
+    def update_school(school_id: str, name: str = None, address: str = None, phone: str = None,
+                      expected_version: Optional[int] = None) -> Optional[School]:
+        return SqliteSchoolRepository.update_schools([{
+            'school_id': school_id, 'name': name, 'address': address, 'phone': phone,
+            'expected_version': expected_version,
+        }])[0]
+
+    @staticmethod
+    def update_schools(items: List[Dict]) -> List[Optional[School]]:
+        with _write() as (conn, events):
+            changes = [
+                _update(conn, SELECT_SCHOOL, UPDATE_SCHOOL, (
+                    item.get('name') or None, item.get('address') or None, item.get('phone') or None,
+                    now_us(), item['school_id'],
+                ), item['school_id'], item.get('expected_version'), _school)
+                for item in items
+            ]
+            events.extend((models.SCHOOL, models.PUT, school, before) for school, before in changes if school)
+        return [school for school, _ in changes]
+
+    @staticmethod
+    def delete_school(school_id: str, expected_version: Optional[int] = None) -> bool:
+        with _write() as (conn, events):
+            _check_version(conn, SELECT_SCHOOL, school_id, expected_version, _school)
+            removed, orphans = _delete_schools(conn, [school_id])
+            events.extend(_school_delete_events(removed, orphans))
+        return removed[0] is not None
+
+    @staticmethod
+    def delete_schools(school_ids: List[str]) -> List[bool]:
+        with _write() as (conn, events):
+            removed, orphans = _delete_schools(conn, school_ids)
+            events.extend(_school_delete_events(removed, orphans))
+        return [school is not None for school in removed]
+
+
+class SqliteStudentRepository:
+    @staticmethod
+    def create_student(first_name: str, last_name: str, age: int, school_id: str, grade: str) -> Student:
+        return SqliteStudentRepository.create_students([{
+            'first_name': first_name, 'last_name': last_name, 'age': age, 'school_id': school_id, 'grade': grade,
+        }])[0]
+
+    @staticmethod
+    def create_students(items: List[Dict]) -> List[Student]:
+        students = [Student(**item) for item in items]
+        with _write() as (conn, events):
+            conn.executemany(INSERT_STUDENT, [student.to_row() for student in students])
+            events.extend((models.STUDENT, models.PUT, student, None) for student in students)
+        return students
+
+    @staticmethod
+    def import_students(students: List[Student]) -> None:
+        with _write() as (conn, events):
+            events.extend(_import(conn, SELECT_STUDENTS_BY_IDS, UPSERT_STUDENT, models.STUDENT, students,
+                                  Student.from_row))
+
+    @staticmethod
+    def get_student(student_id: str) -> Optional[Student]:
+        with _connection() as conn:
+            return _student(conn.execute(SELECT_STUDENT, (student_id,)).fetchone())
+
+    @staticmethod
+    def get_students_by_ids(student_ids: List[str]) -> List[Student]:
+        with _connection() as conn:
+            return _by_ids(conn, SELECT_STUDENTS_BY_IDS, student_ids, Student.from_row)
+
+    @staticmethod
+    def get_all_students() -> List[Student]:
+        with _connection() as conn:
+            return [Student.from_row(row) for row in conn.execute(SELECT_STUDENTS)]
+
+    @staticmethod
+    def get_students_page(after: Optional[str] = None, limit: int = 100) -> List[Student]:
+        with _connection() as conn:
+            return [Student.from_row(row) for row in conn.execute(SELECT_STUDENTS_PAGE, (after or '', limit))]
+
+    @staticmethod
+    def get_students_by_school(school_id: str) -> List[Student]:
+        with _connection() as conn:
+            return [Student.from_row(row) for row in conn.execute(SELECT_STUDENTS_BY_SCHOOL, (school_id,))]
+
+    @staticmethod
+    def get_student_ids_in_range(created_after: Optional[int] = None, created_before: Optional[int] = None,
+                                 updated_after: Optional[int] = None,
+                                 updated_before: Optional[int] = None) -> List[str]:
+        by_created = created_after is not None or created_before is not None
+        params = (TIME_MIN if created_after is None else created_after,
+                  TIME_MAX if created_before is None else created_before,
+                  TIME_MIN if updated_after is None else updated_after,
+                  TIME_MAX if updated_before is None else updated_before)
+        with _connection() as conn:
+            return [row[0] for row in conn.execute(
+                SELECT_STUDENT_IDS_BY_CREATED if by_created else SELECT_STUDENT_IDS_BY_UPDATED, params)]
+
+    @staticmethod
+    def get_student_ids_filtered(school_id: Optional[str] = None, grade: Optional[str] = None,
+                                 age_min: Optional[int] = None, age_max: Optional[int] = None) -> List[str]:
+        given = {'school_id': school_id, 'grade': grade, 'age_min': age_min, 'age_max': age_max}
+        filters = [(condition, index, given[name]) for name, condition, index in STUDENT_FILTERS
+                   if given[name] is not None]
+        indexes = [index for _, index, _ in filters if index]
+        indexed = f" INDEXED BY {indexes[0]}" if indexes else ""
+        where = " WHERE " + " AND ".join(condition for condition, _, _ in filters) if filters else ""
+        with _connection() as conn:
+            return [row[0] for row in conn.execute(f"SELECT id FROM students{indexed}{where} ORDER BY id",
+                                                   [value for _, _, value in filters])]
+
+    @staticmethod
+    def update_student(student_id: str, first_name: str = None, last_name: str = None,
+                       age: int = None, school_id: str = None, grade: str = None,
+                       expected_version: Optional[int] = None) -> Optional[Student]:
+        return SqliteStudentRepository.update_students([{
+            'student_id': student_id, 'first_name': first_name, 'last_name': last_name, 'age': age,
+            'school_id': school_id, 'grade': grade, 'expected_version': expected_version,
+        }])[0]
+
+    @staticmethod
+    def update_students(items: List[Dict]) -> List[Optional[Student]]:
+        with _write() as (conn, events):
+            changes = [
+                _update(conn, SELECT_STUDENT, UPDATE_STUDENT, (
+                    item.get('first_name') or None, item.get('last_name') or None, item.get('age'),
+                    item.get('school_id') or None, item.get('grade') or None, now_us(), item['student_id'],
+                ), item['student_id'], item.get('expected_version'), _student)
+                for item in items
+            ]
+            events.extend((models.STUDENT, models.PUT, student, before) for student, before in changes if student)
+        return [student for student, _ in changes]
+
+    @staticmethod
+    def delete_student(student_id: str, expected_version: Optional[int] = None) -> bool:
+        with _write() as (conn, events):
+            _check_version(conn, SELECT_STUDENT, student_id, expected_version, _student)
+            removed = _delete_students(conn, [student_id])
+            events.extend(_student_delete_events(removed))
+        return removed[0] is not None
+
+    @staticmethod
+    def delete_students(student_ids: List[str]) -> List[bool]:
+        with _write() as (conn, events):
+            removed = _delete_students(conn, student_ids)
+            events.extend(_student_delete_events(removed))
+        return [student is not None for student in removed]
@@ -0,0 +1,186 @@
+"""Student aggregates behind GET /stats and GET /schools/{school_id}/stats.
+
+Counters (students, per-grade counts, age histogram) are kept for the whole
+dataset and for each school, and follow repository writes through a models
+listener: a create adds the student to its buckets, a delete takes it out,
+and an update takes out the previous state (the event's `before`) and adds
+the new one, so a move between schools or a grade/age change adjusts both
+the old and the new buckets. Every write is O(1) and so is every read.
+
+Like the search index, the counters are rebuilt once at startup from the
+backend; verify() recomputes them from scratch to check they still agree.
+"""
+
+from collections import Counter
+from operator import attrgetter
+from typing import Dict, Iterable, List
+import threading
+
+from app import models
+
+
+def _bump(counter: Counter, key, count: int) -> None:
+    # get() rather than counter[key]: a missing key would go through Counter.__missing__
+    value = counter.get(key, 0) + count
+    if value:
+        counter[key] = value
+    else:
+        del counter[key]
+
+
+class Aggregate:
+    __slots__ = ('students', 'grades', 'ages')
+
+    def __init__(self):
+        self.students = 0
+        self.grades: Counter = Counter()
+        self.ages: Counter = Counter()
+
+    def add(self, student, sign: int = 1) -> None:
+        self.count(student.grade, student.age, sign)
+
+    def count(self, grade: str, age: int, students: int) -> None:
+        self.students += students
+        _bump(self.grades, grade, students)
+        _bump(self.ages, age, students)
+
+    def to_dict(self) -> Dict:
+        return {
+            'students': self.students,
+            'grades': dict(sorted(self.grades.items())),
+            'ages': {str(age): count for age, count in sorted(self.ages.items())},
+        }
+
+
+_school_id = attrgetter('school_id')
+_grade = attrgetter('grade')
+_age = attrgetter('age')
+
+_lock = threading.Lock()
+schools = 0
+total = Aggregate()
+# school_id -> aggregate over that school's students; missing until the school has any
+by_school: Dict[str, Aggregate] = {}
+
+
+def _school_aggregate(school_id: str) -> Aggregate:
+    aggregate = by_school.get(school_id)
+    if aggregate is None:
+        aggregate = by_school[school_id] = Aggregate()
+    return aggregate
+
+
+def _add(student, sign: int) -> None:
+    total.add(student, sign)
+    _school_aggregate(student.school_id).add(student, sign)
+
+
+def _on_mutation(kind: str, op: str, entity, before=None) -> None:
+    global schools
+    with _lock:
+        if kind == models.SCHOOL:
+            if op == models.DELETE:
+                schools -= 1
+                # Its students were deleted (and counted out) before the school itself
+                by_school.pop(entity.id, None)
+            elif before is None:
+                schools += 1
+            return
+        if before is not None:
+            _add(before, -1)
+        if op == models.PUT:
+            _add(entity, 1)
+        else:
+            _add(entity, -1)
+
+
+def _tally(students: List):
+    # Counted by Counter itself over mapped columns, with no Python code run per student
+    school_ids = list(map(_school_id, students))
+    grades = list(map(_grade, students))
+    ages = list(map(_age, students))
+    return (Counter(school_ids), Counter(zip(school_ids, grades)), Counter(zip(school_ids, ages)),
+            Counter(grades), Counter(ages))
+
+
+def _on_mutations(kind: str, op: str, entities: List, befores: List) -> None:
+    if kind == models.SCHOOL:
+        for school, before in zip(entities, befores):
+            _on_mutation(kind, op, school, before)
+        return
+    # Net changes per school, per (school, grade) and per (school, age), each applied once: a batch
+    # has far fewer of those than students, and the dataset totals only sum them up per grade and age
+    added = entities if op == models.PUT else []
+    removed = [before for before in befores if before is not None] + (entities if op == models.DELETE else [])
+    tallies = _tally(added)
+    if removed:
+        for counter, subtracted in zip(tallies, _tally(removed)):
+            counter.subtract(subtracted)
+    by_count, by_grade, by_age, grades, ages = tallies
+    with _lock:
+        total.students += sum(by_count.values())
+        aggregates = {school_id: _school_aggregate(school_id) for school_id in by_count}
+        for school_id, count in by_count.items():
+            aggregates[school_id].students += count
+        for (school_id, grade), count in by_grade.items():
+            if count:
+                _bump(aggregates[school_id].grades, grade, count)
+        for (school_id, age), count in by_age.items():
+            if count:
+                _bump(aggregates[school_id].ages, age, count)
+        for grade, count in grades.items():
+            if count:
+                _bump(total.grades, grade, count)
+        for age, count in ages.items():
+            if count:
+                _bump(total.ages, age, count)
+
+
+models.add_listener(_on_mutation, _on_mutations)
+
+
+def overall() -> Dict:
+    with _lock:
+        return dict(total.to_dict(), schools=schools)
+
+
+def for_school(school_id: str) -> Dict:
+    with _lock:
+        aggregate = by_school.get(school_id)
+        return (aggregate or Aggregate()).to_dict()
+
+
+def _compute(all_schools: Iterable, all_students: Iterable):
+    computed_total = Aggregate()
+    computed_by_school: Dict[str, Aggregate] = {}
+    for student in all_students:
+        computed_total.add(student)
+        aggregate = computed_by_school.get(student.school_id)
+        if aggregate is None:
+            aggregate = computed_by_school[student.school_id] = Aggregate()
+        aggregate.add(student)
+    return sum(1 for _ in all_schools), computed_total, computed_by_school
+
+
+def rebuild(all_schools: Iterable, all_students: Iterable) -> None:
+    global schools, total, by_school
+    computed = _compute(all_schools, all_students)
+    with _lock:
+        schools, total, by_school = computed
+
+
+def verify(all_schools: Iterable, all_students: Iterable) -> List[str]:
+    """Recompute the aggregates from scratch; returns the mismatches (empty when consistent)"""
+    computed_schools, computed_total, computed_by_school = _compute(all_schools, all_students)
+    mismatches = []
+    with _lock:
+        if computed_schools != schools:
+            mismatches.append(f"schools: counted {schools}, actual {computed_schools}")
+        if computed_total.to_dict() != total.to_dict():
+            mismatches.append(f"total: counted {total.to_dict()}, actual {computed_total.to_dict()}")
+        for school_id in set(by_school) | set(computed_by_school):
+            counted = by_school.get(school_id, Aggregate()).to_dict()
+            actual = computed_by_school.get(school_id, Aggregate()).to_dict()
+            if counted != actual:
+                mismatches.append(f"school {school_id}: counted {counted}, actual {actual}")
+    return mismatches
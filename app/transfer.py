@@ -0,0 +1,436 @@
+"""Streaming export and import of the whole dataset: GET /export, POST /import.
+
+Export writes both stores as of one moment (repository.export_batches) into a
+gzip file, NDJSON or CSV:
+
+  NDJSON  one record per line, its JSON with "type" ("school" or "student") in front
+  CSV     a header, then one row per record over both record types' columns
+          (CSV_COLUMNS); columns of the other type are left empty
+
+Schools come first, so a file imports in one pass. Batches of BATCH_ROWS
+records are fetched, encoded and compressed one at a time in the repository's
+executor: memory stays flat however large the store, and the event loop keeps
+serving meanwhile.
+
+Import reads the same formats, gzip-compressed or not, as the upload arrives.
+Complete lines (CSV: complete rows, a quoted field may span lines) are
+validated a chunk at a time in the executor and turned into records with
+from_dict, which keeps their ids and timestamps. Every BATCH_ROWS valid records are stored
+with import_schools/import_students: a record whose id is already stored
+replaces it. Invalid rows and students of unknown schools are skipped and
+reported (the first MAX_ERRORS of them) with their row numbers.
+
+Both log rows, seconds and rows/s when done; import also returns them.
+"""
+
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Annotated, AsyncIterator, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+import asyncio
+import csv
+import gc
+import io
+import json
+import logging
+import threading
+import zlib
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from app import models
+from app.models import School, Student
+
+logger = logging.getLogger(__name__)
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = (NDJSON, CSV)
+MEDIA_TYPE = 'application/gzip'
+
+BATCH_ROWS = 10000
+GZIP_LEVEL = 6
+MAX_ERRORS = 100
+MAX_ROW_BYTES = 64 * 1024
+INFLATE_CHUNK = 1024 * 1024
+
+CSV_COLUMNS = ('type', 'id', 'name', 'address', 'phone', 'first_name', 'last_name', 'age', 'school_id', 'grade',
+               'created_at', 'updated_at')
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+# orjson when installed parses a chunk several times faster; both raise ValueError subclasses
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+class SchoolRow(BaseModel):
+    type: Literal['school']
+    id: str = Field(..., min_length=1)
+    name: str = Field(..., min_length=1)
+    address: str = Field(..., min_length=1)
+    phone: str = Field(..., min_length=1)
+    created_at: str
+    updated_at: str
+
+
+class StudentRow(BaseModel):
+    type: Literal['student']
+    id: str = Field(..., min_length=1)
+    first_name: str = Field(..., min_length=1)
+    last_name: str = Field(..., min_length=1)
+    age: int = Field(..., ge=5, le=25)
+    school_id: str = Field(..., min_length=1)
+    grade: str = Field(..., min_length=1)
+    created_at: str
+    updated_at: str
+
+
+Row = Annotated[Union[SchoolRow, StudentRow], Field(discriminator='type')]
+_row = TypeAdapter(Row)
+
+
+def _ndjson(kind: str, entities: List) -> bytes:
+    # Cached record JSON with the type spliced in after the opening brace
+    prefix = b'{"type":"' + kind.encode() + b'",'
+    return b''.join([prefix + entity.to_json()[1:] + b'\n' for entity in entities])
+
+
+def _csv(kind: str, entities: List) -> bytes:
+    if kind == models.SCHOOL:
+        rows = [(kind, school.id, school.name, school.address, school.phone, '', '', '', '', '',
+                 school.created_at, school.updated_at) for school in entities]
+    else:
+        rows = [(kind, student.id, '', '', '', student.first_name, student.last_name, student.age,
+                 student.school_id, student.grade, student.created_at, student.updated_at) for student in entities]
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode()
+
+
+class Export:
+    """The gzip file for a sequence of (kind, records) batches, one compressed chunk per batch"""
+
+    def __init__(self, batches: Iterator[Tuple[str, List]], fmt: str):
+        self.batches = batches
+        self.format = fmt
+        self.rows = 0
+
+    def chunks(self) -> Iterator[bytes]:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        encode = _ndjson if self.format == NDJSON else _csv
+        if self.format == CSV:
+            yield compressor.compress(','.join(CSV_COLUMNS).encode() + b'\r\n')
+        for kind, entities in self.batches:
+            self.rows += len(entities)
+            yield compressor.compress(encode(kind, entities))
+        yield compressor.flush()
+
+
+async def export_stream(batches: Iterator[Tuple[str, List]], fmt: str, executor=None) -> AsyncIterator[bytes]:
+    """Response body for GET /export: every step of the export runs in the executor"""
+    export = Export(batches, fmt)
+    chunks = export.chunks()
+    loop = asyncio.get_running_loop()
+    started = perf_counter()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+    finally:
+        try:
+            # Gives the SQLite connection back at once when the client goes away
+            chunks.close()
+        except ValueError:
+            # Still running in the executor: it is closed when collected
+            pass
+    seconds = perf_counter() - started
+    logger.info("Exported", extra={'format': fmt, 'rows': export.rows, 'seconds': round(seconds, 3),
+                                   'rows_per_sec': round(export.rows / seconds) if seconds else 0})
+
+
+def _message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    # The union tag ("school"/"student") heads the location of a field error
+    field = '.'.join(str(part) for part in first['loc'] if part not in (models.SCHOOL, models.STUDENT))
+    return f"{field}: {first['msg']}" if field else first['msg']
+
+
+_TEXT_FIELDS = {
+    models.SCHOOL: ('id', 'name', 'address', 'phone', 'created_at', 'updated_at'),
+    models.STUDENT: ('id', 'first_name', 'last_name', 'school_id', 'grade', 'created_at', 'updated_at'),
+}
+_FACTORIES = {models.SCHOOL: School.from_dict, models.STUDENT: Student.from_dict}
+
+
+def _plain(item) -> bool:
+    """A row the row models accept as it is, told without building them; the rest go through the models"""
+    if type(item) is not dict:
+        return False
+    fields = _TEXT_FIELDS.get(item.get('type'))
+    if fields is None:
+        return False
+    for field in fields:
+        value = item.get(field)
+        if type(value) is not str or not value:
+            return False
+    if fields is _TEXT_FIELDS[models.STUDENT]:
+        age = item.get('age')
+        return type(age) is int and 5 <= age <= 25
+    return True
+
+
+def _loads(line: bytes):
+    try:
+        return _json_loads(line)
+    except ValueError:
+        return None
+
+
+class Importer:
+    """Parses an upload fed chunk by chunk into (row number, School/Student) records.
+
+    Memory is bounded whatever the upload: gzip is inflated at most INFLATE_CHUNK bytes at a time,
+    and a row (line; CSV: record) longer than MAX_ROW_BYTES is reported and skipped rather than
+    buffered until it ends.
+    """
+
+    def __init__(self, fmt: str):
+        self.format = fmt
+        self.rows = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self._decompressor = None
+        self._started = False
+        self._pending = b''
+        self._skipping = False
+        self._header: Optional[List[str]] = None
+
+    def error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    def feed(self, data: bytes) -> Iterator[List[Tuple[int, object]]]:
+        """Records of the complete rows so far, a list at a time"""
+        if not self._started:
+            # gzip is told by its magic bytes, so a compressed and a plain upload both work
+            data = self._pending + data
+            self._pending = b''
+            if len(data) < len(_GZIP_MAGIC):
+                self._pending = data
+                return
+            self._started = True
+            if data.startswith(_GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(31)
+        if self._decompressor is None:
+            yield self._split(data)
+            return
+        while data:
+            # What is not inflated yet waits in unconsumed_tail, so a small upload chunk cannot expand at once
+            inflated = self._decompressor.decompress(data, INFLATE_CHUNK)
+            data = self._decompressor.unconsumed_tail
+            yield self._split(inflated)
+
+    def finish(self) -> List[Tuple[int, object]]:
+        data = b''
+        if self._decompressor is not None:
+            data = self._decompressor.flush()
+            if not self._decompressor.eof:
+                raise ValueError("Truncated gzip upload")
+        records = self._split(data)
+        if self._pending.strip() and not self._skipping:
+            records.extend(self._parse(self._pending))
+        self._pending = b''
+        return records
+
+    def _split(self, data: bytes) -> List[Tuple[int, object]]:
+        """Parse the complete rows of the buffered data; keep the incomplete rest"""
+        data = self._pending + data
+        self._pending = b''
+        records = []
+        while data:
+            if self._skipping:
+                newline = data.find(b'\n')
+                if newline < 0:
+                    return records
+                data = data[newline + 1:]
+                self._skipping = False
+            end = data.rfind(b'\n') + 1
+            # CSV: a quoted field may span lines, the cut goes after the last line that closes its quotes
+            if self.format == CSV and data.count(b'"', 0, end) % 2:
+                end = _csv_boundary(data, end)
+            if end:
+                records.extend(self._parse(data[:end]))
+                data = data[end:]
+            if len(data) <= MAX_ROW_BYTES:
+                self._pending = data
+                return records
+            # Too long for a row, or a quote that never closes: reported, and dropped up to its line end
+            self.rows += 1
+            self.error(self.rows, f"Row longer than {MAX_ROW_BYTES} bytes")
+            self._skipping = True
+        return records
+
+    def _parse(self, data: bytes) -> List[Tuple[int, object]]:
+        if self.format == NDJSON:
+            lines = data.split(b'\n')
+            if not lines[-1]:
+                lines.pop()
+            numbers = range(self.rows + 1, self.rows + len(lines) + 1)
+            self.rows += len(lines)
+            try:
+                items = _json_loads(b'[' + b','.join(lines) + b']')
+            except ValueError:
+                items = None
+            if items is None or len(items) != len(lines):
+                # A blank or malformed line (or one holding two documents): each line on its own
+                numbered = [(number, line) for number, line in zip(numbers, lines) if line.strip()]
+                numbers = [number for number, _ in numbered]
+                lines = [line for _, line in numbered]
+                items = [_loads(line) for line in lines]
+            return self._records(numbers, lines, items, _row.validate_json)
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8-sig' if self._header is None else 'utf-8'))))
+        if self._header is None and rows:
+            self._header = rows.pop(0)
+        numbers, items = [], []
+        for row in rows:
+            self.rows += 1
+            if not row:
+                continue
+            if len(row) != len(self._header):
+                self.error(self.rows, f"Expected {len(self._header)} columns, got {len(row)}")
+                continue
+            item = dict(zip(self._header, row))
+            # Converted as the row model would; any other age is left for it to coerce or reject
+            age = item.get('age')
+            if age and age.isascii() and age.isdigit() and item.get('type') == models.STUDENT:
+                item['age'] = int(age)
+            numbers.append(self.rows)
+            items.append(item)
+        return self._records(numbers, items, items, _row.validate_python)
+
+    def _records(self, numbers: Iterable[int], raws: List, items: List, validate) -> List[Tuple[int, object]]:
+        records = []
+        for number, raw, item in zip(numbers, raws, items):
+            if not _plain(item):
+                # Coerced or rejected by the row models, which also word the error
+                try:
+                    item = validate(raw).__dict__
+                except ValidationError as e:
+                    self.error(number, _message(e))
+                    continue
+            try:
+                records.append((number, _FACTORIES[item['type']](item)))
+            except ValueError as e:
+                self.error(number, str(e))
+        return records
+
+
+def _csv_boundary(data: bytes, end: int) -> int:
+    """End of the last of the lines before end after which no quoted field is open"""
+    boundary = position = quotes = 0
+    while position < end:
+        newline = data.index(b'\n', position, end)
+        quotes += data.count(b'"', position, newline)
+        position = newline + 1
+        if not quotes % 2:
+            boundary = position
+    return boundary
+
+
+async def _store(records: List[Tuple[int, object]], importer: Importer, counts: Dict[str, int]) -> None:
+    from app.repository import schools_repo, students_repo
+
+    schools = [record for _, record in records if isinstance(record, School)]
+    if schools:
+        await schools_repo.import_schools(schools)
+        counts['schools'] += len(schools)
+    students = [(number, record) for number, record in records if isinstance(record, Student)]
+    if not students:
+        return
+    school_ids = list({student.school_id for _, student in students})
+    known = {school.id for school in await schools_repo.get_schools_by_ids(school_ids)}
+    valid = []
+    for number, student in students:
+        if student.school_id in known:
+            valid.append(student)
+        else:
+            importer.error(number, "School not found")
+    if valid:
+        await students_repo.import_students(valid)
+        counts['students'] += len(valid)
+
+
+# Import steps running, and whether the cyclic GC was enabled before the first of them paused it
+_gc_lock = threading.Lock()
+_paused = 0
+_gc_was_enabled = False
+
+
+@contextmanager
+def _cyclic_gc_paused():
+    # A step allocates thousands of tracked objects and none of them form cycles; collecting while
+    # they are created costs a third of the import (as when persistence loads a snapshot). Paused for
+    # one step at a time (a parsed chunk, a stored batch), never across a wait for the upload.
+    global _paused, _gc_was_enabled
+    with _gc_lock:
+        if _paused == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _paused += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _paused -= 1
+            if _paused == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+def _next_records(parsed: Iterator[List[Tuple[int, object]]]) -> Optional[List[Tuple[int, object]]]:
+    with _cyclic_gc_paused():
+        return next(parsed, None)
+
+
+def _finish(importer: Importer) -> List[Tuple[int, object]]:
+    with _cyclic_gc_paused():
+        return importer.finish()
+
+
+async def import_stream(chunks: AsyncIterator[bytes], fmt: str, executor=None) -> Dict:
+    """Body of POST /import: parses in the executor as it arrives and stores every BATCH_ROWS valid records"""
+    importer = Importer(fmt)
+    loop = asyncio.get_running_loop()
+    counts = {'schools': 0, 'students': 0}
+    started = perf_counter()
+    records: List[Tuple[int, object]] = []
+    async for chunk in chunks:
+        parsed = importer.feed(chunk)
+        while True:
+            # One inflated piece at a time, so the event loop keeps serving while a chunk is parsed
+            part = await loop.run_in_executor(executor, _next_records, parsed)
+            if part is None:
+                break
+            records.extend(part)
+            if len(records) >= BATCH_ROWS:
+                with _cyclic_gc_paused():
+                    await _store(records, importer, counts)
+                records = []
+    records.extend(await loop.run_in_executor(executor, _finish, importer))
+    with _cyclic_gc_paused():
+        await _store(records, importer, counts)
+    seconds = perf_counter() - started
+    imported = counts['schools'] + counts['students']
+    report = dict(counts, failed=importer.failed, errors=sorted(importer.errors, key=lambda error: error['row']),
+                  seconds=round(seconds, 3), rows_per_sec=round(imported / seconds) if seconds else 0)
+    logger.info("Imported", extra={'format': fmt, 'schools': counts['schools'], 'students': counts['students'],
+                                   'failed': importer.failed, 'seconds': report['seconds'],
+                                   'rows_per_sec': report['rows_per_sec']})
+    return report
@@ -0,0 +1,155 @@
+"""Version counters and HTTP validators for conditional requests.
+
+Entities carry their own version (bumped by touch()), tagged together with
+their created and updated times. Collections — all schools, all students and
+the students of each school — keep counters here that every repository
+mutation bumps through a models listener, so a GET can answer
+If-None-Match / If-Modified-Since with 304 before fetching or serializing
+anything.
+
+Collection counters live in process memory and start from zero, so their
+ETags include a per-process boot id: a restart never reuses an old tag for
+different content.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional
+import secrets
+
+from starlette.requests import Request
+
+from app import models
+from app.models import now_us
+
+BOOT_ID = secrets.token_hex(4)
+
+
+class CollectionVersion:
+    __slots__ = ('version', 'modified_us')
+
+    def __init__(self):
+        self.version = 0
+        self.modified_us = now_us()
+
+    def bump(self) -> None:
+        self.version += 1
+        self.modified_us = now_us()
+
+
+schools = CollectionVersion()
+students = CollectionVersion()
+# school_id -> version of that school's student list; created on first change
+school_students: Dict[str, CollectionVersion] = {}
+_initial = CollectionVersion()
+
+
+def invalidate() -> None:
+    """Bump every collection, for when the state behind them was replaced wholesale"""
+    schools.bump()
+    students.bump()
+    _initial.bump()
+    for version in school_students.values():
+        version.bump()
+
+
+def for_school(school_id: str) -> CollectionVersion:
+    return school_students.get(school_id, _initial)
+
+
+def _bump_school(school_id: str) -> None:
+    version = school_students.get(school_id)
+    if version is None:
+        version = school_students[school_id] = CollectionVersion()
+    version.bump()
+
+
+def _on_mutation(kind: str, op: str, entity, before=None) -> None:
+    if kind == models.SCHOOL:
+        schools.bump()
+        if op == models.DELETE:
+            school_students.pop(entity.id, None)
+        return
+    students.bump()
+    _bump_school(entity.school_id)
+    if before is not None and before.school_id != entity.school_id:
+        _bump_school(before.school_id)
+
+
+def _on_mutations(kind: str, op: str, entities: List, befores: List) -> None:
+    # One bump per collection for the whole batch
+    if kind == models.SCHOOL:
+        schools.bump()
+        if op == models.DELETE:
+            for school in entities:
+                school_students.pop(school.id, None)
+        return
+    students.bump()
+    school_ids = {student.school_id for student in entities}
+    school_ids.update(before.school_id for before in befores if before is not None)
+    for school_id in school_ids:
+        _bump_school(school_id)
+
+
+models.add_listener(_on_mutation, _on_mutations)
+
+
+def entity_tag(entity) -> str:
+    # The version starts over at 1 when a record is deleted and its id imported again, so the
+    # record's timestamps go in too: a tag never names two different states of one id
+    return f'{entity.version}.{entity.created_us:x}.{entity.updated_us:x}'
+
+
+def entity_etag(entity, variant: str = '') -> str:
+    return f'"{entity_tag(entity)}{variant}"'
+
+
+def collection_etag(version: CollectionVersion, variant: str = '') -> str:
+    return f'"{BOOT_ID}.{version.version}{variant}"'
+
+
+def http_date(us: int) -> str:
+    return format_datetime(datetime.fromtimestamp(us // 1_000_000, timezone.utc), usegmt=True)
+
+
+def _tags(header: str):
+    return [tag.strip() for tag in header.split(',')]
+
+
+def none_match(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison
+    return header.strip() == '*' or etag in (tag[2:] if tag.startswith('W/') else tag for tag in _tags(header))
+
+
+def match(header: str, etag: str) -> bool:
+    # If-Match uses the strong comparison
+    return header.strip() == '*' or etag in _tags(header)
+
+
+def not_modified(request: Request, etag: str, modified_us: int) -> bool:
+    """True when the client's cached copy is still current"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return none_match(if_none_match, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return modified_us // 1_000_000 <= int(since.timestamp())
+    return False
+
+
+def validators(etag: str, modified_us: int) -> Dict[str, str]:
+    return {'ETag': etag, 'Last-Modified': http_date(modified_us)}
+
+
+def if_match_failed(request: Request, entity: Optional[object]) -> bool:
+    """True when an If-Match header is present and does not match the entity"""
+    if_match = request.headers.get('if-match')
+    if if_match is None:
+        return False
+    return entity is None or not match(if_match, entity_etag(entity))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Всплеск нагрузки на под с лимитом CPU: uvicorn без контроля допуска и с ним.
+
+Лимит CPU воспроизводится так же, как его применяет CFS в Kubernetes: процесс
+сервера получает --cpu от каждого периода 100 мс (200m = 20 мс работы, 80 мс
+остановки через SIGSTOP/SIGCONT). Генератор с открытым циклом отправляет
+--rate запросов/с смеси bench.load независимо от ответов, как настоящий
+всплеск, по 256 соединениям с 64 адресов 127.0.1.x (разные клиенты для
+лимита на клиента). Параллельно каждые 0,5 с идёт проба /health с таймаутом 1 с, как у
+livenessProbe по умолчанию.
+
+Для каждого режима выводятся: принятые запросы/с и их p50/p99, число отказов
+429/503, запросы без ответа за --timeout секунд и проваленные пробы /health.
+
+Запуск: python -m bench.admission [--cpu 0.2] [--rate 600] [--duration 20]
+        python -m bench.admission --limits ADMISSION_RATE=150,ADMISSION_BURST=50
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from bench import load
+
+PORT = 8768
+BASE_URL = f"http://127.0.0.1:{PORT}"
+PERIOD = 0.1
+PROBE_INTERVAL = 0.5
+PROBE_TIMEOUT = 1.0
+CLIENTS = 64
+
+# Values from k8s/deployment.yaml
+DEFAULT_LIMITS = ("ADMISSION_MAX_LAG=0.25,ADMISSION_RATE=100,ADMISSION_BURST=20,ADMISSION_CLIENT_RATE=50,"
+                  "ADMISSION_MAX_INFLIGHT=64,ADMISSION_EXPENSIVE_CONCURRENCY=2,ADMISSION_EXPENSIVE_QUEUE=8,"
+                  "ADMISSION_QUEUE_TIMEOUT=0.25")
+MIX = ("get_student=30,get_school=10,school_students=10,students_page=5,schools_page=3,search_students=5,"
+       "search_schools=2,school_stats=3,stats=2,create_student=10,update_student=10,update_school=2,"
+       "bulk_create_students=1")
+
+
+def parse_limits(text: str) -> dict:
+    return dict(item.split("=", 1) for item in text.split(",") if item)
+
+
+def throttle(pid: int, share: float, stop: threading.Event) -> None:
+    """CFS-style quota: run for share * PERIOD, stay stopped for the rest of each period"""
+    while not stop.is_set():
+        time.sleep(share * PERIOD)
+        os.kill(pid, signal.SIGSTOP)
+        time.sleep((1 - share) * PERIOD)
+        os.kill(pid, signal.SIGCONT)
+    os.kill(pid, signal.SIGCONT)
+
+
+async def wait_until_ready(client) -> None:
+    for _ in range(300):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def encode_request(method: str, path: str, body) -> bytes:
+    content = json.dumps(body).encode() if body is not None else b""
+    # Search terms are Cyrillic: a raw request line would be refused with 400 and the connection closed
+    path = urllib.parse.quote(path, safe="/?=&,")
+    head = (f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n")
+    return head.encode() + content
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split()[1])
+    length = next((int(line.split(b":", 1)[1]) for line in lines if line.lower().startswith(b"content-length:")), 0)
+    await reader.readexactly(length)
+    return status
+
+
+async def spike(dataset: load.Dataset, rate: float, duration: float, timeout: float, connections: int) -> dict:
+    # A bare keep-alive HTTP/1.1 client: httpx spends more CPU per request than the throttled server,
+    # and could not offer a spike to it from the same machine
+    next_request = load.generated(dataset, load.parse_mix(MIX))
+    accepted, rejected, failed = [], 0, 0
+    pending: asyncio.Queue = asyncio.Queue()
+    total = int(rate * duration)
+
+    async def connection(client: str):
+        nonlocal rejected, failed
+        reader = writer = None
+        while True:
+            scheduled, request = await pending.get()
+            if request is None:
+                break
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", PORT, local_addr=(client, 0))
+                writer.write(request)
+                status = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                failed += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                continue
+            if status in (429, 503):
+                rejected += 1
+            elif status >= 500:
+                failed += 1
+            else:
+                # From the scheduled send time: waiting for a free connection is part of the latency
+                accepted.append(time.perf_counter() - scheduled)
+        if writer is not None:
+            writer.close()
+
+    # Every connection comes from one of CLIENTS loopback addresses, so the per-client limit sees many clients
+    workers = [asyncio.create_task(connection(f"127.0.1.{i % CLIENTS + 1}")) for i in range(connections)]
+    started = time.perf_counter()
+    for i in range(total):
+        # Open loop: send on schedule whatever the server has answered so far
+        scheduled = started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _, method, path, body = next_request()
+        pending.put_nowait((scheduled, encode_request(method, dataset.fill(path), dataset.fill_body(body))))
+    for _ in workers:
+        pending.put_nowait((0, None))
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - started
+    accepted.sort()
+    return {
+        "accepted_rps": len(accepted) / elapsed,
+        "p50_ms": load.percentile(accepted, 0.5) * 1000,
+        "p99_ms": load.percentile(accepted, 0.99) * 1000,
+        "rejected": rejected,
+        "failed": failed,
+    }
+
+
+def spike_process(arguments) -> dict:
+    # Runs below the server's priority, so the generator does not eat into the server's CPU share
+    os.nice(10)
+    school_ids, student_ids, seed, *rest = arguments
+    dataset = load.Dataset(random.Random(seed))
+    dataset.school_ids, dataset.student_ids = school_ids, student_ids
+    return asyncio.run(spike(dataset, *rest))
+
+
+async def probe(client, done: asyncio.Event) -> dict:
+    """livenessProbe: GET /health every PROBE_INTERVAL with a PROBE_TIMEOUT timeout"""
+    import httpx
+
+    latencies, failures = [], 0
+    while not done.is_set():
+        started = time.perf_counter()
+        try:
+            response = await client.get("/health", timeout=PROBE_TIMEOUT)
+            failures += response.status_code != 200
+        except httpx.HTTPError:
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(PROBE_INTERVAL)
+    latencies.sort()
+    return {"probe_p99_ms": load.percentile(latencies, 0.99) * 1000, "probe_failures": failures,
+            "probes": len(latencies)}
+
+
+async def run(args, limits: dict) -> dict:
+    import httpx
+
+    env = dict(os.environ, STORAGE_BACKEND="memory", LOG_LEVEL="WARNING", **limits)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning",
+         "--loop", "uvloop", "--http", "httptools"],
+        env=env, stdout=subprocess.DEVNULL)
+    stop = threading.Event()
+    throttler = threading.Thread(target=throttle, args=(server.pid, args.cpu, stop), daemon=True)
+    try:
+        async with httpx.AsyncClient(base_url=BASE_URL, timeout=60) as client:
+            await wait_until_ready(client)
+            dataset = load.Dataset(random.Random(args.seed))
+            await load.load_dataset(client, dataset, args.schools, args.students)
+            throttler.start()
+            done = asyncio.Event()
+            probes = asyncio.create_task(probe(client, done))
+            # The generator gets a process of its own, so the probe is never stuck behind it
+            with multiprocessing.Pool(1) as pool:
+                report = await asyncio.get_running_loop().run_in_executor(None, pool.apply, spike_process, ((
+                    dataset.school_ids, dataset.student_ids, args.seed, args.rate, args.duration, args.timeout,
+                    args.connections),))
+            done.set()
+            return dict(report, **await probes)
+    finally:
+        stop.set()
+        if throttler.is_alive():
+            throttler.join()
+        server.kill()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cpu", type=float, default=0.2, help="доля CPU сервера (200m = 0.2)")
+    parser.add_argument("--rate", type=float, default=600, help="запросов/с во время всплеска")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность всплеска, с")
+    parser.add_argument("--timeout", type=float, default=10.0, help="таймаут запроса клиента, с")
+    parser.add_argument("--connections", type=int, default=256, help="соединений у генератора")
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=50_000)
+    parser.add_argument("--limits", default=DEFAULT_LIMITS, help="переменные ADMISSION_* режима с контролем")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"🚦 Всплеск {args.rate:.0f} зап/с на {args.duration:.0f} с, сервер с {args.cpu * 1000:.0f}m CPU")
+    print("=" * 40)
+    print(f"{'Режим':16}{'принято/с':>10}{'p50 мс':>9}{'p99 мс':>9}{'отказов':>9}{'без ответа':>11}"
+          f"{'/health p99':>12}{'проб упало':>11}")
+    for title, limits in (("без контроля", {}), ("с контролем", parse_limits(args.limits))):
+        report = asyncio.run(run(args, limits))
+        print(f"{title:16}{report['accepted_rps']:10.0f}{report['p50_ms']:9.0f}{report['p99_ms']:9.0f}"
+              f"{report['rejected']:9}{report['failed']:11}{report['probe_p99_ms']:12.0f}"
+              f"{report['probe_failures']:6}/{report['probes']}")
+
+
+if __name__ == "__main__":
+    main()
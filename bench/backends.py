@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Сравнение задержек бэкендов хранения (memory / sqlite) под конкурентной нагрузкой.
+
+Каждый бэкенд запускается в отдельном процессе (бэкенд выбирается через
+STORAGE_BACKEND при импорте приложения); запросы идут в ASGI-приложение
+напрямую через httpx, без сети.
+
+Запуск: python -m bench.backends [--students 20000] [--concurrency 64] [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_worker(args) -> dict:
+    import httpx
+    from app.main import app
+    from bench import fixtures
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/schools/bulk", json={"items": [
+            fixtures.school_item(i) for i in range(args.schools)
+        ]})
+        school_ids = [result["id"] for result in response.json()["results"]]
+        student_ids = []
+        for start in range(0, args.students, 5000):
+            response = await client.post("/students/bulk", json={"items": [
+                fixtures.student_item(i, school_ids) for i in range(start, min(start + 5000, args.students))
+            ]})
+            student_ids.extend(result["id"] for result in response.json()["results"])
+
+        latencies = []
+        per_task = args.requests // args.concurrency
+
+        async def one_request():
+            roll = random.random()
+            if roll < 0.6:
+                return await client.get(f"/students/{random.choice(student_ids)}")
+            if roll < 0.8:
+                return await client.get(f"/schools/{random.choice(school_ids)}/students")
+            if roll < 0.9:
+                return await client.post("/students", json={
+                    "first_name": "Мария", "last_name": "Петрова", "age": 15,
+                    "school_id": random.choice(school_ids), "grade": "9А"})
+            return await client.put(f"/students/{random.choice(student_ids)}", json={"age": random.randint(5, 25)})
+
+        async def task():
+            for _ in range(per_task):
+                started = time.perf_counter()
+                await one_request()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(task() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--schools", type=int, default=200)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(asyncio.run(run_worker(args))))
+        return
+
+    print(f"🗄️  Бэкенды: {args.students} студентов, {args.concurrency} параллельных клиентов, "
+          f"{args.requests} запросов")
+    print("=" * 40)
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in ("memory", "sqlite"):
+            env = dict(os.environ, STORAGE_BACKEND=backend, SQLITE_PATH=os.path.join(directory, "bench.db"))
+            result = subprocess.run(
+                [sys.executable, "-m", "bench.backends", "--backend", backend] + sys.argv[1:],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{backend:7} {stats['rps']:8.0f} зап/с  p50 {stats['p50_ms']:6.2f} мс  "
+                  f"p99 {stats['p99_ms']:6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
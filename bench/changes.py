@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Поток изменений GET /changes: 1000 одновременных подписчиков SSE на одном
+воркере uvicorn. Проверяется, что каждый подписчик получил каждое событие
+по порядку (иначе код выхода 1), и замеряется задержка доставки (от ответа на
+запись до получения).
+
+Запуск: python -m bench.changes [--subscribers 1000] [--writes 500]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def wait_until_up(client) -> None:
+    for _ in range(100):
+        try:
+            await client.get("/health")
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn did not start")
+
+
+async def run(args) -> bool:
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60, limits=limits) as client:
+        await wait_until_up(client)
+        school_id = (await client.post("/schools", json={
+            "name": "Школа №1", "address": "ул. Ленина, 1", "phone": "+7-495-123-4567"})).json()["id"]
+
+        connected = 0
+        all_connected = asyncio.Event()
+        received = [[] for _ in range(args.subscribers)]
+
+        async def subscriber(index: int) -> None:
+            nonlocal connected
+            async with client.stream("GET", "/changes") as response:
+                connected += 1
+                if connected == args.subscribers:
+                    all_connected.set()
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        received[index].append((time.perf_counter(), line))
+                        if len(received[index]) == args.writes:
+                            return
+
+        tasks = [asyncio.create_task(subscriber(i)) for i in range(args.subscribers)]
+        await asyncio.wait_for(all_connected.wait(), 60)
+        # Let every stream reach its first wait before writing
+        await asyncio.sleep(1)
+
+        written = []
+        for i in range(args.writes):
+            await client.put(f"/schools/{school_id}", json={"phone": f"+7-495-000-{i:04d}"})
+            written.append(time.perf_counter())
+            await asyncio.sleep(args.interval)
+        await asyncio.wait_for(asyncio.gather(*tasks), 120)
+
+    complete = all(
+        [line for _, line in events] == [line for _, line in received[0]] and len(events) == args.writes
+        for events in received
+    )
+    ordered = all(f"+7-495-000-{i:04d}" in line for i, (_, line) in enumerate(received[0]))
+    latencies = [max(0.0, at - written[i]) * 1000 for events in received for i, (at, _) in enumerate(events)]
+    mark = "✅" if complete and ordered else "❌"
+    print(f"{mark} Все {args.subscribers} подписчиков получили все {args.writes} событий по порядку")
+    print(f"Задержка доставки: p50 {percentile(latencies, 0.5):.1f} мс, p99 {percentile(latencies, 0.99):.1f} мс")
+    return complete and ordered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.01, help="пауза между записями, с")
+    args = parser.parse_args()
+
+    print(f"📡 Поток изменений: {args.subscribers} подписчиков, {args.writes} записей, 1 воркер uvicorn")
+    print("=" * 40)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        env=dict(os.environ, STORAGE_BACKEND="memory"),
+    )
+    try:
+        delivered = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+    sys.exit(0 if delivered else 1)
+
+
+if __name__ == "__main__":
+    main()
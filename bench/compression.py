@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Сжатие ответов: байты в сети против CPU на GET /students со 100k студентов.
+
+- каждый кодек и уровень на теле полной коллекции: размер, доля от исходного,
+  время сжатия и распаковки;
+- GET /students через приложение целиком (с CompressionMiddleware) для каждого
+  Accept-Encoding: первый запрос после изменения коллекции сжимает тело, повтор
+  с тем же ETag отдаёт сжатые байты из кэша;
+- задержка цикла событий, пока сжимается тело коллекции: в потоке и в самом цикле.
+
+Запуск: python -m bench.compression [--students 100000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import time
+import zlib
+
+from app import compression
+from app.main import app, list_response
+from app.models import StudentRepository
+from bench import fixtures
+
+LEVELS = (
+    ("gzip", (1, 6, 9)),
+    ("br", (1, 4, 5, 9)),
+    ("zstd", (1, 3, 9)),
+)
+
+
+def codec(name: str, level: int):
+    return {"gzip": compression.GzipCodec, "br": compression.BrotliCodec, "zstd": compression.ZstdCodec}[name](level)
+
+
+def decompressor(name: str):
+    if name == "gzip":
+        return lambda data: zlib.decompress(data, 31)
+    if name == "br":
+        return compression.brotli.decompress
+    return compression.zstandard.ZstdDecompressor().decompress
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def codecs_table(body: bytes, repeat: int) -> None:
+    print(f"Тело GET /students: {len(body) / 1e6:.1f} МБ")
+    print(f"{'Кодек':10}{'размер, КБ':>12}{'доля':>8}{'сжатие, мс':>12}{'МБ/с':>8}{'распаковка, мс':>16}")
+    for name, levels in LEVELS:
+        if (name == "br" and compression.brotli is None) or (name == "zstd" and compression.zstandard is None):
+            print(f"{name:10}не установлен")
+            continue
+        for level in levels:
+            compressed = codec(name, level).compress(body)
+            seconds = best_of(repeat, lambda: codec(name, level).compress(body))
+            unpack = decompressor(name)
+            assert unpack(compressed) == body
+            unpacked = best_of(repeat, lambda: unpack(compressed))
+            print(f"{name + '-' + str(level):10}{len(compressed) / 1024:12.0f}{len(compressed) / len(body):8.1%}"
+                  f"{seconds * 1000:12.1f}{len(body) / seconds / 1e6:8.0f}{unpacked * 1000:16.1f}")
+
+
+async def end_to_end(repeat: int) -> None:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        print(f"{'Accept-Encoding':26}{'в сети, КБ':>12}{'первый, мс':>12}{'из кэша, мс':>13}")
+        for accept in ("identity", "gzip", "br", "zstd", "gzip, deflate, br, zstd"):
+            first, cached = [], []
+            for _ in range(repeat):
+                # A change bumps the collection ETag: the next response has to be compressed anew
+                student = StudentRepository.get_all_students()[0]
+                StudentRepository.update_student(student.id, age=student.age % 20 + 5)
+                for timings in (first, cached):
+                    started = time.perf_counter()
+                    response = await client.get("/students", headers={"Accept-Encoding": accept})
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - started)
+            wire = response.num_bytes_downloaded
+            print(f"{accept:26}{wire / 1024:12.0f}{min(first) * 1000:12.0f}{min(cached) * 1000:13.0f}")
+    print(f"Попаданий в кэш сжатых тел: {compression.stats['cache_hits']}")
+
+
+async def loop_latency(body: bytes, in_thread: bool) -> float:
+    """Worst delay of a 1 ms ticker on the event loop while the body is compressed ten times"""
+    gzip = compression.GzipCodec(6)
+    delays = []
+    done = False
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done:
+            started = loop.time()
+            await asyncio.sleep(0.001)
+            delays.append(loop.time() - started - 0.001)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    for _ in range(10):
+        if in_thread:
+            await asyncio.get_running_loop().run_in_executor(None, gzip.compress, body)
+        else:
+            gzip.compress(body)
+            await asyncio.sleep(0)
+    done = True
+    await task
+    return max(delays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"🗜️  Сжатие ответов: {args.students:,} студентов")
+    print("=" * 40)
+    fixtures.populate(100, args.students)
+    body = list_response([student.to_json() for student in StudentRepository.get_all_students()]).body
+    codecs_table(body, args.repeat)
+    print()
+    asyncio.run(end_to_end(args.repeat))
+    print()
+    for title, in_thread in (("в цикле событий", False), ("в потоке", True)):
+        lag = asyncio.run(loop_latency(body, in_thread))
+        print(f"Сжатие gzip-6 {title}: цикл событий стоял до {lag * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
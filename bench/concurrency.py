@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Репозитории memory из нескольких потоков.
+
+Стресс-тест: --threads потоков одновременно создают, обновляют, переводят между
+школами и удаляют студентов, обновляют школы и читают (целиком, постранично, по
+школе, по ID). Каждое обновление записывает в имя, фамилию и класс одну и ту же
+метку, так что читатель, увидевший полуобновлённую запись, её заметит. В конце
+сверяются отсортированные списки ID, индекс по школам и счётчики /stats.
+
+Пропускная способность: смесь чтений и обновлений из 1..--threads потоков;
+блокировка записи с чтением без блокировок против одной глобальной блокировки
+на каждый вызов.
+
+Запуск: python -m bench.concurrency [--threads 8] [--seconds 5] [--students 100000]
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from app import models, stats
+from app.models import SchoolRepository, StudentRepository
+from bench import fixtures
+
+SCHOOLS = 1000
+
+
+def student(i: int, school_ids: list) -> dict:
+    # Every field carries the same suffix, so a torn read shows up as a mismatch
+    return {"first_name": "F0", "last_name": "L0", "age": 10,
+            "school_id": school_ids[i % len(school_ids)], "grade": "G0"}
+
+
+def torn(student) -> bool:
+    return not (student.first_name[1:] == student.last_name[1:] == student.grade[1:])
+
+
+class Stress:
+    def __init__(self, school_ids: list, seconds: float):
+        self.school_ids = school_ids
+        self.deadline = time.perf_counter() + seconds
+        self.errors = []
+        self.operations = 0
+
+    def fail(self, message: str) -> None:
+        if len(self.errors) < 10:
+            self.errors.append(message)
+
+    def writer(self, seed: int) -> None:
+        rng = random.Random(seed)
+        while time.perf_counter() < self.deadline:
+            try:
+                student_ids = models.student_keys[:200]
+                choice = rng.random()
+                if choice < 0.6 and student_ids:
+                    marker = rng.randrange(1_000_000)
+                    StudentRepository.update_student(
+                        rng.choice(student_ids), first_name=f"F{marker}", last_name=f"L{marker}",
+                        grade=f"G{marker}", school_id=rng.choice(self.school_ids))
+                elif choice < 0.75:
+                    marker = rng.randrange(1_000_000)
+                    StudentRepository.create_students([
+                        {"first_name": f"F{marker}", "last_name": f"L{marker}", "age": 10,
+                         "school_id": rng.choice(self.school_ids), "grade": f"G{marker}"} for _ in range(50)])
+                elif choice < 0.9 and student_ids:
+                    StudentRepository.delete_students(rng.sample(student_ids, min(20, len(student_ids))))
+                else:
+                    SchoolRepository.update_school(rng.choice(self.school_ids), phone=f"+7-{rng.randrange(10**7)}")
+            except Exception as e:
+                self.fail(f"writer: {e!r}")
+            self.operations += 1
+
+    def reader(self, seed: int) -> None:
+        rng = random.Random(seed)
+        while time.perf_counter() < self.deadline:
+            try:
+                choice = rng.random()
+                if choice < 0.1:
+                    students = StudentRepository.get_all_students()
+                elif choice < 0.4:
+                    keys = models.student_keys
+                    after = keys[rng.randrange(len(keys))] if keys else None
+                    students = StudentRepository.get_students_page(after=after, limit=500)
+                    if [student.id for student in students] != sorted(student.id for student in students):
+                        self.fail("page out of order")
+                elif choice < 0.7:
+                    school_id = rng.choice(self.school_ids)
+                    students = StudentRepository.get_students_by_school(school_id)
+                    if any(student.school_id != school_id for student in students):
+                        self.fail("student listed under another school")
+                else:
+                    students = StudentRepository.get_students_by_ids(models.student_keys[:200])
+                for student in students:
+                    if torn(student):
+                        self.fail(f"half-updated student {student.to_dict()}")
+                        break
+            except Exception as e:
+                self.fail(f"reader: {e!r}")
+            self.operations += 1
+
+
+def check_invariants() -> list:
+    problems = []
+    if models.student_keys != sorted(models.students_db):
+        problems.append("student_keys differ from the stored ids")
+    if models.school_keys != sorted(models.schools_db):
+        problems.append("school_keys differ from the stored ids")
+    index = {}
+    for student in models.students_db.values():
+        index.setdefault(student.school_id, set()).add(student.id)
+    if index != {school_id: set(bucket) for school_id, bucket in models.students_by_school.items()}:
+        problems.append("students_by_school differs from a rebuild")
+    problems.extend(stats.verify(models.schools_db.values(), models.students_db.values()))
+    return problems
+
+
+def stress(threads: int, seconds: float, school_ids: list) -> bool:
+    run = Stress(school_ids, seconds)
+    workers = [threading.Thread(target=run.writer if i % 2 else run.reader, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    problems = run.errors + check_invariants()
+    print(f"Стресс-тест: {threads} потоков, {run.operations:,} операций за {seconds:.0f} с, "
+          f"{len(models.students_db):,} студентов в конце")
+    for problem in problems[:10]:
+        print(f"  ❌ {problem}")
+    if len(problems) > 10:
+        print(f"  ... и ещё {len(problems) - 10}")
+    if not problems:
+        print("  ✅ ни одной ошибки или полуобновлённой записи; списки ID, индекс и /stats сходятся")
+    return not problems
+
+
+class GlobalLock:
+    """Тот же репозиторий, но каждый вызов, включая чтения, под одной общей блокировкой"""
+
+    def __init__(self, repository, lock: threading.Lock):
+        self.repository = repository
+        self.lock = lock
+
+    def __getattr__(self, name: str):
+        method = getattr(self.repository, name)
+        lock = self.lock
+
+        def call(*args, **kwargs):
+            with lock:
+                return method(*args, **kwargs)
+
+        setattr(self, name, call)
+        return call
+
+
+def throughput(students_repo, threads: int, seconds: float, student_ids: list, school_ids: list) -> float:
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def worker(index: int) -> None:
+        rng = random.Random(index)
+        operations = 0
+        while time.perf_counter() < deadline:
+            choice = rng.random()
+            if choice < 0.6:
+                students_repo.get_student(rng.choice(student_ids))
+            elif choice < 0.8:
+                students_repo.get_students_page(after=rng.choice(student_ids), limit=100)
+            elif choice < 0.9:
+                students_repo.get_students_by_school(rng.choice(school_ids))
+            else:
+                marker = rng.randrange(1_000_000)
+                students_repo.update_student(rng.choice(student_ids), first_name=f"F{marker}",
+                                             last_name=f"L{marker}", grade=f"G{marker}")
+            operations += 1
+        counts[index] = operations
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0, help="длительность каждого замера, с")
+    parser.add_argument("--students", type=int, default=100_000)
+    args = parser.parse_args()
+
+    gil = "с GIL" if getattr(sys, "_is_gil_enabled", lambda: True)() else "без GIL"
+    print(f"🧵 Репозитории memory из потоков: Python {sys.version.split()[0]} {gil}")
+    print("=" * 40)
+    school_ids = fixtures.populate(SCHOOLS, args.students, student)
+    ok = stress(args.threads, args.seconds, school_ids)
+
+    student_ids = list(models.students_db)
+    baseline_repo = GlobalLock(StudentRepository, threading.Lock())
+    print()
+    print("Смесь 60% get_student, 20% страниц, 10% по школе, 10% обновлений (операций/с):")
+    print(f"{'Потоков':10}{'чтение без блокировок':>24}{'глобальная блокировка':>24}")
+    threads = 1
+    while threads <= args.threads:
+        lock_free = throughput(StudentRepository, threads, args.seconds, student_ids, school_ids)
+        global_lock = throughput(baseline_repo, threads, args.seconds, student_ids, school_ids)
+        print(f"{threads:<10}{lock_free:24,.0f}{global_lock:24,.0f}")
+        threads *= 2
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Страница студентов с названиями школ: N+1 запросов (GET /students, затем
+GET /schools/{id} на каждого студента) против GET /schools?ids= одним запросом
+и против GET /students?expand=school.
+
+Приложение вызывается в процессе через ASGI, поэтому сетевая задержка в замер
+не входит: в реальной сети разница растёт на число сэкономленных RTT.
+
+Запуск: python -m bench.expand [--schools 1000] [--students 100000] [--page 100] [--pages 50]
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.main import app
+from app.models import StudentRepository
+from bench import fixtures
+
+
+def student(i: int, school_ids: list) -> dict:
+    # Schools scattered across a page, so the N+1 variant does not hit the same few
+    return dict(fixtures.student_item(i, school_ids), school_id=school_ids[i * 7919 % len(school_ids)], grade="5Б")
+
+
+async def n_plus_one(client, params) -> int:
+    students = (await client.get("/students", params=params)).json()
+    for student in students:
+        (await client.get(f"/schools/{student['school_id']}")).json()
+    return 1 + len(students)
+
+
+async def batch_ids(client, params) -> int:
+    students = (await client.get("/students", params=params)).json()
+    ids = ",".join({student["school_id"] for student in students})
+    (await client.get("/schools", params={"ids": ids})).json()
+    return 2
+
+
+async def expanded(client, params) -> int:
+    (await client.get("/students", params=dict(params, expand="school"))).json()
+    return 1
+
+
+async def measure(client, fetch, page: int, pages: int, cursors) -> tuple:
+    requests = 0
+    started = time.perf_counter()
+    for after in cursors[:pages]:
+        requests += await fetch(client, {"limit": page, "after": after})
+    return (time.perf_counter() - started) / pages, requests / pages
+
+
+async def run(args) -> None:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ids = sorted(student.id for student in StudentRepository.get_all_students())
+        cursors = [ids[i - 1] for i in range(args.page, len(ids), args.page)]
+        for title, fetch in (("N+1 запросов", n_plus_one), ("?ids=", batch_ids), ("?expand=school", expanded)):
+            seconds, requests = await measure(client, fetch, args.page, args.pages, cursors)
+            print(f"{title + ':':18}{seconds * 1000:8.2f} мс на страницу, {requests:.0f} запросов")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=100, help="студентов на странице")
+    parser.add_argument("--pages", type=int, default=50, help="страниц в замере")
+    args = parser.parse_args()
+
+    fixtures.populate(args.schools, args.students, student)
+    print(f"🔗 Студенты со школами: страница {args.page} из {args.students} студентов, {args.schools} школ")
+    print("=" * 40)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
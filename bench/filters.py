@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Фильтры ?school_id=&grade=&age_min=&age_max=: индексы по классу, возрасту и
+школе с планировщиком против линейного прохода по всем студентам на 1M записей.
+
+- построение индексов первым запросом с фильтром;
+- запросы разной избирательности: индекс против прохода, результаты сверяются;
+- ?sort= поверх выборки;
+- цена поддержки индексов при изменениях: update_student без индексов и с ними.
+
+Запуск: python -m bench.filters [--students 1000000] [--repeat 5]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from app import models
+from app.main import STUDENT_SORT_KEYS
+from app.models import StudentRepository
+from bench import fixtures
+
+GRADES = [f"{number}{letter}" for number in range(1, 12) for letter in "АБВ"]
+UPDATES = 20000
+
+
+def populate(students: int) -> list:
+    rnd = random.Random(42)
+
+    def student(i: int, school_ids: list) -> dict:
+        return dict(fixtures.student_item(i, school_ids), age=rnd.randint(6, 18), school_id=rnd.choice(school_ids),
+                    grade=rnd.choice(GRADES))
+
+    return fixtures.populate(1000, students, student)
+
+
+def scan(filters: dict):
+    # What a client does today: every student, every filter checked on each
+    return sorted(student.id for student in models.students_db.values()
+                  if models._matches(student, filters.get("school_id"), filters.get("grade"),
+                                     filters.get("age_min"), filters.get("age_max")))
+
+
+def median_ms(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def updates_per_sec(student_ids: list) -> float:
+    started = time.perf_counter()
+    for i, student_id in enumerate(student_ids):
+        StudentRepository.update_student(student_id, age=6 + i % 13, grade=GRADES[i % len(GRADES)])
+    return len(student_ids) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"🎯 Фильтры: {args.students:,} студентов (медиана из {args.repeat}, проход — из 1)")
+    print("=" * 40)
+    school_ids = populate(args.students)
+    sample = random.Random(7).sample(list(models.students_db), min(UPDATES, args.students))
+    without_indexes = updates_per_sec(sample)
+
+    started = time.perf_counter()
+    StudentRepository.get_student_ids_filtered(grade="9А")
+    print(f"Построение индексов первым запросом: {time.perf_counter() - started:.2f} с")
+    with_indexes = updates_per_sec(sample)
+    print(f"update_student: без индексов {without_indexes:,.0f}/с, с индексами {with_indexes:,.0f}/с")
+    print()
+
+    school = school_ids[0]
+    queries = [
+        ("9А, 14–15 лет, школа", {"school_id": school, "grade": "9А", "age_min": 14, "age_max": 15}),
+        ("школа", {"school_id": school}),
+        ("9А, 14–15 лет", {"grade": "9А", "age_min": 14, "age_max": 15}),
+        ("класс 9А", {"grade": "9А"}),
+        ("14–15 лет", {"age_min": 14, "age_max": 15}),
+        ("от 7 лет", {"age_min": 7}),
+    ]
+    print(f"{'Запрос':24}{'найдено':>9}{'индекс, мс':>12}{'проход, мс':>12}{'ускорение':>11}")
+    for title, filters in queries:
+        found = StudentRepository.get_student_ids_filtered(**filters)
+        started = time.perf_counter()
+        assert scan(filters) == found
+        linear = (time.perf_counter() - started) * 1000
+        indexed = median_ms(args.repeat, lambda: StudentRepository.get_student_ids_filtered(**filters))
+        print(f"{title:24}{len(found):9,}{indexed:12.2f}{linear:12.0f}{linear / indexed:10.0f}x")
+    print()
+
+    for title, filters, sort in (("школа, ?sort=-age", {"school_id": school}, "-age"),
+                                 ("9А, ?sort=last_name", {"grade": "9А"}, "last_name")):
+        key = STUDENT_SORT_KEYS[sort.lstrip("-")]
+
+        def ordered():
+            students = StudentRepository.get_students_by_ids(StudentRepository.get_student_ids_filtered(**filters))
+            students.sort(key=key, reverse=sort.startswith("-"))
+            return students
+        print(f"{title:24}{len(ordered()):9,}{median_ms(args.repeat, ordered):12.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
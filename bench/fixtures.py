@@ -0,0 +1,52 @@
+"""
+Общий набор данных бенчмарков: школы и студенты, созданные пакетами прямо через
+репозитории, без HTTP (через API данные создаёт bench.load).
+
+Школа i — «Школа №i» на ул. Ленина. Студент i — «Иван Иванов{i}» 5 + i % 20 лет,
+школа и класс по кругу; бенчмарк, которому нужны другие студенты, передаёт свою
+функцию student(i, school_ids).
+"""
+
+from typing import Callable, Dict, List
+
+from app.models import SchoolRepository, StudentRepository
+
+GRADES = ["1А", "2Б", "3В", "4А", "5Б", "6В", "7А", "8Б", "9В", "10А", "11Б"]
+BATCH = 10000
+
+StudentItem = Callable[[int, List[str]], Dict]
+
+
+def school_item(i: int) -> Dict:
+    return {"name": f"Школа №{i}", "address": f"ул. Ленина, {i}", "phone": "+7-495-123-4567"}
+
+
+def student_item(i: int, school_ids: List[str]) -> Dict:
+    return {"first_name": "Иван", "last_name": f"Иванов{i}", "age": 5 + i % 20,
+            "school_id": school_ids[i % len(school_ids)], "grade": GRADES[i % len(GRADES)]}
+
+
+def create_schools(count: int) -> List[str]:
+    return [school.id for school in SchoolRepository.create_schools([school_item(i) for i in range(count)])]
+
+
+def create_students(school_ids: List[str], start: int, stop: int, student: StudentItem = student_item) -> None:
+    """Студенты start..stop-1, пакетами по BATCH"""
+    for first in range(start, stop, BATCH):
+        StudentRepository.create_students([student(i, school_ids) for i in range(first, min(first + BATCH, stop))])
+
+
+def populate(schools: int, students: int, student: StudentItem = student_item) -> List[str]:
+    school_ids = create_schools(schools)
+    create_students(school_ids, 0, students, student)
+    return school_ids
+
+
+async def populate_repositories(schools_repo, students_repo, schools: int, students: int,
+                                student: StudentItem = student_item) -> List[str]:
+    """То же через репозитории app.repository (любой бэкенд)"""
+    school_ids = [school.id for school in await schools_repo.create_schools([school_item(i) for i in range(schools)])]
+    for first in range(0, students, BATCH):
+        await students_repo.create_students([student(i, school_ids)
+                                             for i in range(first, min(first + BATCH, students))])
+    return school_ids
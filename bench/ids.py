@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Упорядоченные по времени ID против UUID4 и выборка по времени создания и
+изменения на 1M студентов.
+
+- генерация ID и вставка новых ID в отсортированный список ключей (на нём
+  держится постраничная выдача ?after=): UUID4 попадает в случайное место, новый
+  ID — в конец;
+- длина ID и размер JSON студента (id и school_id);
+- ?created_after= и ?updated_after= (последний 1% созданных, 1000 изменённых):
+  индекс по времени против прохода по всем студентам; построение индексов
+  первым запросом и цена их обновления в update_student.
+
+Запуск: python -m bench.ids [--students 1000000] [--repeat 5]
+"""
+
+import argparse
+import bisect
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from app import models
+from app.models import StudentRepository
+from bench import fixtures
+
+INSERTS = 10000
+UPDATES = 1000
+
+
+def populate(students: int) -> int:
+    """Создаёт студентов пакетами; возвращает момент перед последним 1%"""
+    school_ids = fixtures.create_schools(1000)
+    recent = students - students // 100
+    fixtures.create_students(school_ids, 0, recent)
+    time.sleep(0.002)
+    mark = models.now_us()
+    time.sleep(0.002)
+    fixtures.create_students(school_ids, recent, students)
+    return mark
+
+
+def median_ms(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def generation(count: int) -> None:
+    for title, make in (("UUID4", lambda: str(uuid.uuid4())), ("по времени", models.new_id)):
+        started = time.perf_counter()
+        for _ in range(count):
+            make()
+        per_id = (time.perf_counter() - started) / count * 1e6
+        sample = make()
+        print(f"{title:12}{per_id:6.2f} мкс на ID, {len(sample)} символов, {sys.getsizeof(sample)} Б в памяти")
+
+
+def insertion(keys_count: int) -> None:
+    for title, make in (("UUID4", lambda: str(uuid.uuid4())), ("по времени", models.new_id)):
+        keys = sorted(make() for _ in range(keys_count))
+        new_ids = [make() for _ in range(INSERTS)]
+        started = time.perf_counter()
+        for key in new_ids:
+            bisect.insort(keys, key)
+        per_insert = (time.perf_counter() - started) / INSERTS * 1e6
+        print(f"{title:12}{per_insert:6.2f} мкс на вставку в список из {keys_count:,} ключей")
+
+
+def payload() -> None:
+    student = next(iter(models.students_db.values()))
+    legacy = dict(student.to_dict(), id=str(uuid.uuid4()), school_id=str(uuid.uuid4()))
+    before, after = len(models.encode_json(legacy)), len(student.to_json())
+    print(f"JSON студента: {before} Б с UUID, {after} Б с новыми ID ({1 - after / before:.0%} меньше)")
+
+
+def range_queries(mark: int, repeat: int) -> None:
+    started = time.perf_counter()
+    StudentRepository.get_student_ids_in_range(created_after=mark)
+    print(f"Первый запрос строит индексы: {time.perf_counter() - started:.2f} с")
+    updated_mark = models.now_us()
+    time.sleep(0.002)
+    started = time.perf_counter()
+    for student_id in random.Random(1).sample(models.student_keys, UPDATES):
+        StudentRepository.update_student(student_id, age=10)
+    print(f"update_student с индексами: {(time.perf_counter() - started) / UPDATES * 1e6:.0f} мкс")
+
+    def scan(attribute: str, after: int):
+        return sorted(student.id for student in models.students_db.values() if getattr(student, attribute) > after)
+
+    print(f"{'Запрос':28}{'индекс, мс':>12}{'проход, мс':>12}{'найдено':>10}")
+    for title, bounds, attribute, after in (
+        ("?created_after= (1%)", {"created_after": mark}, "_created_us", mark),
+        (f"?updated_after= ({UPDATES})", {"updated_after": updated_mark}, "_updated_us", updated_mark),
+    ):
+        found = StudentRepository.get_student_ids_in_range(**bounds)
+        assert found == scan(attribute, after)
+        indexed = median_ms(repeat, lambda: StudentRepository.get_student_ids_in_range(**bounds))
+        scanned = median_ms(repeat, lambda: scan(attribute, after))
+        print(f"{title:28}{indexed:12.2f}{scanned:12.1f}{len(found):10,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"🕒 ID по времени и выборка по времени: {args.students:,} студентов")
+    print("=" * 40)
+    generation(200_000)
+    insertion(args.students)
+    mark = populate(args.students)
+    payload()
+    print()
+    range_queries(mark, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
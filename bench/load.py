@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон API: реалистичный набор данных, параллельная смесь запросов
+по всем эндпоинтам, перцентили задержек и сравнение с базовой линией.
+
+Цель — приложение в процессе через ASGI (по умолчанию, без сети), локальный
+uvicorn, запускаемый прогоном (--uvicorn), или уже работающий сервис (--url).
+Набор данных создаётся через пакетные эндпоинты. Нагрузка — смесь операций с
+весами (--mix) или воспроизведение записанного трафика (--replay); её выполняют
+--concurrency корутин. Отчёт: пропускная способность и p50/p95/p99 по каждой
+операции и в целом. --save сохраняет отчёт как базовую линию (JSON),
+--baseline сравнивает с ней и завершается с кодом 1, если задержка или
+пропускная способность хуже базовой больше чем на --threshold.
+
+Трафик — JSONL, по запросу на строку (так же пишет --record):
+  {"op": "get_student", "method": "GET", "path": "/students/{student_id}", "body": null}
+Плейсхолдеры {school_id} и {student_id} в пути и теле заменяются случайными
+ID из набора данных, {deleted_student_id} — случайным студентом, который
+больше ни в один запрос не попадёт (для DELETE).
+
+Запуск: python -m bench.load [--schools 10000] [--students 1000000] [--concurrency 64] [--requests 50000]
+        python -m bench.load --uvicorn --mix get_student=80,update_student=20
+        python -m bench.load --replay traffic.jsonl --save baseline.json
+        python -m bench.load --baseline baseline.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+UVICORN_PORT = 8766
+BULK_SIZE = 10000
+
+FIRST_NAMES = ["Александр", "Мария", "Иван", "Анна", "Дмитрий", "Елена", "Сергей", "Ольга", "Пётр", "Наталья",
+               "Андрей", "Татьяна", "Алексей", "Ирина", "Михаил", "Светлана", "Николай", "Юлия", "Артём", "Дарья"]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов",
+              "Козлов", "Степанов"]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Нижний Новгород", "Самара"]
+STREETS = ["ул. Ленина", "пр. Мира", "ул. Пушкина", "ул. Гагарина", "ул. Советская", "ул. Школьная"]
+GRADES = [f"{year}{letter}" for year in range(1, 12) for letter in "АБВ"]
+
+Request = Tuple[str, str, str, Optional[dict]]  # (op, method, path, body)
+
+
+def school_item(rng: random.Random, i: int) -> dict:
+    kind = rng.choice(["Школа", "Гимназия", "Лицей"])
+    return {"name": f"{kind} №{i + 1}", "address": f"{rng.choice(STREETS)}, {rng.randint(1, 200)}, "
+            f"{rng.choice(CITIES)}", "phone": f"+7-{rng.randint(300, 999)}-{rng.randint(100, 999)}-"
+            f"{rng.randint(1000, 9999)}"}
+
+
+def student_item(rng: random.Random, school_id: str) -> dict:
+    grade = rng.choice(GRADES)
+    last_name = rng.choice(LAST_NAMES)
+    first_name = rng.choice(FIRST_NAMES)
+    if first_name in ("Мария", "Анна", "Елена", "Ольга", "Наталья", "Татьяна", "Ирина", "Светлана", "Юлия", "Дарья"):
+        last_name += "а"
+    return {"first_name": first_name, "last_name": last_name, "age": min(25, int(grade[:-1]) + 6),
+            "school_id": school_id, "grade": grade}
+
+
+class Dataset:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.school_ids: List[str] = []
+        self.student_ids: List[str] = []
+
+    def school(self) -> str:
+        return self.rng.choice(self.school_ids)
+
+    def student(self) -> str:
+        return self.rng.choice(self.student_ids)
+
+    def take_student(self) -> str:
+        # Swap-remove so concurrent deletes never pick the same student twice
+        ids = self.student_ids
+        index = self.rng.randrange(len(ids))
+        ids[index], ids[-1] = ids[-1], ids[index]
+        return ids.pop()
+
+    def fill(self, text: str) -> str:
+        for placeholder, pick in (("{school_id}", self.school), ("{student_id}", self.student),
+                                  ("{deleted_student_id}", self.take_student)):
+            while placeholder in text:
+                text = text.replace(placeholder, pick(), 1)
+        return text
+
+    def fill_body(self, body: Optional[dict]) -> Optional[dict]:
+        if body is None:
+            return None
+        text = json.dumps(body, ensure_ascii=False)
+        return json.loads(self.fill(text)) if "_id}" in text else body
+
+
+async def load_dataset(client, dataset: Dataset, schools: int, students: int) -> None:
+    rng = dataset.rng
+    for start in range(0, schools, BULK_SIZE):
+        items = [school_item(rng, i) for i in range(start, min(start + BULK_SIZE, schools))]
+        response = await client.post("/schools/bulk", json={"items": items})
+        response.raise_for_status()
+        dataset.school_ids.extend(result["id"] for result in response.json()["results"])
+    for start in range(0, students, BULK_SIZE):
+        items = [student_item(rng, dataset.school()) for _ in range(start, min(start + BULK_SIZE, students))]
+        response = await client.post("/students/bulk", json={"items": items})
+        response.raise_for_status()
+        dataset.student_ids.extend(result["id"] for result in response.json()["results"])
+
+
+# op -> (default weight, request template factory); together they cover every endpoint.
+# Templates keep their placeholders until sent, so --record writes traffic that replays on any dataset.
+OPERATIONS: Dict[str, Tuple[int, Callable[[random.Random], Tuple[str, str, Optional[dict]]]]] = {
+    "get_student": (30, lambda rng: ("GET", "/students/{student_id}", None)),
+    "get_school": (10, lambda rng: ("GET", "/schools/{school_id}", None)),
+    "school_students": (10, lambda rng: ("GET", "/schools/{school_id}/students", None)),
+    "students_page": (5, lambda rng: ("GET", "/students?limit=100&after={student_id}", None)),
+    "schools_page": (3, lambda rng: ("GET", "/schools?limit=100&after={school_id}", None)),
+    "search_students": (5, lambda rng: ("GET", f"/students?q={rng.choice(LAST_NAMES)[:5]}&limit=100", None)),
+    "search_schools": (2, lambda rng: ("GET", f"/schools?q={rng.choice(CITIES)}&limit=100", None)),
+    "school_stats": (3, lambda rng: ("GET", "/schools/{school_id}/stats", None)),
+    "stats": (2, lambda rng: ("GET", "/stats", None)),
+    "create_student": (10, lambda rng: ("POST", "/students", student_item(rng, "{school_id}"))),
+    "update_student": (10, lambda rng: ("PUT", "/students/{student_id}", {"age": rng.randint(5, 25)})),
+    "delete_student": (3, lambda rng: ("DELETE", "/students/{deleted_student_id}", None)),
+    "create_school": (1, lambda rng: ("POST", "/schools", school_item(rng, rng.randrange(100_000)))),
+    "update_school": (2, lambda rng: ("PUT", "/schools/{school_id}", {"phone": "+7-495-000-0000"})),
+    "bulk_create_students": (1, lambda rng: ("POST", "/students/bulk", {
+        "items": [student_item(rng, "{school_id}") for _ in range(100)]})),
+    "health": (1, lambda rng: ("GET", "/health", None)),
+}
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, int]:
+    if not text:
+        return {op: weight for op, (weight, _) in OPERATIONS.items()}
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {op!r}; known: {', '.join(OPERATIONS)}")
+        mix[op] = int(weight or 1)
+    return mix
+
+
+def generated(dataset: Dataset, mix: Dict[str, int]) -> Callable[[], Request]:
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+
+    def next_request() -> Request:
+        op = dataset.rng.choices(ops, weights)[0]
+        method, path, body = OPERATIONS[op][1](dataset.rng)
+        return op, method, path, body
+    return next_request
+
+
+def replayed(path: str) -> Callable[[], Request]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise SystemExit(f"No requests in {path}")
+    position = 0
+
+    def next_request() -> Request:
+        nonlocal position
+        record = records[position % len(records)]
+        position += 1
+        return (record.get("op") or f"{record['method']} replay", record["method"], record["path"],
+                record.get("body"))
+    return next_request
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+async def drive(client, dataset: Dataset, next_request: Callable[[], Request], total: int, concurrency: int,
+                record_file=None) -> dict:
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        while issued < total:
+            issued += 1
+            op, method, path, body = next_request()
+            if record_file:
+                record_file.write(json.dumps({"op": op, "method": method, "path": path, "body": body},
+                                             ensure_ascii=False) + "\n")
+            path, body = dataset.fill(path), dataset.fill_body(body)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies.setdefault(op, []).append(time.perf_counter() - started)
+            if failed:
+                errors[op] = errors.get(op, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    operations = {op: summarize(samples, errors.get(op, 0), elapsed) for op, samples in sorted(latencies.items())}
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {"elapsed_s": round(elapsed, 3), "total": summarize(everything, sum(errors.values()), elapsed),
+            "operations": operations}
+
+
+def print_report(report: dict) -> None:
+    print(f"{'Операция':22}{'запросов':>9}{'ошибок':>8}{'зап/с':>10}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}")
+    rows = list(report["operations"].items()) + [("ИТОГО", report["total"])]
+    for op, stats in rows:
+        print(f"{op:22}{stats['requests']:9}{stats['errors']:8}{stats['rps']:10.0f}"
+              f"{stats['p50_ms']:9.2f}{stats['p95_ms']:9.2f}{stats['p99_ms']:9.2f}")
+
+
+def regressions(report: dict, baseline: dict, threshold: float, min_samples: int = 100) -> List[str]:
+    found = []
+    pairs = [("ИТОГО", report["total"], baseline["total"])] + [
+        (op, stats, baseline["operations"][op]) for op, stats in report["operations"].items()
+        if op in baseline["operations"]
+    ]
+    for op, current, base in pairs:
+        if min(current["requests"], base["requests"]) < min_samples:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + threshold):
+                found.append(f"{op}: {key} {base[key]:.2f} -> {current[key]:.2f}")
+        if current["errors"] > base["errors"]:
+            found.append(f"{op}: errors {base['errors']} -> {current['errors']}")
+    if report["total"]["rps"] < baseline["total"]["rps"] * (1 - threshold):
+        found.append(f"ИТОГО: rps {baseline['total']['rps']:.0f} -> {report['total']['rps']:.0f}")
+    return found
+
+
+async def run(args, base_url: Optional[str]) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits)
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async with client:
+        if base_url:
+            for _ in range(100):
+                try:
+                    await client.get("/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        dataset = Dataset(random.Random(args.seed))
+        started = time.perf_counter()
+        await load_dataset(client, dataset, args.schools, args.students)
+        print(f"Набор данных: {args.schools} школ, {args.students} студентов за "
+              f"{time.perf_counter() - started:.1f} с")
+
+        if args.replay:
+            next_request = replayed(args.replay)
+        else:
+            next_request = generated(dataset, parse_mix(args.mix))
+        record_file = open(args.record, "w", encoding="utf-8") if args.record else None
+        try:
+            report = await drive(client, dataset, next_request, args.requests, args.concurrency, record_file)
+        finally:
+            if record_file:
+                record_file.close()
+
+    report["config"] = {key: getattr(args, key) for key in (
+        "schools", "students", "requests", "concurrency", "mix", "replay", "seed")}
+    report["config"]["target"] = base_url or "asgi"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schools", type=int, default=10_000)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mix", help="веса операций: get_student=30,update_student=10 (по умолчанию все)")
+    parser.add_argument("--replay", metavar="PATH", help="воспроизвести трафик из JSONL вместо смеси")
+    parser.add_argument("--record", metavar="PATH", help="записать выполненные запросы в JSONL")
+    parser.add_argument("--seed", type=int, default=1)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="адрес работающего сервиса")
+    target.add_argument("--uvicorn", action="store_true", help="запустить локальный uvicorn на время прогона")
+    parser.add_argument("--save", metavar="PATH", help="сохранить отчёт как базовую линию")
+    parser.add_argument("--baseline", metavar="PATH", help="сравнить с базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    target_name = args.url or ("uvicorn" if args.uvicorn else "ASGI в процессе")
+    print(f"🏋️  Нагрузочный прогон: {target_name}, {args.concurrency} параллельных клиентов, "
+          f"{args.requests} запросов")
+    print("=" * 40)
+
+    server = None
+    base_url = args.url
+    if args.uvicorn:
+        base_url = f"http://127.0.0.1:{UVICORN_PORT}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(UVICORN_PORT), "--log-level", "warning"],
+            env=os.environ.copy(), stdout=subprocess.DEVNULL,
+        )
+    try:
+        report = asyncio.run(run(args, base_url))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print_report(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Базовая линия сохранена: {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.threshold)
+        if found:
+            print(f"❌ Регрессия больше {args.threshold:.0%}:")
+            for line in found:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ Без регрессий относительно {args.baseline} (порог {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
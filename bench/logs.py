@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Логирование на пути запроса: синхронный StreamHandler в медленный приёмник
+(как было) против очереди с фоновым писателем (app.logs). Медленный сборщик
+логов имитируется задержкой на каждую запись в поток.
+
+Запуск: python -m bench.logs [--records 20000] [--write-delay 0.0005]
+"""
+
+import argparse
+import logging
+import queue
+import time
+
+from app import logs
+
+
+class SlowStream:
+    """Поток, каждая запись в который занимает write_delay секунд"""
+
+    def __init__(self, write_delay: float):
+        self.write_delay = write_delay
+        self.lines = 0
+
+    def write(self, text: str) -> None:
+        time.sleep(self.write_delay)
+        self.lines += text.count("\n")
+
+    def flush(self) -> None:
+        pass
+
+
+def log_calls(logger: logging.Logger, records: int) -> float:
+    started = time.perf_counter()
+    for i in range(records):
+        logger.info("Updated student", extra={"student_id": f"id-{i}"})
+    return (time.perf_counter() - started) / records * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--write-delay", type=float, default=0.0005, help="задержка одной записи в поток, с")
+    parser.add_argument("--queue-size", type=int, default=logs.DEFAULT_QUEUE_SIZE)
+    args = parser.parse_args()
+    # The same record-creation shortcuts logs.setup() applies
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+
+    print(f"📝 Логирование: {args.records} записей, запись в поток {args.write_delay * 1000:.1f} мс")
+    print("=" * 40)
+
+    stream = SlowStream(args.write_delay)
+    logger = logging.getLogger("bench.sync")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    sync_handler = logging.StreamHandler(stream)
+    sync_handler.setFormatter(logs.JsonFormatter())
+    logger.addHandler(sync_handler)
+    sync_us = log_calls(logger, args.records)
+
+    stream = SlowStream(args.write_delay)
+    logger = logging.getLogger("bench.queued")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logs.QueueHandler(queue.SimpleQueue(), args.queue_size)
+    logger.addHandler(handler)
+    writer = logs.LogWriter(handler.records, stream, logs.JsonFormatter())
+    queued_us = log_calls(logger, args.records)
+    writer.close()
+
+    print(f"{'Синхронно:':14}{sync_us:10.1f} мкс на вызов")
+    print(f"{'Очередь:':14}{queued_us:10.1f} мкс на вызов")
+    print(f"Записано {stream.lines}, отброшено при переполнении {handler.dropped}")
+
+
+if __name__ == "__main__":
+    main()
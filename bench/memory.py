@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Замер памяти на одну запись School/Student: прежняя раскладка (__dict__,
+ISO-строки) против текущей (__slots__, целочисленные метки времени, интернирование).
+
+Запуск: python -m bench.memory [--count 100000]
+"""
+
+import argparse
+import gc
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from app.models import School, Student
+
+GRADES = ["1А", "2Б", "3В", "4А", "5Б", "6В", "7А", "8Б", "9В", "10А", "11Б"]
+
+
+class LegacySchool:
+    """Раскладка School до перехода на __slots__"""
+
+    def __init__(self, name, address, phone):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.address = address
+        self.phone = phone
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = datetime.now().isoformat()
+
+
+class LegacyStudent:
+    """Раскладка Student до перехода на __slots__"""
+
+    def __init__(self, first_name, last_name, age, school_id, grade):
+        self.id = str(uuid.uuid4())
+        self.first_name = first_name
+        self.last_name = last_name
+        self.age = age
+        self.school_id = school_id
+        self.grade = grade
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = datetime.now().isoformat()
+
+
+def bytes_per_record(factory, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    records = {}
+    for i in range(count):
+        record = factory(i)
+        records[record.id] = record
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size / count
+
+
+def school_factory(cls):
+    return lambda i: cls(f"Школа №{i}", f"ул. Ленина, {i}", "+7-495-123-4567")
+
+
+def student_factory(cls, schools: int = 100):
+    # school_id arrives as a fresh string with every request, as it does from the JSON body
+    school_ids = [str(uuid.UUID(int=n)) for n in range(schools)]
+    return lambda i: cls("Иван", f"Иванов{i}", 5 + i % 20, "".join(school_ids[i % schools]), "".join(GRADES[i % len(GRADES)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"📏 Память на запись ({args.count} записей)")
+    print("=" * 40)
+    for title, legacy, current in (
+        ("School", school_factory(LegacySchool), school_factory(School)),
+        ("Student", student_factory(LegacyStudent), student_factory(Student)),
+    ):
+        before = bytes_per_record(legacy, args.count)
+        after = bytes_per_record(current, args.count)
+        print(f"{title:8} до: {before:7.1f} Б  после: {after:7.1f} Б  экономия: {1 - after / before:.0%}")
+
+
+if __name__ == "__main__":
+    main()
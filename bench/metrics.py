@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Накладные расходы метрик на запрос: MetricsMiddleware вокруг пустого
+ASGI-приложения и таймер вызова репозитория против прямого вызова.
+
+Запуск: python -m bench.metrics [--requests 200000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from app import metrics
+from app.models import SchoolRepository
+from app.repository import AsyncRepository
+
+
+def endpoint():
+    pass
+
+
+class Routes:
+    routes = []
+
+
+SCOPE = {"type": "http", "method": "GET", "path": "/schools/1", "app": Routes, "endpoint": endpoint}
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def bare_app(scope, receive, send):
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request"}
+
+
+async def send(message):
+    pass
+
+
+async def per_call_us(count: int, call) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        await call()
+    return (time.perf_counter() - started) / count * 1_000_000
+
+
+async def run(count: int) -> None:
+    wrapped = metrics.MetricsMiddleware(bare_app)
+    bare = await per_call_us(count, lambda: bare_app(SCOPE, receive, send))
+    timed = await per_call_us(count, lambda: wrapped(SCOPE, receive, send))
+    print(f"{'Middleware:':22}{timed - bare:6.2f} мкс на запрос")
+
+    school = SchoolRepository.create_school("Школа №1", "ул. Ленина, 1", "+7-495-123-4567")
+    repository = AsyncRepository(SchoolRepository)
+
+    async def direct():
+        return SchoolRepository.get_school(school.id)
+
+    direct_us = await per_call_us(count, direct)
+    timed_us = await per_call_us(count, lambda: repository.get_school(school.id))
+    print(f"{'Таймер репозитория:':22}{timed_us - direct_us:6.2f} мкс на вызов")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"⏱️  Накладные расходы метрик ({args.requests} вызовов)")
+    print("=" * 40)
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Репликация: ведущий и --followers ведомых uvicorn на localhost.
+
+Задержка репликации: запись на ведущий, событие /changes на каждом ведомом;
+задержка — от отправки записи на ведущий до получения события (p50/p99).
+Пропускная способность: --students студентов пакетами на ведущий; замеряется
+скорость записи на ведущем и время, за которое ведомые применили весь журнал
+(по X-Replication-Token в /replication/status).
+
+Запуск: python -m bench.replication [--followers 2] [--writes 500] [--students 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+LEADER_PORT = 8770
+LEADER_URL = f"http://127.0.0.1:{LEADER_PORT}"
+BATCH = 10000
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def spawn(port: int, **env) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ, STORAGE_BACKEND="memory", LOG_LEVEL="WARNING", **env),
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(client, url: str) -> None:
+    for _ in range(300):
+        try:
+            if (await client.get(f"{url}/replication/status")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+def seq_of(token: str) -> int:
+    return int(token.rpartition(".")[2])
+
+
+async def measure_lag(client, follower_urls, writes: int, interval: float) -> None:
+    school_id = (await client.post(f"{LEADER_URL}/schools", json={
+        "name": "Школа №1", "address": "ул. Ленина, 1", "phone": "+7-495-123-4567"})).json()["id"]
+    received = {url: [] for url in follower_urls}
+    connected = 0
+    all_connected = asyncio.Event()
+
+    async def subscriber(url: str) -> None:
+        nonlocal connected
+        async with client.stream("GET", f"{url}/changes", timeout=None) as response:
+            connected += 1
+            if connected == len(follower_urls):
+                all_connected.set()
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    received[url].append(time.perf_counter())
+                    if len(received[url]) == writes:
+                        return
+
+    tasks = [asyncio.create_task(subscriber(url)) for url in follower_urls]
+    await asyncio.wait_for(all_connected.wait(), 30)
+    await asyncio.sleep(0.5)
+    sent = []
+    for i in range(writes):
+        sent.append(time.perf_counter())
+        await client.put(f"{LEADER_URL}/schools/{school_id}", json={"phone": f"+7-495-000-{i:04d}"})
+        await asyncio.sleep(interval)
+    await asyncio.wait_for(asyncio.gather(*tasks), 60)
+
+    lags = [(at - sent[i]) * 1000 for times in received.values() for i, at in enumerate(times)]
+    print(f"Задержка репликации ({writes} записей): p50 {percentile(lags, 0.5):.1f} мс, "
+          f"p99 {percentile(lags, 0.99):.1f} мс")
+
+
+async def measure_throughput(client, follower_urls, students: int) -> None:
+    school_id = (await client.post(f"{LEADER_URL}/schools", json={
+        "name": "Школа №2", "address": "ул. Мира, 2", "phone": "+7-495-765-4321"})).json()["id"]
+    started = time.perf_counter()
+    token = ""
+    for start in range(0, students, BATCH):
+        response = await client.post(f"{LEADER_URL}/students/bulk", json={"items": [
+            {"first_name": "Иван", "last_name": f"Иванов{i}", "age": 5 + i % 20, "school_id": school_id,
+             "grade": "5Б"} for i in range(start, min(start + BATCH, students))
+        ]})
+        token = response.headers["x-replication-token"]
+    written = time.perf_counter() - started
+    target = seq_of(token)
+    for url in follower_urls:
+        while seq_of((await client.get(f"{url}/replication/status")).json()["token"]) < target:
+            await asyncio.sleep(0.01)
+    applied = time.perf_counter() - started
+    print(f"Запись на ведущем: {students / written:,.0f} записей/с")
+    print(f"Применено ведомыми: {students / applied:,.0f} записей/с "
+          f"(отставание после последней записи {(applied - written) * 1000:.0f} мс)")
+
+
+async def run(args, follower_urls) -> None:
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        for url in [LEADER_URL] + follower_urls:
+            await wait_until_ready(client, url)
+        await measure_lag(client, follower_urls, args.writes, args.interval)
+        await measure_throughput(client, follower_urls, args.students)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--followers", type=int, default=2)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.01, help="пауза между записями, с")
+    parser.add_argument("--students", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"🔁 Репликация: ведущий и {args.followers} ведомых на localhost")
+    print("=" * 40)
+    follower_urls = [f"http://127.0.0.1:{LEADER_PORT + 1 + i}" for i in range(args.followers)]
+    servers = [spawn(LEADER_PORT, REPLICATION_ROLE="leader")] + [
+        spawn(LEADER_PORT + 1 + i, REPLICATION_ROLE="follower", REPLICATION_LEADER=LEADER_URL)
+        for i in range(args.followers)
+    ]
+    try:
+        asyncio.run(run(args, follower_urls))
+    finally:
+        for server in servers:
+            server.kill()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
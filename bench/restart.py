@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Замер тёплого рестарта: снимок + хвост журнала для 10k школ / 1M студентов.
+
+Данные генерируются в памяти, записываются снимок и хвост журнала, затем
+восстановление запускается в отдельном процессе (как при рестарте пода).
+
+Запуск: python -m bench.restart [--schools 10000] [--students 1000000] [--tail 10000]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from app import models, persistence
+from app.models import StudentRepository
+from bench import fixtures
+
+READINESS_DELAY = 5.0
+
+RECOVER = """
+import sys, time
+from app import models, persistence
+started = time.perf_counter()
+persistence.WriteAheadLog(sys.argv[1]).recover()
+print(time.perf_counter() - started, len(models.schools_db), len(models.students_db))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--schools", type=int, default=10_000)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=10_000, help="записей журнала после снимка")
+    args = parser.parse_args()
+
+    print(f"♻️  Тёплый рестарт: {args.schools} школ, {args.students} студентов, хвост {args.tail}")
+    print("=" * 40)
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures.populate(args.schools, args.students)
+        log = persistence.WriteAheadLog(directory, fsync=persistence.FSYNC_OFF, snapshot_every=sys.maxsize)
+        started = time.perf_counter()
+        path = log.write_snapshot(0)
+        print(f"Снимок: {os.path.getsize(path) / 2**20:.1f} МиБ за {time.perf_counter() - started:.2f} с")
+
+        log.start()
+        student_ids = list(models.students_db)
+        for _ in range(args.tail):
+            StudentRepository.update_student(random.choice(student_ids), age=random.randint(5, 25))
+        log.close()
+
+        result = subprocess.run([sys.executable, "-c", RECOVER, directory],
+                                capture_output=True, text=True, check=True)
+        elapsed, schools, students = result.stdout.split()
+        elapsed = float(elapsed)
+        mark = "✅" if elapsed < READINESS_DELAY else "❌"
+        print(f"{mark} Восстановлено {schools} школ и {students} студентов за {elapsed:.2f} с "
+              f"(readinessProbe initialDelaySeconds: {READINESS_DELAY:.0f} с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Индекс студентов по школе (students_by_school) против полного прохода.
+
+Проверка: после каждого шага — создание по одному и пакетом, перевод в другую
+школу через update_student и import_students, изменения без перевода, удаление
+по одному и пакетом, каскадное удаление школ — для каждой школы сверяются
+get_students_by_school и сам индекс с проходом по всем студентам. Индекс не
+должен держать ни удалённых студентов, ни переведённых в другую школу, ни
+корзин удалённых школ.
+
+Скорость: get_students_by_school против прохода по всем студентам.
+
+Запуск: python -m bench.school_index [--students 100000] [--schools 1000] [--seed 1] [--repeat 5]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from app import models
+from app.models import SchoolRepository, StudentRepository
+from bench import fixtures
+
+
+def scan(school_id: str) -> list:
+    # What the endpoint did before the index: every student, checked one by one
+    return sorted(student.id for student in models.students_db.values() if student.school_id == school_id)
+
+
+def check(step: str, school_ids: list) -> list:
+    problems = []
+    expected = {}
+    for student in models.students_db.values():
+        expected.setdefault(student.school_id, set()).add(student.id)
+    indexed = {school_id: set(bucket) for school_id, bucket in models.students_by_school.items() if bucket}
+    if indexed != expected:
+        stale = sum(len(bucket - expected.get(school_id, set())) for school_id, bucket in indexed.items())
+        missing = sum(len(bucket - indexed.get(school_id, set())) for school_id, bucket in expected.items())
+        problems.append(f"{step}: индекс расходится с проходом ({stale} лишних, {missing} пропущенных)")
+    for school_id in school_ids:
+        listed = sorted(student.id for student in StudentRepository.get_students_by_school(school_id))
+        if listed != sorted(expected.get(school_id, ())):
+            problems.append(f"{step}: get_students_by_school({school_id}) расходится с проходом")
+            break
+    orphans = [school_id for school_id in expected if school_id not in models.schools_db]
+    if orphans:
+        problems.append(f"{step}: студенты {len(orphans)} несуществующих школ")
+    status = "❌" if problems else "✅"
+    print(f"  {status} {step}: {len(models.students_db):,} студентов, {len(indexed):,} школ в индексе")
+    return problems
+
+
+def student(rnd: random.Random, school_ids: list, i: int) -> dict:
+    return {"first_name": "Иван", "last_name": f"Иванов{i}", "age": rnd.randint(6, 18),
+            "school_id": rnd.choice(school_ids), "grade": f"{rnd.randint(1, 11)}А"}
+
+
+def run_checks(students: int, schools: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    school_ids = fixtures.populate(schools, students, lambda i, school_ids: student(rnd, school_ids, i))
+    problems = []
+    for i in range(students, students + 1000):
+        StudentRepository.create_student(**student(rnd, school_ids, i))
+    problems += check("создание", school_ids)
+
+    student_ids = list(models.students_db)
+    for student_id in rnd.sample(student_ids, len(student_ids) // 10):
+        StudentRepository.update_student(student_id, school_id=rnd.choice(school_ids))
+    for student_id in rnd.sample(student_ids, len(student_ids) // 10):
+        StudentRepository.update_student(student_id, age=rnd.randint(6, 18), grade="5Б")
+    problems += check("перевод через update_student и изменения без перевода", school_ids)
+
+    moved = []
+    for student_id in rnd.sample(student_ids, len(student_ids) // 10):
+        copy = models.students_db[student_id].copy()
+        copy.school_id = rnd.choice(school_ids)
+        moved.append(copy)
+    StudentRepository.import_students(moved)
+    problems += check("перевод через import_students", school_ids)
+
+    removed = rnd.sample(student_ids, len(student_ids) // 5)
+    for student_id in removed[:1000]:
+        StudentRepository.delete_student(student_id)
+    StudentRepository.delete_students(removed[1000:])
+    problems += check("удаление студентов", school_ids)
+
+    deleted = rnd.sample(school_ids, len(school_ids) // 10)
+    SchoolRepository.delete_school(deleted[0])
+    SchoolRepository.delete_schools(deleted[1:])
+    remaining = [school_id for school_id in school_ids if school_id not in set(deleted)]
+    problems += check("каскадное удаление школ", remaining)
+    if any(school_id in models.students_by_school for school_id in deleted):
+        problems.append("каскадное удаление школ: в индексе остались корзины удалённых школ")
+    return problems
+
+
+def median_ms(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"🏫 Индекс по школам: {args.students:,} студентов в {args.schools:,} школах")
+    print("=" * 40)
+    problems = run_checks(args.students, args.schools, args.seed)
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    print()
+
+    school_id = max(models.students_by_school, key=lambda school_id: len(models.students_by_school[school_id]))
+    found = len(StudentRepository.get_students_by_school(school_id))
+    indexed = median_ms(args.repeat, lambda: StudentRepository.get_students_by_school(school_id))
+    linear = median_ms(args.repeat, lambda: scan(school_id))
+    print(f"Школа с {found:,} студентами из {len(models.students_db):,}: индекс {indexed:.2f} мс, "
+          f"проход {linear:.1f} мс ({linear / indexed:.0f}x)")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
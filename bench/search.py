@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Поиск ?q=: инвертированный индекс (слова + триграммы) против линейного прохода
+по всем студентам на 1M записей.
+
+Индекс наполняется теми же слушателями репозитория, что и в приложении,
+по мере создания студентов.
+
+Запуск: python -m bench.search [--students 1000000] [--repeat 5]
+"""
+
+import argparse
+import statistics
+import time
+
+from app import models, search
+from bench import fixtures
+
+FIRST_NAMES = ["Александр", "Мария", "Иван", "Анна", "Дмитрий", "Елена", "Сергей", "Ольга", "Пётр", "Наталья",
+               "Андрей", "Татьяна", "Алексей", "Ирина", "Михаил", "Светлана", "Николай", "Юлия", "John", "Emma"]
+ROOTS = ["Иван", "Петр", "Сидор", "Смирн", "Кузнец", "Попов", "Васил", "Соколов", "Михайл", "Новик",
+         "Фёдор", "Морозов", "Волков", "Алексе", "Лебед", "Семён", "Егор", "Павл", "Козл", "Степан"]
+SUFFIXES = ["ов", "ова", "ин", "ина", "енко", "ский", "ская", "ович", "ук", "ец"]
+QUERIES = ["иванов", "петр", "ова", "ан", "ёдоров", "смирнова анна", "нет-такого"]
+
+
+def last_name(i: int) -> str:
+    # ~20k distinct surnames: a root, a suffix and a numeric tail for variety
+    return f"{ROOTS[i % len(ROOTS)]}{SUFFIXES[i // len(ROOTS) % len(SUFFIXES)]}{i % 97 or ''}"
+
+
+def student(i: int, school_ids: list) -> dict:
+    return dict(fixtures.student_item(i, school_ids), first_name=FIRST_NAMES[i % len(FIRST_NAMES)],
+                last_name=last_name(i))
+
+
+def scan(query: str):
+    # What a client does today: every student, every name, substring match
+    fragments = set(search.words(query))
+    matched = []
+    for student in models.students_db.values():
+        student_words = search.words(student.first_name) + search.words(student.last_name)
+        if all(any(fragment in word for word in student_words) for fragment in fragments):
+            matched.append(student.id)
+    return sorted(matched)
+
+
+def median_ms(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"🔎 Поиск: {args.students} студентов (медиана из {args.repeat}, проход — из 1)")
+    print("=" * 40)
+    started = time.perf_counter()
+    fixtures.populate(1000, args.students, student)
+    print(f"Наполнение с индексом: {time.perf_counter() - started:.1f} с")
+
+    for query in QUERIES:
+        found = search.students.search(query)
+        started = time.perf_counter()
+        assert scan(query) == found
+        linear = (time.perf_counter() - started) * 1000
+        indexed = median_ms(args.repeat, lambda: search.students.search(query))
+        print(f"{query!r:18} {len(found):7} найдено  индекс {indexed:8.2f} мс  "
+              f"проход {linear:8.0f} мс  (x{linear / indexed:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Сериализация GET /students: прежний путь (to_dict + валидация response_model +
+JSON-кодировщик) против склейки закэшированных JSON-байтов каждой записи.
+
+Запуск: python -m bench.serialization [--students 100000] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app import models
+from app.main import StudentResponse, app, list_response
+from app.models import StudentRepository
+from bench import fixtures
+
+
+def legacy_body(adapter: TypeAdapter) -> bytes:
+    # What the endpoint did before: to_dict(), response_model validation, generic encoding
+    payload = [student.to_dict() for student in StudentRepository.get_all_students()]
+    validated = adapter.validate_python(payload)
+    # exclude_unset: the optional embedded school is not part of the plain representation
+    return json.dumps(adapter.dump_python(validated, mode="json", exclude_unset=True), ensure_ascii=False,
+                      separators=(",", ":")).encode()
+
+
+def cached_body() -> bytes:
+    return list_response([student.to_json() for student in StudentRepository.get_all_students()]).body
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+async def end_to_end(repeat: int) -> float:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get("/students")
+            response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def cold_cache() -> None:
+    for student in models.students_db.values():
+        student.touch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fixtures.populate(100, args.students)
+    adapter = TypeAdapter(List[StudentResponse])
+    assert legacy_body(adapter) == cached_body()
+
+    print(f"📦 Сериализация GET /students: {args.students} студентов (лучшее из {args.repeat})")
+    print("=" * 40)
+    legacy = best_of(args.repeat, lambda: legacy_body(adapter))
+    cold = best_of(args.repeat, lambda: (cold_cache(), cached_body()))
+    warm = best_of(args.repeat, cached_body)
+    print(f"{'Прежний путь:':22}{legacy * 1000:8.1f} мс")
+    print(f"{'Кэш, холодный:':22}{cold * 1000:8.1f} мс")
+    print(f"{'Кэш, горячий:':22}{warm * 1000:8.1f} мс  (x{legacy / warm:.0f})")
+    print(f"{'GET /students (ASGI):':22}{asyncio.run(end_to_end(args.repeat)) * 1000:8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Статистика: GET /stats и GET /schools/{id}/stats из счётчиков против группировки
+всех студентов (как делают отчёты сейчас). После случайных изменений счётчики
+сверяются с пересчётом с нуля (stats.verify); при расхождениях код выхода 1.
+
+Запуск: python -m bench.stats [--students 1000000] [--mutations 100000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+
+from app import models, stats
+from app.models import StudentRepository
+from bench import fixtures
+
+
+def mutate(school_ids, count: int) -> None:
+    student_ids = list(models.students_db)
+    for _ in range(count):
+        roll = random.random()
+        if roll < 0.6:
+            StudentRepository.update_student(random.choice(student_ids), age=random.randint(5, 25),
+                                             school_id=random.choice(school_ids), grade=random.choice(fixtures.GRADES))
+        elif roll < 0.8:
+            StudentRepository.delete_student(student_ids.pop(random.randrange(len(student_ids))))
+        else:
+            student_ids.append(StudentRepository.create_student(
+                "Мария", "Петрова", 15, random.choice(school_ids), random.choice(fixtures.GRADES)).id)
+
+
+def group_on_client(school_id: str):
+    students = [student for student in models.students_db.values() if student.school_id == school_id]
+    return len(students), Counter(student.grade for student in students), Counter(student.age for student in students)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--mutations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"📊 Статистика: {args.schools} школ, {args.students} студентов, {args.mutations} изменений")
+    print("=" * 40)
+    school_ids = fixtures.populate(args.schools, args.students)
+    mutate(school_ids, args.mutations)
+
+    mismatches = stats.verify(models.schools_db.values(), models.students_db.values())
+    print(f"{'✅' if not mismatches else '❌'} Сверка с пересчётом: расхождений {len(mismatches)}")
+
+    started = time.perf_counter()
+    grouped = group_on_client(school_ids[0])
+    scan_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    counted = stats.for_school(school_ids[0])
+    read_us = (time.perf_counter() - started) * 1_000_000
+    assert counted["students"] == grouped[0]
+    print(f"{'Группировка:':14}{scan_ms:10.1f} мс")
+    print(f"{'Счётчики:':14}{read_us:10.1f} мкс")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
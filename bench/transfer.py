@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Выгрузка и загрузка всего набора данных: GET /export и POST /import против
+прежнего пути ночных заданий (постраничный обход JSON-коллекций и создание
+записей по одной).
+
+- выгрузка NDJSON и CSV в gzip: строк/с, размер файла, пик памяти на время
+  выгрузки (tracemalloc, отдельным прогоном);
+- загрузка того же файла в пустое хранилище (с сохранением ID и дат) и поверх
+  существующих записей (замена): строк/с, и отдельно строк/с одного разбора с
+  проверкой, без сохранения в хранилище и его индексы;
+- прежний путь: страницы по 1000 записей и create_student по одной.
+
+Тела запросов и ответов проходят через те же export_stream/import_stream, что
+и эндпоинты, без HTTP.
+
+Запуск: python -m bench.transfer [--students 1000000] [--backend memory]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+UPLOAD_CHUNK = 64 * 1024
+ONE_BY_ONE = 10000
+
+
+async def export(fmt: str, trace: bool = False):
+    """(file, rows, seconds, peak traced bytes)"""
+    from app import repository, transfer
+
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    chunks = []
+    async for chunk in transfer.export_stream(repository.export_batches(transfer.BATCH_ROWS), fmt,
+                                              repository.students_repo.executor):
+        size += len(chunk)
+        if not trace:
+            chunks.append(chunk)
+    seconds = time.perf_counter() - started
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return b"".join(chunks), size, seconds, peak
+
+
+async def upload(data: bytes):
+    for start in range(0, len(data), UPLOAD_CHUNK):
+        yield data[start:start + UPLOAD_CHUNK]
+
+
+def parse_only(data: bytes, fmt: str) -> float:
+    """Rows/s of parsing and validating the file into records, without storing them"""
+    from app import transfer
+
+    importer = transfer.Importer(fmt)
+    rows = 0
+    # Paused as the import pauses it for each parsed piece
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(data), UPLOAD_CHUNK):
+            for records in importer.feed(data[start:start + UPLOAD_CHUNK]):
+                rows += len(records)
+        rows += len(importer.finish())
+        seconds = time.perf_counter() - started
+    finally:
+        gc.enable()
+    return rows / seconds
+
+
+async def wipe(schools_repo) -> None:
+    # Deleting the schools cascades to every student
+    await schools_repo.delete_schools([school.id for school in await schools_repo.get_all_schools()])
+
+
+async def old_way(schools_repo, students_repo, rows: int):
+    """Rows/s of paging through /students, and of creating students one at a time"""
+    started = time.perf_counter()
+    after, scraped = None, 0
+    while True:
+        page = await students_repo.get_students_page(after=after, limit=1000)
+        if not page:
+            break
+        # What the list endpoint sends for the page
+        body = b"[" + b",".join(student.to_json() for student in page) + b"]"
+        scraped += len(page) if body else 0
+        after = page[-1].id
+    scrape_rate = scraped / (time.perf_counter() - started)
+    school_id = (await schools_repo.get_schools_page(limit=1))[0].id
+    started = time.perf_counter()
+    for i in range(rows):
+        await students_repo.create_student("Иван", f"Петров{i}", 10, school_id, "5А")
+    return scrape_rate, rows / (time.perf_counter() - started)
+
+
+async def run(args) -> None:
+    from app import main, transfer
+    from app.repository import schools_repo, students_repo
+    from bench import fixtures
+
+    await fixtures.populate_repositories(schools_repo, students_repo, 1000, args.students)
+    main.rebuild_indexes(await schools_repo.get_all_schools(), await students_repo.get_all_students())
+    total = args.students + 1000
+    print(f"{'Выгрузка':14}{'строк/с':>10}{'с':>8}{'файл, МБ':>10}{'пик памяти, МБ':>16}")
+    files = {}
+    for fmt in transfer.FORMATS:
+        files[fmt], size, seconds, _ = await export(fmt)
+        _, _, _, peak = await export(fmt, trace=True)
+        print(f"{fmt:14}{total / seconds:10,.0f}{seconds:8.2f}{size / 1e6:10.1f}{peak / 1e6:16.1f}")
+    print()
+    print(f"{'Загрузка':22}{'строк/с':>10}{'с':>8}{'ошибок':>8}{'разбор, строк/с':>17}")
+    for title, fmt, replace in (("NDJSON в пустое", transfer.NDJSON, False), ("CSV в пустое", transfer.CSV, False),
+                                ("NDJSON поверх", transfer.NDJSON, True)):
+        if not replace:
+            await wipe(schools_repo)
+        started = time.perf_counter()
+        report = await transfer.import_stream(upload(files[fmt]), fmt, students_repo.executor)
+        seconds = time.perf_counter() - started
+        assert report["schools"] + report["students"] == total, report
+        parsed = parse_only(files[fmt], fmt)
+        print(f"{title:22}{total / seconds:10,.0f}{seconds:8.2f}{report['failed']:8}{parsed:17,.0f}")
+    print()
+    scrape_rate, create_rate = await old_way(schools_repo, students_repo, ONE_BY_ONE)
+    print(f"Прежний путь: обход страницами {scrape_rate:,.0f} строк/с, create_student по одной {create_rate:,.0f} строк/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--sqlite-path", default="bench-transfer.db")
+    args = parser.parse_args()
+
+    # Read when the app is imported
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["SQLITE_PATH"] = args.sqlite_path
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.backend == "sqlite" and os.path.exists(args.sqlite_path):
+        sys.exit(f"{args.sqlite_path} exists: the benchmark needs an empty database")
+
+    print(f"📦 Выгрузка и загрузка: {args.students:,} студентов, бэкенд {args.backend}")
+    print("=" * 40)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if args.backend == "sqlite":
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(args.sqlite_path + suffix):
+                    os.remove(args.sqlite_path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Масштабирование по воркерам: python -m app.serve (uvloop + httptools, общий
+файл SQLite) с 1, 2, ... N процессами. Для каждого числа воркеров создаётся
+свой набор данных, затем --clients процессов-клиентов гоняют смесь запросов
+(bench.load) в течение --duration секунд. Выводится пропускная способность и
+p50/p99 по числу воркеров.
+
+Клиенты работают на той же машине и делят с сервером процессор, поэтому
+ускорение ограничено числом ядер за вычетом занятых клиентами.
+
+Запуск: python -m bench.workers [--max-workers 4] [--clients 2] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import load
+
+PORT = 8767
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+async def seed(args) -> load.Dataset:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60) as client:
+        for _ in range(200):
+            try:
+                await client.get("/health")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        dataset = load.Dataset(random.Random(args.seed))
+        await load.load_dataset(client, dataset, args.schools, args.students)
+        return dataset
+
+
+async def client_run(school_ids, student_ids, mix, duration: float, concurrency: int, seed: int):
+    import httpx
+
+    dataset = load.Dataset(random.Random(seed))
+    dataset.school_ids, dataset.student_ids = school_ids, student_ids
+    next_request = load.generated(dataset, load.parse_mix(mix))
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            _, method, path, body = next_request()
+            path, body = dataset.fill(path), dataset.fill_body(body)
+            started = time.perf_counter()
+            try:
+                failed = (await client.request(method, path, json=body)).status_code >= 500
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(arguments):
+    return asyncio.run(client_run(*arguments))
+
+
+def measure(args, workers: int, directory: str) -> dict:
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=os.path.join(directory, f"workers{workers}.db"),
+               WEB_CONCURRENCY=str(workers), HOST="127.0.0.1", PORT=str(PORT), LOG_LEVEL="WARNING")
+    server = subprocess.Popen([sys.executable, "-m", "app.serve"], env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        dataset = asyncio.run(seed(args))
+        with multiprocessing.Pool(args.clients) as pool:
+            started = time.perf_counter()
+            results = pool.map(client_process, [
+                (dataset.school_ids, dataset.student_ids, args.mix, args.duration, args.concurrency, args.seed + i)
+                for i in range(args.clients)
+            ])
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = [sample for samples, _ in results for sample in samples]
+    return load.summarize(latencies, sum(errors for _, errors in results), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--clients", type=int, default=2, help="процессов-клиентов")
+    parser.add_argument("--concurrency", type=int, default=32, help="параллельных запросов на клиента")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность замера, с")
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=100_000)
+    parser.add_argument("--mix", default="get_student=50,get_school=15,school_students=10,school_stats=5,"
+                                         "update_student=10,create_student=10",
+                        help="веса операций, как в bench.load")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"⚙️  Масштабирование: 1..{args.max_workers} воркеров, {args.clients} клиента по "
+          f"{args.concurrency} запросов, {os.cpu_count()} ядер")
+    print("=" * 40)
+    print(f"{'Воркеров':10}{'зап/с':>10}{'ускорение':>11}{'p50 мс':>9}{'p99 мс':>9}{'ошибок':>8}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in range(1, args.max_workers + 1):
+            report = measure(args, workers, directory)
+            baseline = baseline or report["rps"]
+            print(f"{workers:<10}{report['rps']:10.0f}{report['rps'] / baseline:10.2f}x"
+                  f"{report['p50_ms']:9.2f}{report['p99_ms']:9.2f}{report['errors']:8}")
+
+
+if __name__ == "__main__":
+    main()